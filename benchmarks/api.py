@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""Benchmark of the sub-commands using the API, against the local fake Portainer of fake_portainer.py.
+
+Runs get --all, get by name, deploy, deploy-batch, remove and export for every stack count, and prints their throughput and
+p50/p99 latency. The results can be saved and compared with a previous run, failing on regressions.
+
+    $ python benchmarks/api.py --stacks 10 1000 100000 --latency 2 --save baseline.json
+    $ python benchmarks/api.py --stacks 10 1000 100000 --latency 2 --compare baseline.json --tolerance 0.2
+"""
+from contextlib import redirect_stdout
+from json import dump, load
+from os import devnull, makedirs, path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import argparse
+import logging
+import sys
+
+ROOT = path.abspath(path.join(path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from fake_portainer import FakePortainerState, serve, url_of  # noqa: E402
+from portainer_deployer.app import PortainerDeployer  # noqa: E402
+
+COMPOSE = 'version: "3"\nservices:\n  web:\n    image: nginx:{tag}\n'
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Get a percentile by the nearest rank method.
+
+    Args:
+        values (list): Measured values.
+        fraction (float): Percentile between 0 and 1.
+
+    Returns:
+        float: Value at the percentile.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+class Scenario:
+    """Sub-command run several times against the fake server, recording the latency of every run.
+    """
+    def __init__(self, name: str, deployer: PortainerDeployer, operations: int = 1) -> None:
+        """Initialize the Scenario class.
+
+        Args:
+            name (str): Name of the scenario in the results.
+            deployer (PortainerDeployer): CLI configured to use the fake server.
+            operations (int, optional): Stacks handled by every run, for the throughput. Defaults to 1.
+        """
+        self.name = name
+        self.deployer = deployer
+        self.operations = operations
+        self.latencies = []
+        self.failures = 0
+
+    def run(self, *argv: str) -> None:
+        """Run the sub-command once, with its output discarded.
+
+        Args:
+            argv (str): Arguments of the command line.
+        """
+        args = self.deployer.parser.parse_args(list(argv))
+        with open(devnull, 'w') as sink, redirect_stdout(sink):
+            start = perf_counter()
+            response = args.func(args)
+            self.latencies.append(perf_counter() - start)
+
+        if not response['status']:
+            self.failures += 1
+
+    def result(self) -> dict:
+        """Summarize the runs.
+
+        Returns:
+            dict: Runs, failures, throughput in stacks per second and p50/p99 latency in ms.
+        """
+        total = sum(self.latencies)
+        return {
+            'runs': len(self.latencies),
+            'failures': self.failures,
+            'throughput': self.operations * len(self.latencies) / total if total else 0.0,
+            'p50_ms': percentile(self.latencies, 0.5) * 1000,
+            'p99_ms': percentile(self.latencies, 0.99) * 1000
+        }
+
+
+def deployer_for(url: str, cache_dir: str) -> PortainerDeployer:
+    """Build a CLI configured to use a server, with its caches in a directory of its own.
+
+    Args:
+        url (str): Url of the server.
+        cache_dir (str): Directory of the config file and the caches.
+
+    Returns:
+        PortainerDeployer: Configured CLI.
+    """
+    config_path = path.join(cache_dir, 'app.conf')
+    with open(config_path, 'w') as f:
+        f.write(f'[PORTAINER]\nurl={url}\ntoken=benchmark\nverify_ssl=no\ncache_dir={cache_dir}\n')
+
+    deployer = PortainerDeployer()
+    deployer.PATH_TO_CONFIG = config_path
+    return deployer
+
+
+def benchmark(stacks: int, args: argparse.Namespace) -> dict:
+    """Run every scenario against a fake server with a number of stacks.
+
+    Args:
+        stacks (int): Number of stacks of the fake server.
+        args (argparse.Namespace): Parsed arguments of the benchmark.
+
+    Returns:
+        dict: Results of the scenarios by name.
+    """
+    state = FakePortainerState(stacks, args.endpoints, args.latency / 1000, args.jitter / 1000, args.error_rate, args.error_status)
+    server = serve(state, certfile=args.certfile, keyfile=args.keyfile)
+    url = url_of(server)
+
+    scenarios = []
+    with TemporaryDirectory() as tmp:
+        deployer = deployer_for(url, tmp)
+
+        # Listings are fewer for the large instances, so every count runs in a similar time
+        listing = Scenario('get --all', deployer)
+        for _ in range(max(3, args.iterations * 100 // max(stacks, 100))):
+            listing.run('get', '--all', '--output', 'json')
+        scenarios.append(listing)
+
+        lookup = Scenario('get --name', deployer)
+        for i in range(args.iterations):
+            stack_id = i * max(1, stacks // args.iterations) % stacks + 1
+            lookup.run('get', '--name', f'stack-{stack_id}', '--endpoint', str(stack_id % args.endpoints + 1), '--output', 'json')
+        scenarios.append(lookup)
+
+        stacks_dir = path.join(tmp, 'stacks')
+        makedirs(stacks_dir)
+        deploy = Scenario('deploy', deployer)
+        for i in range(args.iterations):
+            stack_path = path.join(stacks_dir, f'bench-{i}.yml')
+            with open(stack_path, 'w') as f:
+                f.write(COMPOSE.format(tag=i))
+            deploy.run('deploy', '--path', stack_path, '--name', f'bench-{i}', '--endpoint', '1', '-y')
+        scenarios.append(deploy)
+
+        batch = Scenario('deploy-batch', deployer, operations=args.batch_size)
+        for i in range(max(1, args.iterations // 10)):
+            batch_dir = path.join(tmp, f'batch-{i}')
+            makedirs(batch_dir)
+            for j in range(args.batch_size):
+                with open(path.join(batch_dir, f'batch-{i}-{j}.yml'), 'w') as f:
+                    f.write(COMPOSE.format(tag=j))
+            batch.run('deploy-batch', batch_dir, '--endpoint', '1', '--concurrency', str(args.concurrency))
+        scenarios.append(batch)
+
+        remove = Scenario('remove', deployer)
+        for i in range(args.iterations):
+            remove.run('remove', '--name', f'bench-{i}', '--endpoint', '1', '-y')
+        scenarios.append(remove)
+
+        # Every stack is downloaded by the first export, and none by the next ones
+        mirror_dir = path.join(tmp, 'mirror')
+        export = Scenario('export', deployer, operations=len(state.stacks))
+        export.run('export', '--dir', mirror_dir, '--concurrency', str(args.concurrency))
+        scenarios.append(export)
+
+        incremental = Scenario('export again', deployer, operations=len(state.stacks))
+        for _ in range(3):
+            incremental.run('export', '--dir', mirror_dir, '--concurrency', str(args.concurrency))
+        scenarios.append(incremental)
+
+    server.shutdown()
+    server.server_close()
+    return {scenario.name: scenario.result() for scenario in scenarios}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Compare results with a previous run.
+
+    Args:
+        results (dict): Results of this run, by stack count and scenario.
+        baseline (dict): Results of the previous run.
+        tolerance (float): Relative slowdown of the p50 latency or the throughput accepted.
+
+    Returns:
+        list: Descriptions of the regressions.
+    """
+    regressions = []
+    for stacks, scenarios in results.items():
+        for name, result in scenarios.items():
+            previous = baseline.get(stacks, {}).get(name)
+            if not previous:
+                continue
+            if result['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+                regressions.append(f"{name} with {stacks} stacks: p50 {result['p50_ms']:.1f} ms, was {previous['p50_ms']:.1f} ms")
+            if result['throughput'] < previous['throughput'] * (1 - tolerance):
+                regressions.append(f"{name} with {stacks} stacks: {result['throughput']:.1f} stacks/s, was {previous['throughput']:.1f} stacks/s")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Measure the throughput and latency of the sub-commands against a fake Portainer.')
+    parser.add_argument('--stacks', type=int, nargs='+', default=[10, 1000, 10000], help='Numbers of stacks of the fake server, from 10 to 100000.')
+    parser.add_argument('--endpoints', type=int, default=3, help='Number of endpoints the stacks are spread over.')
+    parser.add_argument('--iterations', type=int, default=50, help='Runs of the lookup, deploy and remove scenarios.')
+    parser.add_argument('--batch-size', type=int, default=20, help='Stacks deployed by every deploy-batch run.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Workers of deploy-batch.')
+    parser.add_argument('--latency', type=float, default=0, help='Milliseconds added by the server to every response.')
+    parser.add_argument('--jitter', type=float, default=0, help='Maximum random milliseconds added to the latency.')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of the requests answered with --error-status.')
+    parser.add_argument('--error-status', type=int, default=500, help='Status of the injected errors.')
+    parser.add_argument('--certfile', default=None, help='Certificate to serve HTTPS with.')
+    parser.add_argument('--keyfile', default=None, help='Key of the certificate.')
+    parser.add_argument('--save', metavar='PATH', default=None, help='Write the results to a JSON file.')
+    parser.add_argument('--compare', metavar='PATH', default=None, help='Fail if the results regressed from a file written with --save.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Relative slowdown accepted by --compare.')
+    args = parser.parse_args()
+
+    # Only the measures are printed
+    logging.getLogger('stdout').setLevel(logging.ERROR)
+
+    results = {}
+    spacing_str = '{0:>8} {1:<14} {2:>6} {3:>9} {4:>13} {5:>10} {6:>10}'
+    print(spacing_str.format('Stacks', 'Scenario', 'Runs', 'Failures', 'Stacks/s', 'p50 (ms)', 'p99 (ms)'))
+    for stacks in args.stacks:
+        results[str(stacks)] = benchmark(stacks, args)
+        for name, result in results[str(stacks)].items():
+            print(spacing_str.format(
+                stacks, name, result['runs'], result['failures'],
+                f"{result['throughput']:.1f}", f"{result['p50_ms']:.1f}", f"{result['p99_ms']:.1f}"
+            ))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, load(f), args.tolerance)
+        for regression in regressions:
+            print(f'FAIL: {regression}')
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
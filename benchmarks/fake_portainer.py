@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Portainer API, to benchmark and test portainer-deployer without a real instance.
+
+It implements the stacks and endpoints routes the tool uses, with a configurable number of stacks, latency and error
+injection, over HTTP or HTTPS. Request bodies can be gzip compressed.
+
+    $ python benchmarks/fake_portainer.py --port 9000 --stacks 10000 --latency 5 --error-rate 0.01
+    $ portainer-deployer config --set portainer.url=http://127.0.0.1:9000
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from random import Random
+from re import compile as re_compile, search
+from threading import Lock, Thread
+from time import sleep, time
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import gzip
+import ssl
+import sys
+
+STACK_ROUTE = re_compile(r'^/api/stacks/(\d+)(/file)?$')
+
+
+class FakePortainerState:
+    """Stacks and behaviour of the fake server, shared by all the request handlers.
+    """
+    def __init__(self, stacks: int = 100, endpoints: int = 3, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 500, seed: int = 0) -> None:
+        """Initialize the FakePortainerState class.
+
+        Args:
+            stacks (int, optional): Number of stacks to start with, named stack-1 to stack-N. Defaults to 100.
+            endpoints (int, optional): Number of endpoints the stacks are spread over. Defaults to 3.
+            latency (float, optional): Seconds added to every response. Defaults to 0.0.
+            jitter (float, optional): Maximum random seconds added to the latency. Defaults to 0.0.
+            error_rate (float, optional): Fraction of the requests answered with error_status. Defaults to 0.0.
+            error_status (int, optional): Status of the injected errors. 429 and 503 come with a Retry-After header. Defaults to 500.
+            seed (int, optional): Seed of the latency jitter and the injected errors. Defaults to 0.
+        """
+        self.endpoints = [{'Id': i, 'Name': f'endpoint-{i}', 'URL': 'unix:///var/run/docker.sock', 'Type': 1, 'Status': 1} for i in range(1, endpoints + 1)]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+
+        self._random = Random(seed)
+        self._lock = Lock()
+        self._listing = None
+        self._last_id = 0
+        self.stacks = {}
+        for stack_id in range(1, stacks + 1):
+            self.create(f'stack-{stack_id}', stack_id % endpoints + 1, 'version: "3"\nservices:\n  web:\n    image: nginx\n')
+
+    def create(self, name: str, endpoint_id: int, content: str) -> dict:
+        """Create a stack.
+
+        Args:
+            name (str): Name of the stack.
+            endpoint_id (int): Id of the endpoint.
+            content (str): Compose file of the stack.
+
+        Returns:
+            dict: Created stack.
+        """
+        with self._lock:
+            # Ids are never reused, as in Portainer
+            self._last_id += 1
+            stack_id = self._last_id
+            now = int(time())
+            stack = {
+                'Id': stack_id, 'Name': name, 'Type': 2, 'EndpointId': endpoint_id, 'Status': 1, 'Env': [],
+                'CreationDate': now, 'CreatedBy': 'admin', 'UpdateDate': now, 'UpdatedBy': 'admin', 'content': content
+            }
+            self.stacks[stack_id] = stack
+            self._listing = None
+            return stack
+
+    def update(self, stack: dict, content: str) -> dict:
+        with self._lock:
+            stack.update(content=content, UpdateDate=int(time()))
+            self._listing = None
+            return stack
+
+    def delete(self, stack_id: int) -> dict:
+        with self._lock:
+            self._listing = None
+            return self.stacks.pop(stack_id, None)
+
+    def listing(self, endpoint_id: int = None) -> bytes:
+        """Serialize the stacks, without their content as Portainer does. The complete listing is kept until a stack changes.
+
+        Args:
+            endpoint_id (int, optional): Only list the stacks of this endpoint. Defaults to None.
+
+        Returns:
+            bytes: JSON array of the stacks.
+        """
+        with self._lock:
+            if endpoint_id is not None:
+                return dumps([public(stack) for stack in self.stacks.values() if stack['EndpointId'] == endpoint_id]).encode('utf-8')
+            if self._listing is None:
+                self._listing = dumps([public(stack) for stack in self.stacks.values()]).encode('utf-8')
+            return self._listing
+
+    def delay(self) -> None:
+        """Wait for the configured latency.
+        """
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            sleep(delay)
+
+    def injected_error(self) -> bool:
+        """Draw whether the current request fails.
+
+        Returns:
+            bool: True if an error must be returned.
+        """
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+def public(stack: dict) -> dict:
+    return {key: value for key, value in stack.items() if key != 'content'}
+
+
+class FakePortainerHandler(BaseHTTPRequestHandler):
+    """Request handler of the fake server. Connections are kept alive, as with Portainer.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakePortainer'
+
+    # Headers and body are separate writes, which Nagle's algorithm would delay on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.__handle('GET')
+
+    def do_POST(self):
+        self.__handle('POST')
+
+    def do_PUT(self):
+        self.__handle('PUT')
+
+    def do_DELETE(self):
+        self.__handle('DELETE')
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self) -> FakePortainerState:
+        return self.server.state
+
+    def __send(self, status: int, body=None, headers: dict = None) -> None:
+        data = body if isinstance(body, bytes) else dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def __handle(self, method: str) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            raw = gzip.decompress(raw)
+
+        self.state.delay()
+        if self.state.injected_error():
+            status = self.state.error_status
+            headers = {'Retry-After': '0'} if status in (429, 503) else None
+            return self.__send(status, {'message': 'Injected error', 'details': f'Fake Portainer answered with {status}'}, headers)
+
+        if url.path == '/api/endpoints' and method == 'GET':
+            return self.__send(200, self.state.endpoints)
+
+        if url.path == '/api/stacks' and method == 'GET':
+            filters = loads(query['filters'][0]) if 'filters' in query else {}
+            return self.__send(200, self.state.listing(filters.get('EndpointID')))
+
+        if url.path == '/api/stacks' and method == 'POST':
+            if query.get('method') == ['string']:
+                body = loads(raw)
+                name, content = body['name'], body['stackFileContent']
+            else:
+                name = search(rb'name="Name"\r\n\r\n([^\r]*)', raw).group(1).decode('utf-8')
+                content = raw.split(b'filename=', 1)[1].split(b'\r\n\r\n', 1)[1].rsplit(b'\r\n--', 1)[0].decode('utf-8')
+            return self.__send(200, public(self.state.create(name, int(query['endpointId'][0]), content)))
+
+        match = STACK_ROUTE.match(url.path)
+        stack = self.state.stacks.get(int(match.group(1))) if match else None
+        if stack is None:
+            return self.__send(404, {'message': 'Object not found inside the database', 'details': 'Unable to find a stack with the specified identifier inside the database'})
+
+        if method == 'GET':
+            return self.__send(200, {'StackFileContent': stack['content']} if match.group(2) else public(stack))
+        if method == 'PUT':
+            return self.__send(200, public(self.state.update(stack, loads(raw)['stackFileContent'])))
+        if method == 'DELETE':
+            self.state.delete(stack['Id'])
+            return self.__send(204)
+
+        self.__send(405, {'message': 'Method not allowed'})
+
+
+def serve(state: FakePortainerState, host: str = '127.0.0.1', port: int = 0, certfile: str = None, keyfile: str = None) -> ThreadingHTTPServer:
+    """Start the fake server in a background thread.
+
+    Args:
+        state (FakePortainerState): Stacks and behaviour of the server.
+        host (str, optional): Address to listen on. Defaults to '127.0.0.1'.
+        port (int, optional): Port to listen on, a free one if 0. Defaults to 0.
+        certfile (str, optional): Certificate to serve HTTPS with. Defaults to None.
+        keyfile (str, optional): Key of the certificate. Defaults to None.
+
+    Returns:
+        ThreadingHTTPServer: Running server, stop it with shutdown().
+    """
+    server = ThreadingHTTPServer((host, port), FakePortainerHandler)
+    server.daemon_threads = True
+    server.state = state
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def url_of(server: ThreadingHTTPServer) -> str:
+    """Get the url of a running fake server.
+
+    Returns:
+        str: Url to configure portainer-deployer with.
+    """
+    scheme = 'https' if isinstance(server.socket, ssl.SSLSocket) else 'http'
+    host, port = server.server_address[:2]
+    return f'{scheme}://{host}:{port}'
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the Portainer API.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=9000, help='Port to listen on, a free one if 0.')
+    parser.add_argument('--stacks', type=int, default=100, help='Number of stacks to start with.')
+    parser.add_argument('--endpoints', type=int, default=3, help='Number of endpoints the stacks are spread over.')
+    parser.add_argument('--latency', type=float, default=0, help='Milliseconds added to every response.')
+    parser.add_argument('--jitter', type=float, default=0, help='Maximum random milliseconds added to the latency.')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of the requests answered with --error-status.')
+    parser.add_argument('--error-status', type=int, default=500, help='Status of the injected errors.')
+    parser.add_argument('--certfile', default=None, help='Certificate to serve HTTPS with.')
+    parser.add_argument('--keyfile', default=None, help='Key of the certificate.')
+    args = parser.parse_args()
+
+    state = FakePortainerState(args.stacks, args.endpoints, args.latency / 1000, args.jitter / 1000, args.error_rate, args.error_status)
+    server = serve(state, args.host, args.port, args.certfile, args.keyfile)
+    print(f'Fake Portainer with {args.stacks} stacks listening on {url_of(server)}', flush=True)
+
+    try:
+        while True:
+            sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
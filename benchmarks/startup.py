@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Startup benchmark for the short CLI commands.
+
+Measures, in fresh interpreters, the cumulative import time of portainer_deployer.app (python -X importtime)
+and the wall time of `--version`, and fails when the median goes over the budget or a heavy module is imported.
+
+    $ python benchmarks/startup.py --runs 15 --import-budget 40 --wall-budget 150
+"""
+from os import path
+from statistics import median
+from time import perf_counter
+import argparse
+import subprocess
+import sys
+
+ROOT = path.abspath(path.join(path.dirname(__file__), '..'))
+
+# Modules only the sub-commands using the API or stack files may import
+HEAVY_MODULES = ('requests', 'urllib3', 'yaml', 'concurrent.futures')
+
+
+def import_time(module: str = 'portainer_deployer.app') -> tuple:
+    """Import a module in a fresh interpreter with -X importtime.
+
+    Args:
+        module (str, optional): Module to import. Defaults to 'portainer_deployer.app'.
+
+    Returns:
+        tuple: Cumulative import time of the module in ms, and the set of modules imported by it.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True
+    )
+
+    cumulative, imported = 0.0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, total, name = line.split('|')
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            cumulative = int(total) / 1000
+
+    return cumulative, imported
+
+
+def wall_time(*args: str) -> float:
+    """Run the CLI in a fresh interpreter.
+
+    Returns:
+        float: Wall time in ms.
+    """
+    start = perf_counter()
+    subprocess.run([sys.executable, '-m', 'portainer_deployer.app', *args], cwd=ROOT, stdin=subprocess.DEVNULL, capture_output=True, check=True)
+    return (perf_counter() - start) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Measure and enforce the CLI startup budget.')
+    parser.add_argument('--runs', type=int, default=10, help='Number of fresh interpreters per measure.')
+    parser.add_argument('--import-budget', type=float, default=40, help='Budget in ms for the median import time of portainer_deployer.app.')
+    parser.add_argument('--wall-budget', type=float, default=None, help='Budget in ms for the median wall time of --version. Not enforced by default.')
+    args = parser.parse_args()
+
+    imports, imported = [], set()
+    for _ in range(args.runs):
+        cumulative, modules = import_time()
+        imports.append(cumulative)
+        imported |= modules
+
+    walls = [wall_time('--version') for _ in range(args.runs)]
+
+    heavy = sorted(name for name in imported if name.split('.')[0] in HEAVY_MODULES or name in HEAVY_MODULES)
+    print(f'import portainer_deployer.app: median {median(imports):.1f} ms (budget {args.import_budget} ms)')
+    print(f'--version wall time:          median {median(walls):.1f} ms' + (f' (budget {args.wall_budget} ms)' if args.wall_budget else ''))
+
+    failed = False
+    if heavy:
+        print(f'FAIL: heavy modules imported at startup: {", ".join(heavy)}')
+        failed = True
+    if median(imports) > args.import_budget:
+        print('FAIL: import time over budget')
+        failed = True
+    if args.wall_budget and median(walls) > args.wall_budget:
+        print('FAIL: wall time over budget')
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Rendering benchmark of compose templates.
+
+Renders the same compose template for every variant with ComposeTemplate, parsed once, and with render_compose, a
+yaml load/dump cycle per variant as --update-keys does, and prints the time per variant of both. Fails when compiled
+rendering is not at least --min-speedup times faster.
+
+    $ python benchmarks/template.py --variants 500 --services 20
+"""
+from os import path
+from time import perf_counter
+import argparse
+import sys
+
+ROOT = path.abspath(path.join(path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from portainer_deployer.utils import ComposeTemplate, parse_update_pairs, render_compose  # noqa: E402
+
+
+def compose_template(services: int) -> str:
+    """Build a compose template with a few placeholders per service.
+
+    Args:
+        services (int): Number of services.
+
+    Returns:
+        str: Compose template.
+    """
+    return 'version: "3"\nservices:\n' + ''.join(
+        f'  web{i}:\n'
+        f'    image: "nginx:${{{{ tag }}}}"\n'
+        f'    environment:\n'
+        f'      CUSTOMER: ${{{{ customer }}}}\n'
+        f'      SERVICE: web{i}\n'
+        f'    deploy:\n'
+        f'      replicas: ${{{{ replicas:-1 }}}}\n'
+        f'    ports:\n'
+        f'      - "{8000 + i}:80"\n'
+        for i in range(services)
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare compiled template rendering with a yaml load/dump cycle per variant.')
+    parser.add_argument('--variants', type=int, default=500, help='Number of variants rendered.')
+    parser.add_argument('--services', type=int, default=20, help='Number of services of the compose template.')
+    parser.add_argument('--min-speedup', type=float, default=None, help='Fail if compiled rendering is not this many times faster.')
+    args = parser.parse_args()
+
+    content = compose_template(args.services)
+    variants = [{'customer': f'customer-{i}', 'tag': '1.25', 'replicas': str(i % 3 + 1)} for i in range(args.variants)]
+
+    started = perf_counter()
+    template = ComposeTemplate(content)
+    for variables in variants:
+        template.render(variables)
+    compiled = perf_counter() - started
+
+    # The same variants, as --update-keys edits: every service of every variant is loaded and dumped again
+    started = perf_counter()
+    for variables in variants:
+        updates = []
+        for i in range(args.services):
+            updates += parse_update_pairs([
+                f'services.web{i}.image=nginx:{variables["tag"]}',
+                f'services.web{i}.environment.CUSTOMER={variables["customer"]}',
+                f'services.web{i}.deploy.replicas={variables["replicas"]}'
+            ])
+        render_compose(content, updates)
+    reparsed = perf_counter() - started
+
+    spacing_str = '{0:<22} {1:>10} {2:>16}'
+    print(spacing_str.format('Mode', 'Total (ms)', 'Per variant (ms)'))
+    print(spacing_str.format('compiled template', f'{compiled * 1000:.1f}', f'{compiled * 1000 / args.variants:.3f}'))
+    print(spacing_str.format('yaml load/dump', f'{reparsed * 1000:.1f}', f'{reparsed * 1000 / args.variants:.3f}'))
+    print(f'Speedup: {reparsed / compiled:.1f}x')
+
+    if args.min_speedup is not None and reparsed / compiled < args.min_speedup:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
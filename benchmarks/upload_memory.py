@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Memory benchmark of stack uploads, against the local fake Portainer of fake_portainer.py.
+
+Deploys compose files of every size in a fresh interpreter, from the file, from the file gzip compressed and, for
+reference, as a string read whole in memory, and prints how much the peak RSS of the interpreter grew during the
+upload. Streamed uploads should stay flat whatever the size of the file.
+
+    $ python benchmarks/upload_memory.py --sizes 1 10 100
+"""
+from os import path
+from tempfile import TemporaryDirectory
+import argparse
+import json
+import subprocess
+import sys
+
+ROOT = path.abspath(path.join(path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from fake_portainer import FakePortainerState, serve, url_of  # noqa: E402
+
+MODES = ('file', 'gzip', 'string')
+
+# Run in a fresh interpreter, so the peak RSS only depends on one upload
+CHILD = '''
+import json, resource, sys
+sys.path.insert(0, {root!r})
+from portainer_deployer.api import PortainerAPIConsumer
+
+config_path, stack_path, mode = sys.argv[1:]
+api = PortainerAPIConsumer(config_path)
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+if mode == 'string':
+    with open(stack_path) as f:
+        response = api.post_stack_from_str(f.read(), endpoint_id=1, name='bench', force=True)
+else:
+    response = api.post_stack_from_file(stack_path, endpoint_id=1, name='bench', force=True)
+
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'status': response['status'], 'growth_kb': after - before}}))
+'''
+
+
+def write_compose(stack_path: str, size: int) -> None:
+    """Write a compose file of about a given size, with a service per 40 bytes.
+
+    Args:
+        stack_path (str): Path of the file.
+        size (int): Size of the file in bytes.
+    """
+    with open(stack_path, 'w') as f:
+        f.write('version: "3"\nservices:\n')
+        service = 0
+        written = 0
+        while written < size:
+            chunk = ''.join(f'  web{service + i}:\n    image: nginx:alpine\n' for i in range(10000))
+            f.write(chunk)
+            written += len(chunk)
+            service += 10000
+
+
+def measure(config_path: str, stack_path: str, mode: str) -> dict:
+    """Upload a stack in a fresh interpreter.
+
+    Args:
+        config_path (str): Config file pointing to the fake server.
+        stack_path (str): Compose file to upload.
+        mode (str): file, gzip or string.
+
+    Returns:
+        dict: Status of the upload and growth of the peak RSS in KB, None if the interpreter was killed, i.e. out of memory.
+    """
+    if mode == 'gzip':
+        config_path = f'{config_path}.gzip'
+
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD.format(root=ROOT), config_path, stack_path, mode],
+        stdin=subprocess.DEVNULL, capture_output=True, text=True
+    )
+    if result.returncode:
+        return {'status': False, 'growth_kb': None}
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Measure the memory used to upload compose files of several sizes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100], help='Sizes of the compose files in MB.')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='Upload modes to measure.')
+    parser.add_argument('--budget', type=float, default=None, help='Fail if a file or gzip upload grows the peak RSS by more MB than this.')
+    args = parser.parse_args()
+
+    server = serve(FakePortainerState(stacks=0))
+    failed = False
+
+    with TemporaryDirectory() as tmp:
+        config_path = path.join(tmp, 'app.conf')
+        config = f'[PORTAINER]\nurl={url_of(server)}\ntoken=benchmark\nverify_ssl=no\ncache_dir={tmp}\n'
+        with open(config_path, 'w') as f:
+            f.write(config)
+        with open(f'{config_path}.gzip', 'w') as f:
+            f.write(f'{config}compress_uploads=yes\n')
+
+        spacing_str = '{0:>9} {1:<8} {2:>8} {3:>16}'
+        print(spacing_str.format('Size (MB)', 'Mode', 'Status', 'Peak growth (MB)'))
+        for size in args.sizes:
+            stack_path = path.join(tmp, f'stack-{size}.yml')
+            write_compose(stack_path, size * 1024 * 1024)
+
+            for mode in args.modes:
+                result = measure(config_path, stack_path, mode)
+                growth = result['growth_kb'] / 1024 if result['growth_kb'] is not None else None
+                status = 'ok' if result['status'] else 'failed' if growth is not None else 'killed'
+                print(spacing_str.format(size, mode, status, f'{growth:.1f}' if growth is not None else '-'))
+
+                # Strings are held whole in memory, they are only measured for reference
+                if mode != 'string' and (not result['status'] or (args.budget is not None and growth > args.budget)):
+                    failed = True
+
+    server.shutdown()
+    server.server_close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
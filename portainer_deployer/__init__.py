@@ -9,4 +9,4 @@ PHASE = info['phase']
 PROG = info['info']['prog']
 DEFAULT_HELP_MESSAGE = 'Show help message and exit.'
 
-__all__ = ['config', 'utils']
\ No newline at end of file
+__all__ = ['config', 'utils', 'cache']
\ No newline at end of file
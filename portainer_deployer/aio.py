@@ -0,0 +1,355 @@
+from functools import partial, wraps
+from json import dumps
+from time import monotonic, perf_counter
+import asyncio
+
+from .utils import generate_response, StackNotFoundError
+from .base import BasePortainerAPIConsumer, PortainerAPIError, Reply, api_error
+from .ratelimit import AsyncAdaptiveConcurrency, is_throttled, retry_after_seconds, backoff_delay
+from .metrics import metrics, route_of
+from .upload import CHUNK_SIZE, MultipartBody
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+async def _read_upload(upload: MultipartBody):
+    """Read a multipart body in the default executor, so the files it reads do not block the event loop.
+
+    Args:
+        upload (MultipartBody): Body to be sent.
+
+    Yields:
+        bytes: Chunks of the body.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, upload.read, CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _trace_config() -> 'aiohttp.TraceConfig':
+    """Build a trace config recording DNS resolution, connection (TCP and TLS) and time to first byte of every request.
+
+    Returns:
+        aiohttp.TraceConfig: Trace config to pass to the session.
+    """
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.request_start = perf_counter()
+
+    async def on_request_end(session, context, params):
+        metrics.record('http.ttfb', perf_counter() - context.request_start, method=params.method, route=route_of(str(params.url)))
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.dns_start = perf_counter()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        metrics.record('http.dns', perf_counter() - context.dns_start, host=params.host)
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_start = perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        metrics.record('http.connect', perf_counter() - context.connect_start)
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+class AsyncPortainerAPIConsumer(BasePortainerAPIConsumer):
+    """Class to manage the Portainer API from asyncio code.
+
+    It exposes the same operations as PortainerAPIConsumer, returning the same response dicts, but all of them
+    share a single aiohttp connection pool so that many of them can be awaited concurrently. i.e.
+
+        async with AsyncPortainerAPIConsumer(path_to_config) as api:
+            responses = await asyncio.gather(*(api.delete_stack(1, stack_name=name) for name in names))
+    """
+    # 503 is handled as a throttling response, see ratelimit.is_throttled
+    RETRY_STATUS = (502, 504)
+    RETRY_METHODS = ('GET', 'DELETE')
+
+    concurrency_class = AsyncAdaptiveConcurrency
+
+    def __init__(self, api_config_path: str, section: str = 'PORTAINER') -> None:
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for the async client. Install it with: pip install portainer-deployer[async]')
+
+        super().__init__(api_config_path, section=section)
+        self._max_retries = int(self._portainer_config.get_var_or_default('MAX_RETRIES', 3))
+        self._backoff_factor = float(self._portainer_config.get_var_or_default('BACKOFF_FACTOR', 0.3))
+
+        # The session and lock must be created inside the running event loop, so they are built on first use
+        self._session = None
+        self._shared_lock = None
+
+        # Last reply of every shared call, with the time it was handed to other operations
+        self._shared_replies = {}
+
+    async def __aenter__(self) -> 'AsyncPortainerAPIConsumer':
+        # The deploy manifest is written once the operations awaited inside the context are done
+        self._batch = self.batch()
+        self._batch.__enter__()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._batch.__exit__, None, None, None)
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """Close the underlying session and release its pooled connections.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def session(self) -> 'aiohttp.ClientSession':
+        """Get the shared session, creating it on first use.
+
+        Returns:
+            aiohttp.ClientSession: Session used by every call to the API.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_maxsize, ssl=None if self.use_ssl else False),
+                headers=self._connection_headers,
+                raise_for_status=False,
+                trace_configs=[_trace_config()] if metrics.enabled else None
+            )
+        return self._session
+
+    def error_handler(method):
+        """Decorator to use static error handler.
+
+        Args:
+            func (function): Function to be decorated.
+
+        Returns:
+            function: Decorated function.
+        """
+        @wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            try:
+                return await method(self, *args, **kwargs)
+
+            except PortainerAPIError as e:
+                return e.response
+
+            except aiohttp.TooManyRedirects as e:
+                return generate_response('Too many redirects..', str(e), code=500)
+
+            except aiohttp.ClientConnectionError as e:
+                return generate_response('Connection Error.', str(e), code=500)
+
+            except asyncio.TimeoutError as e:
+                return generate_response('Connection timeout.', str(e), code=500)
+
+            except aiohttp.ClientError as e:
+                return generate_response('Fatal error', str(e), code=500)
+
+            except StackNotFoundError as e:
+                return generate_response(str(e), code=404)
+
+            except Exception as e:
+                return generate_response(str(e), code=500)
+
+        return wrapper
+
+    async def _request(self, method: str, endpoint: str, upload: MultipartBody = None, **kwargs) -> tuple:
+        """Send a request to Portainer within the rate limit and the adaptive concurrency limit. Failed connections and,
+        for idempotent methods, 502/504 responses are retried, and throttled requests are retried after Retry-After or a jittered backoff.
+
+        Args:
+            method (str): HTTP method.
+            endpoint (str): Path of the API, i.e. /api/stacks.
+            upload (MultipartBody, optional): Multipart body, read in the executor as it is sent and rewound on every attempt. Defaults to None.
+
+        Returns:
+            tuple: Status code, decoded JSON body (None if the body is empty or not JSON) and raw body.
+        """
+        retries = throttles = 0
+        delay = 0.0
+
+        while True:
+            if delay:
+                await asyncio.sleep(delay)
+
+            if upload is not None:
+                upload.seek(0)
+                kwargs['data'] = _read_upload(upload)
+                kwargs['headers'] = upload.headers
+
+            await self._rate_limiter.acquire_async()
+            try:
+                async with self._concurrency:
+                    start = perf_counter()
+                    async with self.session.request(method, f"{self._portainer_url}{endpoint}", **kwargs) as r:
+                        throttled = is_throttled(r.status, method)
+                        if throttled:
+                            self._concurrency.on_throttle()
+                        else:
+                            self._concurrency.on_success()
+
+                        if throttled and throttles < self._throttle_retries:
+                            retry_after = retry_after_seconds(r.headers.get('Retry-After'))
+                            delay = min(self._max_backoff, retry_after) if retry_after is not None else backoff_delay(throttles, self._throttle_backoff, self._max_backoff)
+                            throttles += 1
+                            metrics.record('http.throttle_wait', delay)
+                            continue
+
+                        if r.status in self.RETRY_STATUS and method in self.RETRY_METHODS and retries < self._max_retries:
+                            delay = self._backoff_factor * (2 ** retries)
+                            retries += 1
+                            continue
+
+                        with metrics.timer('http.transfer', method=method, route=route_of(endpoint)):
+                            text = await r.text()
+                        metrics.record('http.request', perf_counter() - start, status=r.status, method=method, route=route_of(endpoint))
+                        try:
+                            body = await r.json(content_type=None) if text else None
+                        except ValueError:
+                            body = None
+
+                        return r.status, body, text or r.reason
+
+            # Requests that never reached the server are safe to retry whatever the method
+            except aiohttp.ClientConnectorError:
+                if retries >= self._max_retries:
+                    raise
+
+            except aiohttp.ClientConnectionError:
+                if method not in self.RETRY_METHODS or retries >= self._max_retries:
+                    raise
+
+            delay = self._backoff_factor * (2 ** retries)
+            retries += 1
+
+    @classmethod
+    def _bind_operation(cls, steps, handle_errors: bool = True):
+        """Turn the generator function of an operation into a coroutine method sending its calls through the shared session.
+
+        Args:
+            steps (function): Generator function of the operation.
+            handle_errors (bool, optional): If True, errors are returned as a response. Defaults to True.
+
+        Returns:
+            function: Coroutine method running the operation.
+        """
+        @wraps(steps)
+        async def wrapper(self, *args, **kwargs):
+            return await self._run(steps(self, *args, **kwargs))
+        return cls.error_handler(wrapper) if handle_errors else wrapper
+
+    async def _run(self, steps):
+        """Run an operation, sending every call it yields and passing it the reply. The steps between calls read files,
+        parse yaml and write the local caches, so they run in the default executor instead of blocking the event loop.
+
+        Args:
+            steps (generator): Generator of the operation.
+
+        Returns:
+            Any: Value returned by the operation.
+        """
+        loop = asyncio.get_running_loop()
+        release = None
+        try:
+            reply = None
+            while True:
+                checked_at = monotonic()
+                try:
+                    done, value = await loop.run_in_executor(None, self.__advance, steps, reply)
+                finally:
+                    # A shared reply is handed to other operations once this one has indexed it
+                    if release:
+                        release()
+                        release = None
+
+                if done:
+                    return value
+                reply, release = await self._send(value, checked_at)
+        finally:
+            steps.close()
+            if release:
+                release()
+
+    @staticmethod
+    def __advance(steps, reply) -> tuple:
+        # StopIteration can not be raised through a future, so the end of the operation is returned instead
+        try:
+            return False, steps.send(reply)
+        except StopIteration as stop:
+            return True, stop.value
+
+    async def _send(self, call, checked_at: float) -> tuple:
+        """Send a call of an operation. Shared calls are sent one at a time, and the reply of one sent after an
+        operation checked its local caches is reused by that operation instead of sending the request again.
+
+        Args:
+            call (Call): Call to be sent.
+            checked_at (float): Monotonic time at which the operation started the step that yielded the call.
+
+        Raises:
+            PortainerAPIError: If Portainer answers with an error status.
+
+        Returns:
+            tuple: Reply, with the whole body decoded even if the call is streamed, and a function to call once the
+            operation processed it, or None.
+        """
+        kwargs = {}
+        if call.params is not None:
+            kwargs['params'] = call.params
+        if call.json is not None:
+            kwargs['json'] = call.json
+
+        if not call.shared:
+            upload = None
+            if call.form is not None:
+                # Built in the executor, as compressing it reads the files
+                upload = await asyncio.get_running_loop().run_in_executor(None, partial(MultipartBody, call.form, compress=self._compress_uploads))
+            try:
+                status, body, text = await self._request(call.method, call.path, upload=upload, **kwargs)
+            finally:
+                if upload is not None:
+                    upload.close()
+            if status >= 400 and not (call.missing_ok and status == 404):
+                raise api_error(status, body, text)
+            return Reply(status, body), None
+
+        if self._shared_lock is None:
+            self._shared_lock = asyncio.Lock()
+
+        key = (call.method, call.path, dumps(call.params, sort_keys=True))
+        await self._shared_lock.acquire()
+        try:
+            released_at, status, body = self._shared_replies.get(key, (None, None, None))
+            if released_at is not None and released_at >= checked_at:
+                self._shared_lock.release()
+                return Reply(status, body, shared=True), None
+
+            status, body, text = await self._request(call.method, call.path, **kwargs)
+            if status >= 400 and not (call.missing_ok and status == 404):
+                raise api_error(status, body, text)
+        except BaseException:
+            self._shared_lock.release()
+            raise
+
+        # The lock is held until the operation processed the reply, i.e. refreshed the stack index with it
+        def release():
+            self._shared_replies[key] = (monotonic(), status, body)
+            self._shared_lock.release()
+
+        return Reply(status, body), release
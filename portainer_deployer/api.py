@@ -0,0 +1,315 @@
+from urllib3.exceptions import InsecureRequestWarning
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .utils import *
+from .base import BasePortainerAPIConsumer, PortainerAPIError, Reply, api_error
+from .ratelimit import AdaptiveConcurrency, is_throttled, retry_after_seconds, backoff_delay
+from .metrics import metrics, route_of
+from .upload import MultipartBody
+from functools import wraps
+from time import sleep, perf_counter
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """HTTP connection recording the time to open it. DNS resolution is included, urllib3 does not expose it apart.
+    """
+    def _new_conn(self):
+        with metrics.timer('http.connect', host=self.host):
+            return super()._new_conn()
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS connection recording the time to open it and, apart, the time of the TLS handshake.
+    """
+    def _new_conn(self):
+        start = perf_counter()
+        conn = super()._new_conn()
+        self._connect_seconds = perf_counter() - start
+        metrics.record('http.connect', self._connect_seconds, host=self.host)
+        return conn
+
+    def connect(self):
+        start = perf_counter()
+        super().connect()
+        metrics.record('http.tls', perf_counter() - start - getattr(self, '_connect_seconds', 0.0), host=self.host)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """Adapter opening connections that record their connect and TLS times, only mounted while metrics are enabled.
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+
+class PortainerAPIConsumer(BasePortainerAPIConsumer):
+    """Class to manage the Portainer API
+    """    
+    concurrency_class = AdaptiveConcurrency
+
+    def __init__(self, api_config_path: str, section: str = 'PORTAINER') -> None:
+        super().__init__(api_config_path, section=section)
+
+        # Set non-ssl connection
+        if not self.use_ssl and self._portainer_url.split('://')[0] == 'https':
+            # Suppress only the single warning from urllib3 needed.
+            requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+
+        # Shared session, so every call in a command reuses the same pooled connections
+        self._session = self.__build_session()
+
+    def __build_session(self) -> requests.Session:
+        """Build a keep-alive session with a pooled adapter and retries mounted.
+
+        Returns:
+            requests.Session: Session to be used by every call to the API.
+        """
+        retries = Retry(
+            total=int(self._portainer_config.get_var_or_default('MAX_RETRIES', 3)),
+            backoff_factor=float(self._portainer_config.get_var_or_default('BACKOFF_FACTOR', 0.3)),
+            # 503 is left to _request, as it is a throttling response that may carry Retry-After
+            status_forcelist=(502, 504),
+            raise_on_status=False
+        )
+
+        adapter_class = _TimedHTTPAdapter if metrics.enabled else HTTPAdapter
+        adapter = adapter_class(
+            pool_connections=int(self._portainer_config.get_var_or_default('POOL_CONNECTIONS', 10)),
+            pool_maxsize=self._pool_maxsize,
+            max_retries=retries
+        )
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update(self._connection_headers)
+        session.verify = self.use_ssl
+
+        return session
+
+    def ensure_pool_size(self, size: int) -> None:
+        """Grow the connection pool so that it can hold at least the given number of concurrent connections.
+
+        Args:
+            size (int): Number of concurrent connections expected.
+        """
+        if size > self._pool_maxsize:
+            self._pool_maxsize = size
+            self._session.close()
+            self._session = self.__build_session()
+
+        # A configured max_concurrency is a hard cap, otherwise it follows the workers started
+        if not self._max_concurrency:
+            self._concurrency.expand(size)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the shared session, within the rate limit and the adaptive concurrency limit.
+        Throttled requests (429, and 503 for idempotent methods) are retried after Retry-After or a jittered exponential backoff.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Url of the request.
+
+        Returns:
+            requests.Response: Response of the last attempt.
+        """
+        for attempt in range(self._throttle_retries + 1):
+            # A body read from a file is sent again from its start
+            if hasattr(kwargs.get('data'), 'seek'):
+                kwargs['data'].seek(0)
+
+            self._rate_limiter.acquire()
+            with self._concurrency:
+                start = perf_counter()
+                # verify is passed on every request, as requests replaces the one of the session with REQUESTS_CA_BUNDLE
+                r = self._session.request(method, url, verify=self.use_ssl, **kwargs)
+                elapsed = perf_counter() - start
+
+            if metrics.enabled:
+                self.__record_request(method, url, r, elapsed, streamed=kwargs.get('stream', False))
+
+            if not is_throttled(r.status_code, method):
+                self._concurrency.on_success()
+                return r
+
+            self._concurrency.on_throttle()
+            if attempt >= self._throttle_retries:
+                return r
+
+            delay = retry_after_seconds(r.headers.get('Retry-After'))
+            delay = min(self._max_backoff, delay) if delay is not None else backoff_delay(attempt, self._throttle_backoff, self._max_backoff)
+            logging.getLogger('stdout').debug(f"Portainer throttled {method} {url} with {r.status_code}, retrying in {delay:.2f}s...")
+            r.close()
+            metrics.record('http.throttle_wait', delay)
+            sleep(delay)
+
+    @staticmethod
+    def __record_request(method: str, url: str, r: requests.Response, elapsed: float, streamed: bool = False) -> None:
+        """Record the total time of a request, its time to first byte and the time to transfer the body.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Url of the request.
+            r (requests.Response): Response of the request.
+            elapsed (float): Seconds spent in the request.
+            streamed (bool, optional): If True, the body was not read yet and its transfer is not recorded. Defaults to False.
+        """
+        labels = {'method': method.upper(), 'route': route_of(url)}
+        # requests measures until the headers are parsed, which is the time to first byte
+        ttfb = r.elapsed.total_seconds() if r.elapsed is not None else elapsed
+        metrics.record('http.request', elapsed, status=r.status_code, **labels)
+        metrics.record('http.ttfb', ttfb, **labels)
+        if not streamed:
+            metrics.record('http.transfer', max(0.0, elapsed - ttfb), **labels)
+
+    def close(self) -> None:
+        """Close the underlying session and release its pooled connections.
+        """
+        self._session.close()
+
+    def error_handler(method):
+        """Decorator to use static error handler.
+
+        Args:
+            func (function): Function to be decorated.
+
+        Returns:
+            function: Decorated function.
+        """
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs) 
+            
+            except requests.exceptions.ConnectionError as e:
+                return generate_response('Connection Error.', str(e), code=500)
+
+            except requests.exceptions.Timeout as e:
+                return generate_response('Connection timeout.', e, code=500)
+
+            except requests.exceptions.TooManyRedirects as e:
+                return generate_response('Too many redirects..', e, code=500)
+            
+            except requests.exceptions.HTTPError as e:
+                if hasattr(e.response, 'json'):
+                    res = generate_response(e.response.json().get('message'), e.response.json().get('details'), code=e.response.status_code)
+                elif hasattr(e.response, 'text'):
+                    res = generate_response(e.response.text, code=e.response.status_code)
+                else:
+                    res = generate_response(str(e), code=500)
+                
+                return res
+            
+            except requests.exceptions.RequestException as e:
+                res = generate_response('Fatal error', str(e), code=e.response.status_code)
+                return res
+            
+            except PortainerAPIError as e:
+                return e.response
+
+            except StackNotFoundError as e:
+                return generate_response(str(e), code=404)
+
+            except Exception as e:
+                return generate_response(str(e), code=500)
+
+        return wrapper
+
+    @classmethod
+    def _bind_operation(cls, steps, handle_errors: bool = True):
+        """Turn the generator function of an operation into a method sending its calls through the shared session.
+
+        Args:
+            steps (function): Generator function of the operation.
+            handle_errors (bool, optional): If True, errors are returned as a response. Defaults to True.
+
+        Returns:
+            function: Method running the operation.
+        """
+        @wraps(steps)
+        def wrapper(self, *args, **kwargs):
+            return self._run(steps(self, *args, **kwargs))
+        return cls.error_handler(wrapper) if handle_errors else wrapper
+
+    def _run(self, steps):
+        """Run an operation, sending every call it yields and passing it the reply.
+
+        Args:
+            steps (generator): Generator of the operation.
+
+        Returns:
+            Any: Value returned by the operation.
+        """
+        streamed = []
+        try:
+            reply = None
+            while True:
+                try:
+                    call = steps.send(reply)
+                except StopIteration as stop:
+                    return stop.value
+
+                # A streamed body is only readable until the next call
+                while streamed:
+                    streamed.pop().close()
+
+                reply = self._send(call, streamed)
+        finally:
+            steps.close()
+            for r in streamed:
+                r.close()
+
+    def _send(self, call, streamed: list) -> Reply:
+        """Send a call of an operation.
+
+        Args:
+            call (Call): Call to be sent.
+            streamed (list): Responses left open to stream their body, to be closed by the caller.
+
+        Raises:
+            PortainerAPIError: If Portainer answers with an error status.
+
+        Returns:
+            Reply: Status and decoded body. The body is an iterator of the items of a JSON array if the call is streamed.
+        """
+        kwargs = {'params': call.params, 'json': call.json, 'stream': call.stream}
+        if call.form is not None:
+            # Files are read as the body is sent, instead of being encoded in memory by requests
+            kwargs['data'] = MultipartBody(call.form, compress=self._compress_uploads)
+            kwargs['headers'] = kwargs['data'].headers
+
+        try:
+            r = self._request(call.method, f"{self._portainer_url}{call.path}", **kwargs)
+        finally:
+            if call.form is not None:
+                kwargs['data'].close()
+
+        if r.status_code >= 400 and not (call.missing_ok and r.status_code == 404):
+            with r:
+                try:
+                    body = r.json()
+                except ValueError:
+                    body = None
+                raise api_error(r.status_code, body, r.text or r.reason)
+
+        if call.stream:
+            streamed.append(r)
+            return Reply(r.status_code, iter_json_array(r.iter_content(chunk_size=64 * 1024)))
+
+        try:
+            body = r.json() if r.content else None
+        except ValueError:
+            body = None
+        return Reply(r.status_code, body)
@@ -1,302 +1,65 @@
 #!/usr/bin/env python3
 
 from os import path
-from urllib3.exceptions import InsecureRequestWarning
 
 from portainer_deployer.utils.utils import update_config_dir
 from .utils import *
 from .config import ConfigManager
+from .metrics import metrics
 from . import VERSION, PHASE, PROG, DEFAULT_HELP_MESSAGE
-from re import split as re_split
 from functools import wraps
 import argparse
 import sys
-import requests
-class PortainerAPIConsumer:
-    """Class to manage the Portainer API
-    """    
-    def __init__(self, api_config_path: str) -> None:
-        PATH_TO_CONFIG = api_config_path
 
-        # Load config
-        self._portainer_config = ConfigManager(PATH_TO_CONFIG, default_section='PORTAINER')
+DEFAULT_MAX_STDIN_SIZE = 16 * 1024 * 1024
 
-        # Set non-ssl connection
-        self.use_ssl = self._portainer_config.get_boolean_var('VERIFY_SSL')
-        if not self.use_ssl and self._portainer_config.url.split('://')[0] == 'https':
-            # Suppress only the single warning from urllib3 needed.
-            requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+# Sub-commands a running daemon answers instead of the CLI process
+DAEMON_COMMANDS = ('get', 'deploy', 'deploy-batch', 'remove', 'sync', 'export', 'endpoints', 'plan', 'apply')
 
-        # Set portainer connection parameters
-        self.__portainer_connection_str = self._portainer_config.url
-        self.__connection_headers = {'X-API-Key': self._portainer_config.token}
+# Names of the endpoint types and statuses of Portainer
+ENDPOINT_TYPES = {1: 'docker', 2: 'agent', 3: 'azure', 4: 'edge-agent', 5: 'kubernetes', 6: 'kubernetes-agent', 7: 'edge-kubernetes'}
+ENDPOINT_STATUSES = {1: 'up', 2: 'down'}
 
-    def error_handler(method):
-        """Decorator to use static error handler.
+# Named Portainer instances are configured in sections like [PORTAINER:EU], the PORTAINER section is the "default" instance
+DEFAULT_INSTANCE = 'default'
+DEFAULT_INSTANCE_SECTION = 'PORTAINER'
 
-        Args:
-            func (function): Function to be decorated.
-
-        Returns:
-            function: Decorated function.
-        """
-        @wraps(method)
-        def wrapper(self, *args, **kwargs):
-            try:
-                return method(self, *args, **kwargs) 
-            
-            except requests.exceptions.ConnectionError as e:
-                return generate_response('Connection Error.', str(e), code=500)
-
-            except requests.exceptions.Timeout as e:
-                return generate_response('Connection timeout.', e, code=500)
-
-            except requests.exceptions.TooManyRedirects as e:
-                return generate_response('Too many redirects..', e, code=500)
-            
-            except requests.exceptions.HTTPError as e:
-                if hasattr(e.response, 'json'):
-                    res = generate_response(e.response.json().get('message'), e.response.json().get('details'), code=e.response.status_code)
-                elif hasattr(e.response, 'text'):
-                    res = generate_response(e.response.text, code=e.response.status_code)
-                else:
-                    res = generate_response(str(e), code=500)
-                
-                return res
-            
-            except requests.exceptions.RequestException as e:
-                res = generate_response('Fatal error', str(e), code=e.response.status_code)
-                return res
-            
-            except Exception as e:
-                return generate_response(str(e), code=500)
-
-        return wrapper 
-
-    @error_handler
-    def get_stack(self, name:str=None, stack_id:int=None) -> dict:
-        """Get a stack from portainer
-
-        Args:
-            name (str, optional): Name of the stack in Portainer. Defaults to None.
-            stack_id (int, optional): Id of the stack in Portainer. Defaults to None.
-
-        Returns:
-            dict: Dictionary with the status and detail of the operation.
-        """
-        spacing_str = '{0:<5} {1:<12} {2:<30} {3:30} {4:<30}'
-
-        if stack_id:
-                r = requests.get(
-                    f"{self.__portainer_connection_str}/api/stacks/{stack_id}", 
-                    headers=self.__connection_headers,
-                    verify=self.use_ssl
-                )
-                
-                r.raise_for_status()
-                data = format_stack_info(r.json())
-
-                print(spacing_str.format('Id', 'Endpoint Id', 'Name', 'Creation', 'Last Updated'))
-                print(spacing_str.format(*data))
-
-        elif name:
-            r = requests.get(
-                f"{self.__portainer_connection_str}/api/stacks", 
-                headers=self.__connection_headers,
-                verify=self.use_ssl
-            )
-            
-            r.raise_for_status()
-            data = format_stack_info_generator(r.json())
-
-            print(spacing_str.format('Id', 'Endpoint Id', 'Name', 'Creation', 'Last Updated'))
-            for stack in data:
-                if stack[2] == name:
-                    print(spacing_str.format(*stack))
-                    break 
-            else:
-                raise Exception(f"Stack {name} not found in the database.")
-
-        else:
-            r = requests.get(
-                f"{self.__portainer_connection_str}/api/stacks", 
-                headers=self.__connection_headers,
-                verify=self.use_ssl
-            )
-            
-            r.raise_for_status()
-            data = format_stack_info_generator(r.json())
 
-            print(spacing_str.format('Id', 'Endpoint Id', 'Name', 'Creation', 'Last Updated'))
-            for stack in data:
-                print(spacing_str.format(*stack))
-
-        return generate_response('Stack(s) pulled successfully', status=True, code=r.status_code)
+class LazySubParsersAction(argparse._SubParsersAction):
+    """Sub-parsers action that populates a sub-parser only when its sub-command is invoked, so the parser is cheap to build.
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._builders = {}
 
-    @error_handler
-    def post_stack_from_str(self, stack: str, endpoint_id: int, name: str = None) -> dict:
-        """Post a stack from str.
+    def add_lazy_parser(self, name: str, builder, **kwargs) -> argparse.ArgumentParser:
+        """Add an empty sub-parser and the function to populate it.
 
         Args:
-            stack (str): String of the stack.
-            endpoint_id (int): Id of the endpoint in Portainer.
-            name (str): Name of the stack in Portainer.
+            name (str): Name of the sub-command.
+            builder (function): Function receiving the sub-parser to add its arguments.
 
         Returns:
-            dict: Dictionary with the status and detail of the operation.
+            argparse.ArgumentParser: Sub-parser, still without arguments.
         """
-        if not validate_yaml(data=stack):
-            raise Exception('Invalid stack', 'Stack is not in a valid yaml format.')
-
-        name = name if name else generate_random_hash()
-
-        params = {
-            "type": 2,
-            "endpointId": endpoint_id,
-            "method": "string"
-        }
-
-        r = requests.post(
-            f"{self.__portainer_connection_str}/api/stacks", 
-            headers=self.__connection_headers,
-            params=params,
-            json={
-                "name": name,
-                "stackFileContent": stack},
-            verify=self.use_ssl
-        )
-        
-        r.raise_for_status()
-        logging.getLogger('stdout').info(f"Stack {name} created successfully!!!")
-        return generate_response('Stack(s) pushed successfully', status=True, code=r.status_code)
-
-    @error_handler
-    def post_stack_from_file(self, path: str, endpoint_id: int, name: str = None) -> dict:
-        """Post a stack from a file.
-
-        Args:
-            path (str): Path to the file.
-            endpoint_id (int): Id of the endpoint in Portainer.
-            name (str): Name of the stack in Portainer.
-
-        Returns:
-            dict: Dictionary with the status and detail of the operation.
-        """        
-        name = name if name else generate_random_hash()
-        
-        if not validate_yaml(path=path):
-            raise Exception('Invalid stack', 'Stack is not in a valid yaml format.')
-        
-        # Open file
-        with open(path, 'r') as f:
-            params = {
-                "type": 2,
-                "endpointId": endpoint_id,
-                "method": "file"
-            }
-            
-            response = requests.post(self.__portainer_connection_str + '/api/stacks',
-                data={ "Name": name}, 
-                params=params,
-                files={'file': f},
-                headers=self.__connection_headers, 
-                verify=self.use_ssl
-            )
-            response.raise_for_status()
-
-            logging.getLogger('stdout').info(f"Stack {name} created successfully!!!")
-            return generate_response(f'Stack {name} from {path} posted successfully under the endpoint {endpoint_id}.', status=True, code=response.status_code)
-
-    @error_handler
-    def delete_stack_by_id(self, stack_id: int, endpoint_id) -> dict:
-        params = {
-            "endpointId": endpoint_id,
-            "external": False
-        }
-        r = requests.delete(
-            f"{self.__portainer_connection_str}/api/stacks/{stack_id}", 
-            headers=self.__connection_headers,
-            verify=self.use_ssl,
-            params=params
-        )
-        
-        r.raise_for_status()
-        logging.getLogger('stdout').info("Deleted successfully!!!")
-        return generate_response('Stack(s) deleted successfully', status=True, code=r.status_code)
-
-    @error_handler
-    def delete_stack_by_name(self, name: str, endpoint_id: int) -> dict:
-
-        r = requests.get(
-            f"{self.__portainer_connection_str}/api/stacks", 
-            headers=self.__connection_headers,
-            verify=self.use_ssl,
-        )
-        
-        r.raise_for_status()
-        data = format_stack_info_generator(r.json())
-        
-        stack_id = None
-
-        for stack in data:
-            if stack[2] == name:
-                stack_id = stack[0]
-                break 
-        else:
-            raise Exception(f"Stack {name} not found in the database.")
-
-        logging.getLogger('stdout').debug(f"Deleting stack {name}...")
-        return self.delete_stack_by_id(stack_id, endpoint_id)
+        parser = self.add_parser(name, **kwargs)
+        self._builders[name] = (builder, parser)
+        return parser
 
-    @error_handler
-    def delete_stack(self, endpoint_id: int, stack_name: str=None, stack_id: int=None) -> dict:
-        """Delete a stack.
+    def build(self, name: str) -> None:
+        """Populate a sub-parser if it was not populated yet.
 
         Args:
-            endpoint_id (int): Id of the endpoint in Portainer.
-            stack_name (str): Name of the stack in Portainer.
-            stack_id (int): Id of the stack in Portainer.
-
-        Returns:
-            dict: Dictionary with the status and detail of the operation.
+            name (str): Name of the sub-command.
         """
-        if not stack_name and not stack_id:
-            raise Exception('Invalid stack', 'Stack name or id is required.')
-
-        # Takes stack_name only if stack_id is not provided  
-        if stack_name and not stack_id:
-            r = requests.get(
-                f"{self.__portainer_connection_str}/api/stacks", 
-                headers=self.__connection_headers,
-                verify=self.use_ssl,
-            )
-            r.raise_for_status()
-            data = format_stack_info_generator(r.json())
-            
-            stack_id = None
+        builder, parser = self._builders.pop(name, (None, None))
+        if builder:
+            builder(parser)
 
-            for stack in data:
-                if stack[2] == stack_name:
-                    stack_id = stack[0]
-                    break 
-            else:
-                raise Exception(f"Stack {stack_name} not found in the database.")
+    def __call__(self, parser, namespace, values, option_string=None):
+        self.build(values[0])
+        super().__call__(parser, namespace, values, option_string)
 
-        # Takes stack_id and request portainer to delete the stack
-        params = {
-            "endpointId": endpoint_id,
-            "external": False
-        }
-        r = requests.delete(
-            f"{self.__portainer_connection_str}/api/stacks/{stack_id}", 
-            headers=self.__connection_headers,
-            verify=self.use_ssl,
-            params=params
-        )
-        
-        r.raise_for_status()
-        logging.getLogger('stdout').info("Deleted successfully!!!")
-        return generate_response('Stack(s) deleted successfully', status=True, code=r.status_code)
 
 class PortainerDeployer:
     """Manage Portainer's Stacks usgin its API throught Command Line.
@@ -314,6 +77,13 @@ class PortainerDeployer:
         else:
             update_config_dir(path_to_file='/this/is/a/dummy/path/please/create/one.conf', verify=False)
 
+        # Portainer instance the commands run against, None for the default PORTAINER section
+        self.instance = None
+        self.instance_section = DEFAULT_INSTANCE_SECTION
+
+        # API consumers kept between commands by config section, only when running as a daemon
+        self._api_consumers = None
+
         self.parser = self.__parser()
         
         
@@ -329,19 +99,82 @@ class PortainerDeployer:
         """
         @wraps(method)
         def wrapper(self, *args, **kwargs):
-            # Set API consummer object when not in config mode
-            self.api_consumer = PortainerAPIConsumer(api_config_path=self.PATH_TO_CONFIG)
-            return method(self, *args, **kwargs)
+            # Run the command once per Portainer instance when they are selected
+            if self.instance is None and args:
+                try:
+                    instances = self._selected_instances(args[0])
+                except ValueError as e:
+                    return generate_response('Invalid instance', str(e))
+
+                if instances:
+                    return self._fan_out(wrapper, instances, *args, **kwargs)
+
+            # Set API consummer object when not in config mode. It is imported here, so that
+            # commands not using the API do not pay the import of requests and urllib3
+            self.api_consumer = self._new_api_consumer()
+
+            # Endpoint names are resolved to ids once, before the command runs
+            if args:
+                error = self._resolve_endpoint_names(args[0])
+                if error:
+                    return error
+
+            # The deploy manifest is written once per command, whatever the number of stacks deployed
+            with self.api_consumer.batch():
+                return method(self, *args, **kwargs)
         return wrapper
 
 
+    def keep_api_consumers(self) -> None:
+        """Keep the API consumers between commands, with their connection pools and stack indexes, instead of creating
+        one per command. They are created again when the config file changes.
+        """
+        from threading import Lock
+
+        self._api_consumers = {'lock': Lock(), 'mtime': None, 'consumers': {}}
+
+    def _new_api_consumer(self):
+        """Get the API consumer of the current instance, a kept one when running as a daemon.
+
+        Returns:
+            PortainerAPIConsumer: API consumer.
+        """
+        from .api import PortainerAPIConsumer
+
+        if self._api_consumers is None:
+            return PortainerAPIConsumer(api_config_path=self.PATH_TO_CONFIG, section=self.instance_section)
+
+        # Shared with the copies of _fan_out, which run concurrently
+        with self._api_consumers['lock']:
+            try:
+                mtime = path.getmtime(self.PATH_TO_CONFIG)
+            except OSError:
+                mtime = None
+            if mtime != self._api_consumers['mtime']:
+                self._api_consumers.update(mtime=mtime, consumers={})
+
+            consumers = self._api_consumers['consumers']
+            if self.instance_section not in consumers:
+                consumers[self.instance_section] = PortainerAPIConsumer(api_config_path=self.PATH_TO_CONFIG, section=self.instance_section)
+            return consumers[self.instance_section]
+
+
     def run(self):
         """Run the main function.
         """        
         # Set arguments
         parser_args = self.parser.parse_args(args=None if len(sys.argv) > 2 else [sys.argv[1], '-h'] if len(sys.argv) == 2 else ['-h'])
-        
-        response = parser_args.func(parser_args)
+
+        if parser_args.profile or parser_args.metrics_file:
+            metrics.enable()
+
+        response = self._delegate(parser_args) if len(sys.argv) > 2 else None
+        if response is None:
+            with metrics.timer('command', command=parser_args.subparser_name):
+                response = parser_args.func(parser_args)
+
+        if metrics.enabled:
+            self._report_metrics(parser_args)
 
         if response['status']:
             # Exits with success
@@ -350,6 +183,57 @@ class PortainerDeployer:
             self._error_handler(response['message'], response['details'])
 
 
+    def _delegate(self, args: argparse.Namespace) -> dict:
+        """Run the command in the daemon started with the serve sub-command, if one is running. Commands asking for
+        confirmation, watching files or recording metrics always run locally.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+
+        Returns:
+            dict: Response of the daemon, or None if the command must run locally.
+        """
+        if args.subparser_name not in DAEMON_COMMANDS or metrics.enabled or getattr(args, 'watch', False):
+            return None
+
+        if hasattr(args, 'y') and not args.y and (args.subparser_name in ('remove', 'apply') or getattr(args, 'redeploy', False)):
+            return None
+
+        from .daemon import daemon_running, delegate
+
+        # stdin is left unread when no daemon runs, so the command can stream it instead of holding it in memory
+        if not daemon_running():
+            return None
+
+        # The daemon does not share the stdin of the client, so it is sent along with the command
+        stdin = None
+        if getattr(args, 'max_stdin_size', None) is not None and args.stack is None and not args.path:
+            try:
+                stdin = read_stdin(max_size=args.max_stdin_size)
+            except (ValueError, UnicodeDecodeError) as e:
+                return generate_response('Invalid stack from stdin', str(e))
+
+        response = delegate(sys.argv[1:], stdin=stdin)
+        if response is None and stdin is not None:
+            args.stack = stdin
+        return response
+
+    def _report_metrics(self, args: argparse.Namespace) -> None:
+        """Print the breakdown of the recorded timings and write them to the metrics file, if requested.
+
+        Args:
+            args (argparse.Namespace): Arguments of the main parser.
+        """
+        if args.profile:
+            metrics.report()
+
+        if args.metrics_file:
+            try:
+                metrics.write(args.metrics_file, metrics_format=args.metrics_format, command=args.subparser_name)
+            except OSError as e:
+                logging.getLogger('stdout').error(f'Could not write metrics to {args.metrics_file}: {e}')
+
+
     def __parser(self) -> argparse.ArgumentParser:
         """Parse and handle given arguments.
 
@@ -365,16 +249,79 @@ class PortainerDeployer:
         )
         
         parser.add_argument('--version', '-v', action='version', version=f'{PROG} {VERSION} ({PHASE})', help="Show program's version and exit.")
-        subparsers = parser.add_subparsers(help='Sub-commands for actions', dest='subparser_name')
+        parser.add_argument('--profile', action='store_true', help='Print a breakdown of the time spent per phase (config, yaml, http calls, output) to stderr at exit.')
+        parser.add_argument('--metrics-file', dest='metrics_file', metavar='PATH', default=None, help='Write the time spent per phase to a file at exit, as Prometheus text for .prom files and JSON otherwise.')
+        parser.add_argument('--metrics-format', dest='metrics_format', choices=('json', 'prometheus'), default=None, help='Format of the metrics file, overriding the one guessed from its extension.')
+        subparsers = parser.add_subparsers(help='Sub-commands for actions', dest='subparser_name', action=LazySubParsersAction)
         
         parser.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
                     help=DEFAULT_HELP_MESSAGE)
         
-        # ========================== Sub-command get ==========================
-        parser_get = subparsers.add_parser('get',
+        # Sub-commands arguments are only added when the sub-command is invoked
+        subparsers.add_lazy_parser('get', self.__build_get_parser,
             description='Get stack info from Portainer.',
             add_help=False
         )
+
+        subparsers.add_lazy_parser('deploy', self.__build_deploy_parser,
+            description='Deploy stacks from a local file or stdin.',
+            add_help=False
+        )
+
+        subparsers.add_lazy_parser('deploy-batch', self.__build_deploy_batch_parser,
+            description='Deploy many stacks from local files or directories to one or more endpoints concurrently.',
+            add_help=False
+        )
+
+        subparsers.add_lazy_parser('remove', self.__build_remove_parser,
+            description='Remove a stack from Portainer.',
+            add_help=False
+        )
+
+        subparsers.add_lazy_parser('plan', self.__build_plan_parser,
+            description='Show the actions needed to bring the stacks of Portainer to the state declared in a plan file.',
+            add_help=False
+        )
+
+        subparsers.add_lazy_parser('apply', self.__build_apply_parser,
+            description='Bring the stacks of Portainer to the state declared in a plan file, in the order of their dependencies.',
+            add_help=False
+        )
+
+        subparsers.add_lazy_parser('endpoints', self.__build_endpoints_parser,
+            description='List the endpoints of Portainer with their status.',
+            add_help=False
+        )
+
+        subparsers.add_lazy_parser('sync', self.__build_sync_parser,
+            description='Mirror the stacks and endpoints of Portainer into a local SQLite inventory.',
+            add_help=False
+        )
+
+        subparsers.add_lazy_parser('export', self.__build_export_parser,
+            description='Download the compose files of every stack into a local directory, only the ones changed since the last export.',
+            add_help=False
+        )
+
+        subparsers.add_lazy_parser('serve', self.__build_serve_parser,
+            description='Run a daemon answering the commands of this CLI over a Unix socket, keeping its connections and caches warm.',
+            add_help=False
+        )
+
+        subparsers.add_lazy_parser('config', self.__build_config_parser,
+            description='Configure Portainer CLI.',
+            add_help=False
+        )
+
+        return parser
+        
+
+    def __build_get_parser(self, parser_get: argparse.ArgumentParser) -> None:
+        """Add the arguments of the get sub-command.
+
+        Args:
+            parser_get (argparse.ArgumentParser): Sub-parser to be populated.
+        """
         
         parser_get.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
                     help=DEFAULT_HELP_MESSAGE)
@@ -402,23 +349,62 @@ class PortainerDeployer:
             help="Gets all stacks",   
         )
 
-        parser_get.set_defaults(func=self._get_sub_command)
+        parser_get.add_argument('--endpoint',
+            '-e',
+            action='store',
+            type=endpoint_ref,
+            help="Only list stacks of this endpoint, by Id or name.",
+        )
 
+        parser_get.add_argument('--name-prefix',
+            action='store',
+            type=str,
+            help="Only list stacks whose name starts with this prefix",
+        )
 
-        # ========================== Sub-command deploy ==========================
-        parser_deploy = subparsers.add_parser(
-            'deploy',
-            description='Deploy stacks from a local file or stdin.',
-            add_help=False)
+        parser_get.add_argument('--output',
+            '-o',
+            action='store',
+            choices=OUTPUT_FORMATS,
+            help="Output format. json and ndjson are written as the stacks arrive. Defaults to table.",
+            default='table'
+        )
+
+        parser_get.add_argument('--columns',
+            action='store',
+            type=str,
+            help=f"Comma separated columns to print, from: {', '.join(STACK_COLUMNS)}. Defaults to {','.join(DEFAULT_STACK_COLUMNS)}.",
+        )
+
+        parser_get.add_argument('--offline',
+            action='store_true',
+            help="Answer from the local inventory filled by the sync sub-command, without requesting Portainer.",
+        )
 
+        self.__add_instance_arguments(parser_get)
+
+        parser_get.set_defaults(func=self._get_sub_command)
+
+    def __build_deploy_parser(self, parser_deploy: argparse.ArgumentParser) -> None:
+        """Add the arguments of the deploy sub-command.
+
+        Args:
+            parser_deploy (argparse.ArgumentParser): Sub-parser to be populated.
+        """
         parser_deploy.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
                     help=DEFAULT_HELP_MESSAGE)
 
         parser_deploy.add_argument('stack',
             action='store',
             nargs='?',
-            help="Docker Compose string for the stack.",
-            default=(None if sys.stdin.isatty() else ''.join(sys.stdin.readlines())))
+            help="Docker Compose string for the stack. If neither it nor --path are set, the stack is read from stdin.",
+            default=None)
+
+        parser_deploy.add_argument('--max-stdin-size',
+            action='store',
+            type=int,
+            help=f'Maximum size in bytes of a stack read from stdin. Defaults to {DEFAULT_MAX_STDIN_SIZE}.',
+            default=DEFAULT_MAX_STDIN_SIZE)
 
         
         parser_deploy.add_argument('--path',
@@ -445,10 +431,68 @@ class PortainerDeployer:
             default=[]
         )
 
+        parser_deploy.add_argument('--vars-file',
+            action='store',
+            type=str,
+            help="Deploy the stack as a template: yaml or JSON file with the values of its ${{ name }} placeholders, or a list of them to deploy a stack per item. --name can hold placeholders too, i.e. web-${{ customer }}.",
+            default=None
+        )
+
+        parser_deploy.add_argument('--var',
+            action='extend',
+            type=str,
+            nargs='+',
+            help="Deploy the stack as a template, setting the value of a placeholder in every variant. i.e. tag=1.2 customer=acme",
+            default=[]
+        )
+
+        parser_deploy.add_argument('--concurrency',
+            '-c',
+            action='store',
+            type=int,
+            help='Maximum number of template variants deployed at the same time. Defaults to 4.',
+            default=4
+        )
+
         parser_deploy.add_argument('--redeploy', 
             '-R',
             action='store_true', 
-            help="Re-deply in case of stacks exists.",
+            help="Re-deploy in case of stacks exists. The stack is updated in place, and nothing is done if its content did not change.",
+        )
+
+        parser_deploy.add_argument('--pull-image',
+            action='store_true',
+            help="Pull the images again when the stack is redeployed.",
+        )
+
+        parser_deploy.add_argument('--force',
+            action='store_true',
+            help="Deploy the stack even if the local deploy manifest says its content did not change.",
+        )
+
+        parser_deploy.add_argument('--verify',
+            action='store_true',
+            help="Check against Portainer that an unchanged stack still exists with the same content before skipping it.",
+        )
+
+        parser_deploy.add_argument('--watch',
+            '-w',
+            action='store_true',
+            help="Keep running and redeploy the stack every time the file given by --path changes. Stop it with Ctrl+C.",
+        )
+
+        parser_deploy.add_argument('--watch-interval',
+            action='store',
+            type=float,
+            help="Seconds between checks of the file when it can not be watched with inotify. Defaults to 1.",
+            default=1.0
+        )
+
+        parser_deploy.add_argument('--debounce',
+            action='store',
+            type=float,
+            help="Seconds the file must stay unchanged before redeploying, so a burst of writes is deployed once. Defaults to 0.5.",
+            default=0.5
         )
 
         parser_deploy.add_argument('-y',
@@ -458,67 +502,310 @@ class PortainerDeployer:
 
         parser_deploy.add_argument('--endpoint', 
             '-e',
-            required=True if len(sys.argv) > 2 else False,
             action='store',
-            type=int,
-            help='Endpoint Id to deploy the stack.'
+            type=endpoint_ref,
+            help='Endpoint Id or name to deploy the stack.'
         )
 
+        self.__add_instance_arguments(parser_deploy)
+
         parser_deploy.set_defaults(func=self._deploy_sub_command)
 
+    def __build_deploy_batch_parser(self, parser_deploy_batch: argparse.ArgumentParser) -> None:
+        """Add the arguments of the deploy-batch sub-command.
 
-        # ========================== Sub-command remove ==========================
-        parser_remove = subparsers.add_parser('remove',
-            description='Remove a stack from Portainer.',
-            add_help=False
-        )
-        
-        parser_remove.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
+        Args:
+            parser_deploy_batch (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        parser_deploy_batch.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
                     help=DEFAULT_HELP_MESSAGE)
 
-        # Mutually exclusive arguments for --name and --id
-        mutually_exclusive_name_id_rm = parser_remove.add_mutually_exclusive_group()
-
-        mutually_exclusive_name_id_rm.add_argument('--id',
+        parser_deploy_batch.add_argument('paths',
             action='store',
-            help="Id of the stack remove",          
-            type=int
-        )
+            nargs='*',
+            help="Docker Compose files or directories containing them (.yml and .yaml). Each stack is named after its file.",
+            default=[])
 
-        mutually_exclusive_name_id_rm.add_argument('--name',
-            '-n',
-            action='store',
-            help="Name of the stack to remove",   
-            type=str
+        parser_deploy_batch.add_argument('--endpoint', 
+            '-e',
+            action='extend',
+            type=endpoint_ref,
+            nargs='+',
+            help='Endpoint Ids or names to deploy every stack to.',
+            default=[]
         )
 
-        parser_remove.add_argument('--endpoint', 
-            '-e',
-            required=True if len(sys.argv) > 2 else False,
+        parser_deploy_batch.add_argument('--concurrency', 
+            '-c',
             action='store',
             type=int,
-            help='Endpoint Id from the stack to remove.'
+            help='Maximum number of stacks deployed at the same time. Defaults to 4.',
+            default=4
         )
 
-
-        parser_remove.add_argument('-y',
+        parser_deploy_batch.add_argument('--force',
             action='store_true',
-            help='Accept removal action and do not ask for confirmation.',
+            help="Deploy every stack even if the local deploy manifest says its content did not change.",
         )
 
-        parser_remove.set_defaults(func=self._remove_sub_command)
+        parser_deploy_batch.set_defaults(func=self._deploy_batch_sub_command)
 
+    def __add_instance_arguments(self, parser: argparse.ArgumentParser) -> None:
+        """Add the arguments to select the Portainer instances a sub-command runs against.
 
-        # ========================== Sub-command config ==========================
-        parser_config = subparsers.add_parser(
-            'config', 
-            description='Configure Portainer CLI.',
-            add_help=False)
-        
-        parser_config.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
-            help=DEFAULT_HELP_MESSAGE)
+        Args:
+            parser (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        mutually_exclusive_instances = parser.add_mutually_exclusive_group()
 
-        mutually_exclusive_config = parser_config.add_mutually_exclusive_group() 
+        mutually_exclusive_instances.add_argument('--instance',
+            '-i',
+            action='store',
+            type=str,
+            help=f'Comma separated names of the Portainer instances to run against, configured as [PORTAINER:NAME] sections. "{DEFAULT_INSTANCE}" is the [PORTAINER] section.',
+        )
+
+        mutually_exclusive_instances.add_argument('--all-instances',
+            action='store_true',
+            help='Run against every configured Portainer instance concurrently.',
+        )
+
+    def __add_plan_arguments(self, parser: argparse.ArgumentParser) -> None:
+        """Add the arguments shared by the plan and apply sub-commands.
+
+        Args:
+            parser (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        parser.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
+                    help=DEFAULT_HELP_MESSAGE)
+
+        parser.add_argument('file',
+            action='store',
+            help='yaml plan file declaring the stacks, with their file, endpoint, name, update_keys and depends_on.'
+        )
+
+        parser.add_argument('--verify',
+            action='store_true',
+            help='Compare every existing stack with its file in Portainer, even when the local deploy manifest says it is unchanged.'
+        )
+
+        parser.add_argument('--concurrency',
+            '-c',
+            action='store',
+            type=int,
+            default=8,
+            help='Maximum number of requests or actions run at the same time. Defaults to 8.'
+        )
+
+    def __build_plan_parser(self, parser_plan: argparse.ArgumentParser) -> None:
+        """Add the arguments of the plan sub-command.
+
+        Args:
+            parser_plan (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        self.__add_plan_arguments(parser_plan)
+
+        parser_plan.set_defaults(func=self._plan_sub_command)
+
+    def __build_apply_parser(self, parser_apply: argparse.ArgumentParser) -> None:
+        """Add the arguments of the apply sub-command.
+
+        Args:
+            parser_apply (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        self.__add_plan_arguments(parser_apply)
+
+        parser_apply.add_argument('--pull-image',
+            action='store_true',
+            help='Pull the images again when a stack is updated.'
+        )
+
+        parser_apply.add_argument('-y',
+            action='store_true',
+            help='Apply the plan without asking for confirmation.'
+        )
+
+        parser_apply.set_defaults(func=self._apply_sub_command)
+
+    def __build_endpoints_parser(self, parser_endpoints: argparse.ArgumentParser) -> None:
+        """Add the arguments of the endpoints sub-command.
+
+        Args:
+            parser_endpoints (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        parser_endpoints.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
+                    help=DEFAULT_HELP_MESSAGE)
+
+        parser_endpoints.add_argument('--output',
+            '-o',
+            action='store',
+            choices=('table', 'json'),
+            help='Format the endpoints are printed in. Defaults to table.',
+            default='table'
+        )
+
+        self.__add_instance_arguments(parser_endpoints)
+
+        parser_endpoints.set_defaults(func=self._endpoints_sub_command)
+
+    def __build_sync_parser(self, parser_sync: argparse.ArgumentParser) -> None:
+        """Add the arguments of the sync sub-command.
+
+        Args:
+            parser_sync (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        parser_sync.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
+                    help=DEFAULT_HELP_MESSAGE)
+
+        parser_sync.set_defaults(func=self._sync_sub_command)
+
+    def __build_export_parser(self, parser_export: argparse.ArgumentParser) -> None:
+        """Add the arguments of the export sub-command.
+
+        Args:
+            parser_export (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        parser_export.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
+                    help=DEFAULT_HELP_MESSAGE)
+
+        parser_export.add_argument('--dir',
+            '-d',
+            action='store',
+            type=str,
+            required=True,
+            help='Directory to write the compose files to, as <endpoint id>/<stack name>.yml.'
+        )
+
+        parser_export.add_argument('--endpoint',
+            '-e',
+            action='store',
+            type=endpoint_ref,
+            help='Only export the stacks of this endpoint, by Id or name.'
+        )
+
+        parser_export.add_argument('--concurrency',
+            '-c',
+            action='store',
+            type=int,
+            default=8,
+            help='Number of stack files downloaded at the same time. Defaults to 8.'
+        )
+
+        parser_export.add_argument('--force',
+            action='store_true',
+            help='Download every stack, even the ones unchanged since the last export.'
+        )
+
+        parser_export.add_argument('--prune',
+            action='store_true',
+            help='Remove the files of the exported stacks that no longer exist in Portainer.'
+        )
+
+        parser_export.set_defaults(func=self._export_sub_command)
+
+    def __build_remove_parser(self, parser_remove: argparse.ArgumentParser) -> None:
+        """Add the arguments of the remove sub-command.
+
+        Args:
+            parser_remove (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        
+        parser_remove.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
+                    help=DEFAULT_HELP_MESSAGE)
+
+        parser_remove.add_argument('--id',
+            action='store',
+            nargs='+',
+            help="Ids of the stacks to remove",          
+            type=int
+        )
+
+        parser_remove.add_argument('--name',
+            '-n',
+            action='store',
+            nargs='+',
+            help="Names of the stacks to remove",   
+            type=str
+        )
+
+        parser_remove.add_argument('--match',
+            action='store',
+            nargs='+',
+            metavar='PATTERN',
+            help="Remove the stacks whose name matches any of these glob patterns, i.e. 'pr-*'.",
+            type=str
+        )
+
+        parser_remove.add_argument('--regex',
+            action='store',
+            nargs='+',
+            metavar='REGEX',
+            help="Remove the stacks whose name contains a match of any of these regular expressions, i.e. '^pr-[0-9]+$'.",
+            type=str
+        )
+
+        parser_remove.add_argument('--endpoint', 
+            '-e',
+            action='store',
+            type=endpoint_ref,
+            help='Endpoint Id or name from the stacks to remove. Optional with --match and --regex, which match on every endpoint without it.'
+        )
+
+        parser_remove.add_argument('--concurrency',
+            action='store',
+            type=int,
+            default=8,
+            help='Number of stacks removed at the same time. Defaults to 8.'
+        )
+
+
+        parser_remove.add_argument('-y',
+            action='store_true',
+            help='Accept removal action and do not ask for confirmation.',
+        )
+
+        self.__add_instance_arguments(parser_remove)
+
+        parser_remove.set_defaults(func=self._remove_sub_command)
+
+    def __build_serve_parser(self, parser_serve: argparse.ArgumentParser) -> None:
+        """Add the arguments of the serve sub-command.
+
+        Args:
+            parser_serve (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        parser_serve.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
+                    help=DEFAULT_HELP_MESSAGE)
+
+        parser_serve.add_argument('--socket',
+            action='store',
+            type=str,
+            metavar='PATH',
+            help='Path of the Unix socket. Defaults to $PORTAINER_DEPLOYER_SOCKET, or portainer-deployer.sock in $XDG_RUNTIME_DIR.',
+            default=None
+        )
+
+        parser_serve.add_argument('--idle-timeout',
+            action='store',
+            type=float,
+            metavar='SECONDS',
+            help='Stop the daemon after this many seconds without commands. Defaults to never.',
+            default=None
+        )
+
+        parser_serve.set_defaults(func=self._serve_sub_command)
+
+    def __build_config_parser(self, parser_config: argparse.ArgumentParser) -> None:
+        """Add the arguments of the config sub-command.
+
+        Args:
+            parser_config (argparse.ArgumentParser): Sub-parser to be populated.
+        """
+        
+        parser_config.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS,
+            help=DEFAULT_HELP_MESSAGE)
+
+        mutually_exclusive_config = parser_config.add_mutually_exclusive_group() 
 
         mutually_exclusive_config.add_argument('--set',
             '-s',
@@ -541,9 +828,129 @@ class PortainerDeployer:
             help='Set Portainer Deployer absulute config path. e.g. --config-path /abusolute/path/to/default.conf')
 
         parser_config.set_defaults(func=self._config_sub_command)
- 
-        return parser
-        
+
+
+    def _selected_instances(self, args: argparse.Namespace) -> list:
+        """Get the Portainer instances selected with --instance or --all-instances.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+
+        Raises:
+            ValueError: If an instance is not configured.
+
+        Returns:
+            list: Tuples of instance name and config section, empty if no instance was selected.
+        """
+        names = getattr(args, 'instance', None)
+        if not names and not getattr(args, 'all_instances', False):
+            return []
+
+        config = ConfigManager(self.PATH_TO_CONFIG).config
+        available = {}
+        if config.has_section(DEFAULT_INSTANCE_SECTION):
+            available[DEFAULT_INSTANCE] = DEFAULT_INSTANCE_SECTION
+        for section in config.sections():
+            if section.startswith(f'{DEFAULT_INSTANCE_SECTION}:'):
+                available[section.split(':', 1)[1].lower()] = section
+
+        if not names:
+            # The default section is only an instance of its own when it is configured
+            instances = [(name, section) for name, section in available.items() if config[section].get('url')]
+            if not instances:
+                raise ValueError('There are no Portainer instances configured.')
+            return instances
+
+        requested = list(dict.fromkeys(name.strip().lower() for name in names.split(',') if name.strip()))
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise ValueError(f'Unknown instances: {", ".join(unknown)}. Configured instances are: {", ".join(available)}.')
+
+        return [(name, available[name]) for name in requested]
+
+    def _resolve_endpoint_names(self, args: argparse.Namespace) -> dict:
+        """Replace the endpoint names given with --endpoint by their ids, using the endpoint index of the API consumer.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments, updated in place.
+
+        Returns:
+            dict: Error response if an endpoint could not be resolved, None otherwise.
+        """
+        from .base import PortainerAPIError
+
+        endpoint = getattr(args, 'endpoint', None)
+        endpoints = endpoint if isinstance(endpoint, list) else [endpoint]
+        if not any(isinstance(item, str) for item in endpoints):
+            return None
+
+        try:
+            resolved = [self.api_consumer.resolve_endpoint_id(item) if isinstance(item, str) else item for item in endpoints]
+        except EndpointNotFoundError as e:
+            return generate_response(str(e), f'Run "{PROG} endpoints" to list the available endpoints.', code=404)
+        except PortainerAPIError as e:
+            return e.response
+        except Exception as e:
+            return generate_response('Endpoints could not be listed', str(e), code=500)
+
+        args.endpoint = resolved if isinstance(endpoint, list) else resolved[0]
+        return None
+
+    def _fan_out(self, method, instances: list, args: argparse.Namespace, *method_args, **method_kwargs) -> dict:
+        """Run a sub-command against several Portainer instances concurrently, each one with its own API consumer.
+
+        Args:
+            method (function): Sub-command function decorated with use_api.
+            instances (list): Tuples of instance name and config section.
+            args (argparse.Namespace): Parsed arguments.
+
+        Returns:
+            dict: Aggregated response, failed if any instance failed.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from copy import copy
+
+        names = ', '.join(name for name, _ in instances)
+
+        if getattr(args, 'watch', False) and len(instances) > 1:
+            return generate_response('Invalid use of --watch', 'A stack can only be watched on a single instance.')
+
+        # Asked once for every instance instead of once per instance
+        if hasattr(args, 'y') and not args.y and (method.__name__ == '_remove_sub_command' or getattr(args, 'redeploy', False)):
+            if not request_confirmation(f'It will run on {len(instances)} instances: {names}. Are you sure?'):
+                return generate_response('Operation was canceled', status=False)
+            args.y = True
+
+        # stdin can only be read once, so it is read before running on every instance
+        if getattr(args, 'max_stdin_size', None) is not None and args.stack is None and not args.path:
+            try:
+                args.stack = read_stdin(max_size=args.max_stdin_size)
+            except (ValueError, UnicodeDecodeError) as e:
+                return generate_response('Invalid stack from stdin', str(e))
+
+        def run(instance):
+            clone = copy(self)
+            clone.instance, clone.instance_section = instance
+            try:
+                return method(clone, argparse.Namespace(**vars(args)), *method_args, **method_kwargs)
+            except Exception as e:
+                return generate_response(str(e), code=500)
+
+        with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+            results = list(executor.map(run, instances))
+
+        for (name, _), result in zip(instances, results):
+            log = logging.getLogger('stdout').info if result['status'] else logging.getLogger('stdout').error
+            log(f"[{name}] {result['message']}")
+
+        failed = [(name, result) for (name, _), result in zip(instances, results) if not result['status']]
+        if failed:
+            return generate_response(
+                f'{len(failed)} of {len(results)} instances failed.',
+                '\n'.join(f"{name}: {result['message']}" for name, result in failed)
+            )
+
+        return generate_response(f'Completed on {len(results)} instances: {names}.', status=True)
 
     def _error_handler(self, error_message: str, error_detail: str) -> None: 
         """Prints an error message and exits with error code.
@@ -555,6 +962,32 @@ class PortainerDeployer:
         self.parser.error(f'{error_message}\n{error_detail}')
 
 
+    def _serve_sub_command(self, args: argparse.Namespace) -> dict:
+        """Serve sub-command. Runs the daemon until it is interrupted or idle.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+        """
+        from .daemon import DeployerDaemon
+        import signal
+
+        daemon = DeployerDaemon(self, socket_path=args.socket, idle_timeout=args.idle_timeout)
+
+        # Stopped by a service manager as with Ctrl+C, so the socket is removed
+        def interrupt(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, interrupt)
+
+        logging.getLogger('stdout').info(f'Listening on {daemon.socket_path}')
+        try:
+            daemon.serve()
+        except KeyboardInterrupt:
+            pass
+        except OSError as e:
+            return generate_response('Could not start the daemon', str(e))
+
+        return generate_response('Daemon stopped', status=True)
+
     def _config_sub_command(self, args) -> dict:
         """Config sub-command.
 
@@ -573,6 +1006,8 @@ class PortainerDeployer:
 
         config = ConfigManager(self.PATH_TO_CONFIG)
         if args.set:
+            # Validate every pair before touching the file, then write them all at once
+            updates = []
             for pair in args.set:
                 splited = pair.split('=')
                 if len(splited) != 2:
@@ -583,7 +1018,11 @@ class PortainerDeployer:
                 if len(section_key) != 2:
                     return generate_response(f'Invalid config pair: {pair}')
                 section, key = section_key  
-                config.set_var(key=key, new_value=value, section=section)
+                updates.append((section, key, value))
+
+            with config.batch():
+                for section, key, value in updates:
+                    config.set_var(key=key, new_value=value, section=section)
 
             logging.getLogger('stdout').info(f'Config updated for: {args.set}')
 
@@ -602,7 +1041,6 @@ class PortainerDeployer:
         return generate_response(f'Config operation {"get" if args.get else "set" } completed successfully', status=True)
 
 
-    @use_api
     def _get_sub_command(self , args: argparse.Namespace) -> dict:
         """Get sub-command default function. Excutes get functions according given arguments.
 
@@ -610,14 +1048,406 @@ class PortainerDeployer:
             args (argparse.Namespace): Parsed arguments. 
         """        
 
+        # Listing filters and output options are only passed when set
+        # The endpoint is added once resolved, as it can be given by name
+        options = {'name_prefix': args.name_prefix} if args.name_prefix is not None else {}
+
+        if args.output != 'table':
+            options['output'] = args.output
+
+        if args.columns:
+            columns = [column.strip() for column in args.columns.split(',') if column.strip()]
+            unknown = [column for column in columns if column not in STACK_COLUMNS]
+            if unknown:
+                return generate_response(f'Invalid columns: {", ".join(unknown)}', f'Available columns are: {", ".join(STACK_COLUMNS)}.')
+            options['columns'] = columns
+
+        try:
+            instances = self._selected_instances(args)
+        except ValueError as e:
+            return generate_response('Invalid instance', str(e))
+
+        if args.offline:
+            return self._get_offline(args, options, instances)
+
+        if not instances:
+            return self._get_online(args, options)
+
+        # Stacks of every instance are merged into a single output with an instance column
+        columns = options.get('columns') or list(DEFAULT_STACK_COLUMNS)
+        with StackWriter(output=options.get('output', 'table'), columns=columns if 'instance' in columns else ['instance', *columns]) as writer:
+            return self._get_online(args, {**options, 'writer': writer})
+
+    @use_api
+    def _get_online(self, args: argparse.Namespace, options: dict) -> dict:
+        """Get stacks from Portainer.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+            options (dict): Listing filters and output options passed to the API consumer.
+        """
+        if self.instance is not None and 'writer' in options:
+            options = {**options, 'writer': options['writer'].tagged(Instance=self.instance)}
+
+        if args.endpoint is not None:
+            options = {**options, 'endpoint_id': args.endpoint}
+
         if args.all:
-            response = self.api_consumer.get_stack()
+            response = self.api_consumer.get_stack(**options)
         else:
-            response = self.api_consumer.get_stack(name=args.name, stack_id=args.id)
+            response = self.api_consumer.get_stack(name=args.name, stack_id=args.id, **options)
 
         return response
+
+    def _get_offline(self, args: argparse.Namespace, options: dict, instances: list = None) -> dict:
+        """Get stacks from the local inventory, without requesting Portainer.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+            options (dict): Listing filters and output options.
+            instances (list, optional): Tuples of instance name and config section to read the inventories of. Defaults to the default instance.
+        """
+        from .cache import Inventory
+
+        stacks = []
+        for name, section in instances or [(None, DEFAULT_INSTANCE_SECTION)]:
+            config = ConfigManager(self.PATH_TO_CONFIG, default_section=section)
+            inventory = Inventory(
+                config.url,
+                db_path=config.get_var_or_default('INVENTORY_PATH', None),
+                cache_dir=config.get_var_or_default('CACHE_DIR', None)
+            )
+
+            if not inventory.exists():
+                return generate_response('No inventory found', f'Run "{PROG} sync" to create it before using "--offline".')
+
+            try:
+                endpoint_id = args.endpoint
+                if isinstance(endpoint_id, str):
+                    endpoint_id = inventory.endpoint_id(endpoint_id)
+                    if endpoint_id is None:
+                        return generate_response(f'Endpoint {args.endpoint} not found in the inventory.', code=404)
+
+                found = inventory.query_stacks(
+                    stack_id=None if args.all else args.id,
+                    name=None if args.all else args.name,
+                    endpoint_id=endpoint_id,
+                    name_prefix=options.get('name_prefix')
+                )
+            finally:
+                inventory.close()
+
+            stacks.extend({**stack, 'Instance': name} for stack in found)
+
+        if not args.all and (args.id or args.name) and not stacks:
+            return generate_response(f'Stack {args.name or args.id} not found in the inventory.', code=404)
+
+        columns = options.get('columns') or list(DEFAULT_STACK_COLUMNS)
+        if instances and 'instance' not in columns:
+            columns = ['instance', *columns]
+
+        with StackWriter(output=options.get('output', 'table'), columns=columns) as writer:
+            for stack in stacks:
+                writer.write(stack)
+
+        return generate_response('Stack(s) read from the inventory', status=True)
+
+    @use_api
+    def _sync_sub_command(self, args: argparse.Namespace) -> dict:
+        """Sync sub-command default function. Mirrors Portainer into the local inventory.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+        """
+        return self.api_consumer.sync_inventory()
         
 
+    @use_api
+    def _plan_sub_command(self, args: argparse.Namespace) -> dict:
+        """Plan sub-command default function. Prints the actions apply would run, without changing anything.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+        """
+        actions, error = self._build_plan(args)
+        if error:
+            return error
+
+        self.__print_plan(actions)
+        return generate_response(self.__plan_summary(actions), status=True)
+
+    @use_api
+    def _apply_sub_command(self, args: argparse.Namespace) -> dict:
+        """Apply sub-command default function. Runs the actions of the plan in parallel, every one as soon as the
+        stacks it depends on are done.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+        """
+        from .plan import run_actions
+
+        actions, error = self._build_plan(args)
+        if error:
+            return error
+
+        changes = [action for action in actions if action.kind != 'noop']
+        if not changes:
+            return generate_response(f'Nothing to apply. {self.__plan_summary(actions)}', status=True)
+
+        self.__print_plan(actions)
+        if not args.y and not request_confirmation(f'Are you sure you want to apply these {len(changes)} changes?'):
+            return generate_response('Apply was canceled', status=False)
+
+        def run(action) -> dict:
+            # The plan already compared the contents, so the deploy manifest is not used to skip them
+            if action.kind == 'create' and action.content is None:
+                return self.api_consumer.post_stack_from_file(path=action.path, name=action.name, endpoint_id=action.endpoint_id, force=True)
+            if action.kind == 'create':
+                return self.api_consumer.post_stack_from_str(stack=action.content, name=action.name, endpoint_id=action.endpoint_id, validate=False, force=True)
+            if action.kind == 'update':
+                return self.api_consumer.update_stack(
+                    stack=action.content,
+                    name=action.name,
+                    stack_id=action.stack_id,
+                    endpoint_id=action.endpoint_id,
+                    pull_image=args.pull_image,
+                    validate=False,
+                    force=True
+                )
+            if action.kind == 'delete':
+                return self.api_consumer.delete_stack(endpoint_id=action.endpoint_id, stack_id=action.stack_id)
+            return generate_response('Up to date', status=True)
+
+        workers = min(args.concurrency, len(changes))
+        self.api_consumer.ensure_pool_size(workers)
+        results = run_actions(actions, run, workers)
+
+        spacing_str = '{0:<8} {1:<12} {2:<30} {3:<8} {4}'
+        print(spacing_str.format('Action', 'Endpoint Id', 'Name', 'Status', 'Message'))
+        for action in changes:
+            result = results[action.key]
+            print(spacing_str.format(action.kind, action.endpoint_id, action.name, 'ok' if result['status'] else 'failed', result['message']))
+
+        failed = [f'Stack {action.name} ({action.kind}): {results[action.key]["message"]}' for action in changes if not results[action.key]['status']]
+        if failed:
+            return generate_response(f'{len(failed)} of {len(changes)} changes failed to be applied.', '\n'.join(failed))
+
+        return generate_response(f'{len(changes)} changes applied successfully.', status=True)
+
+    def _build_plan(self, args: argparse.Namespace) -> tuple:
+        """Compute the actions of a plan file. The stacks of Portainer are listed once, and only the existing stacks
+        whose content may have changed are downloaded to be compared, using a bounded pool of workers.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments of the plan or apply sub-commands.
+
+        Returns:
+            tuple: List of actions, and an error response if the plan could not be computed.
+        """
+        from .base import PortainerAPIError
+        from .plan import load_plan_file, compute_actions
+
+        if args.concurrency < 1:
+            return [], generate_response(f'Invalid concurrency: {args.concurrency}', 'The argument "--concurrency" must be greater than 0.')
+
+        try:
+            specs, prune = load_plan_file(args.file)
+        except FileNotFoundError:
+            return [], generate_response(f'File {args.file} not found.')
+        except ValueError as e:
+            return [], generate_response('Invalid plan file', str(e))
+
+        # Stack files are read, and edited with their update keys, before anything is requested
+        desired = {}
+        for spec in specs:
+            if spec.absent:
+                continue
+            try:
+                with open(spec.file, 'r') as f:
+                    content = f.read()
+                if spec.update_keys:
+                    content = render_compose(content, parse_update_pairs(spec.update_keys))
+                elif not validate_yaml(data=content):
+                    raise ValueError('Stack is not in a valid yaml format.')
+            except FileNotFoundError:
+                return [], generate_response(f'File {spec.file} of stack {spec.key} not found.')
+            except ValueError as e:
+                return [], generate_response(f'Invalid stack {spec.key}', str(e))
+            desired[spec.key] = content
+
+        try:
+            endpoint_ids = {spec.endpoint: self.api_consumer.resolve_endpoint_id(spec.endpoint) for spec in specs}
+            stacks = self.api_consumer.list_stacks()
+        except EndpointNotFoundError as e:
+            return [], generate_response(str(e), f'Run "{PROG} endpoints" to list the available endpoints.', code=404)
+        except PortainerAPIError as e:
+            return [], e.response
+        except Exception as e:
+            return [], generate_response('Stacks could not be listed', str(e), code=500)
+
+        remote = {}
+        for stack in stacks:
+            remote.setdefault((stack.get('EndpointId'), stack['Name']), stack)
+
+        # Stacks last deployed with the same content are unchanged, the others are compared with their file in Portainer
+        to_compare = []
+        for spec in specs:
+            stack = remote.get((endpoint_ids[spec.endpoint], spec.name))
+            if spec.absent or stack is None:
+                continue
+            if args.verify or not self.api_consumer.is_deployed(endpoint_ids[spec.endpoint], spec.name, content_hash(desired[spec.key]), stack_id=stack['Id']):
+                to_compare.append((spec, stack))
+
+        remote_contents = {}
+        if to_compare:
+            workers = min(args.concurrency, len(to_compare))
+            self.api_consumer.ensure_pool_size(workers)
+
+            from concurrent.futures import ThreadPoolExecutor
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    contents = list(executor.map(lambda item: self.api_consumer.get_stack_file(item[1]['Id']), to_compare))
+            except PortainerAPIError as e:
+                return [], e.response
+            except Exception as e:
+                return [], generate_response('Stack files could not be downloaded', str(e), code=500)
+            remote_contents = {spec.key: content for (spec, _), content in zip(to_compare, contents)}
+
+        # A stack removed while the plan was computed is created again
+        for (spec, stack), content in ((item, remote_contents[item[0].key]) for item in to_compare):
+            if content is None:
+                del remote[(endpoint_ids[spec.endpoint], spec.name)]
+
+        changes = {
+            spec.key: (
+                # Stacks without update keys are posted from their file when they are created
+                desired[spec.key] if spec.update_keys or spec.key in remote_contents else None,
+                spec.key in remote_contents and remote_contents[spec.key] is not None and content_hash(remote_contents[spec.key]) != content_hash(desired[spec.key])
+            )
+            for spec in specs if not spec.absent
+        }
+        return compute_actions(specs, endpoint_ids, remote, changes, prune=prune), None
+
+    @staticmethod
+    def __plan_summary(actions: list) -> str:
+        counts = {kind: sum(1 for action in actions if action.kind == kind) for kind in ('create', 'update', 'delete', 'noop')}
+        return f"Plan: {counts['create']} to create, {counts['update']} to update, {counts['delete']} to delete and {counts['noop']} unchanged."
+
+    @staticmethod
+    def __print_plan(actions: list) -> None:
+        spacing_str = '{0:<8} {1:<12} {2:<30} {3}'
+        print(spacing_str.format('Action', 'Endpoint Id', 'Name', 'After'))
+        for action in actions:
+            if action.kind != 'noop':
+                print(spacing_str.format(action.kind, action.endpoint_id, action.name, ', '.join(action.after) or '-'))
+
+    @use_api
+    def _endpoints_sub_command(self, args: argparse.Namespace) -> dict:
+        """Endpoints sub-command default function. Lists the endpoints of Portainer, refreshing the local endpoint index.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+        """
+        from .base import PortainerAPIError
+
+        try:
+            endpoints = self.api_consumer.list_endpoints()
+        except PortainerAPIError as e:
+            return e.response
+        except Exception as e:
+            return generate_response('Endpoints could not be listed', str(e), code=500)
+
+        rows = [
+            {
+                'Id': endpoint.get('Id'),
+                'Name': endpoint.get('Name'),
+                'Type': ENDPOINT_TYPES.get(endpoint.get('Type'), endpoint.get('Type')),
+                'Status': ENDPOINT_STATUSES.get(endpoint.get('Status'), endpoint.get('Status')),
+                'URL': endpoint.get('URL')
+            }
+            for endpoint in endpoints
+        ]
+        if self.instance is not None:
+            rows = [{'Instance': self.instance, **row} for row in rows]
+
+        if args.output == 'json':
+            import json
+            print(json.dumps(rows, indent=4))
+        else:
+            spacing_str = '{0:<8} {1:<30} {2:<20} {3:<8} {4}'
+            print(spacing_str.format('Id', 'Name', 'Type', 'Status', 'URL'))
+            for row in rows:
+                print(spacing_str.format(row['Id'], row['Name'], row['Type'], row['Status'], row['URL']))
+
+        return generate_response(f'{len(endpoints)} endpoints listed.', status=True)
+
+    @use_api
+    def _export_sub_command(self, args: argparse.Namespace) -> dict:
+        """Export sub-command default function. Lists the stacks once and downloads the files of the ones changed since
+        the last export using a bounded pool of workers.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+        """
+        from .base import PortainerAPIError
+        from .mirror import StackMirror
+
+        if args.concurrency < 1:
+            return generate_response(f'Invalid concurrency: {args.concurrency}', 'The argument "--concurrency" must be greater than 0.')
+
+        if args.prune and args.endpoint is not None:
+            return generate_response('Invalid use of --prune', 'Stacks can only be pruned from a complete export, without "--endpoint".')
+
+        try:
+            stacks = self.api_consumer.list_stacks(endpoint_id=args.endpoint)
+        except PortainerAPIError as e:
+            return e.response
+        except Exception as e:
+            return generate_response('Stacks could not be listed', str(e), code=500)
+
+        mirror = StackMirror(args.dir, self.api_consumer.portainer_url)
+        changed = [stack for stack in stacks if args.force or not mirror.is_current(stack)]
+
+        def export(stack: dict) -> dict:
+            try:
+                content = self.api_consumer.get_stack_file(stack['Id'])
+                if content is None:
+                    return generate_response(f"Stack {stack['Name']} was removed before it was exported.", code=404)
+                mirror.write(stack, content)
+                return generate_response('exported', status=True)
+            except PortainerAPIError as e:
+                return e.response
+            except Exception as e:
+                return generate_response(str(e))
+
+        results = []
+        if changed:
+            workers = min(args.concurrency, len(changed))
+            self.api_consumer.ensure_pool_size(workers)
+
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(export, changed))
+
+        removed = mirror.prune(stacks) if args.prune else []
+
+        # The stacks exported before a failure are recorded, so they are not downloaded again
+        mirror.save()
+
+        spacing_str = '{0:<8} {1:<12} {2:<30} {3:<8} {4}'
+        if changed:
+            print(spacing_str.format('Id', 'Endpoint Id', 'Name', 'Status', 'Message'))
+        for stack, result in zip(changed, results):
+            print(spacing_str.format(stack['Id'], stack.get('EndpointId'), stack['Name'], 'ok' if result['status'] else 'failed', result['message']))
+
+        summary = f'{len(changed)} stacks exported, {len(stacks) - len(changed)} unchanged' + (f' and {len(removed)} removed' if args.prune else '')
+        failed = [f"Stack {stack['Name']} ({stack['Id']}): {result['message']}" for stack, result in zip(changed, results) if not result['status']]
+        if failed:
+            return generate_response(f'{len(failed)} of {len(changed)} stacks failed to be exported.', '\n'.join(failed))
+
+        logging.getLogger('stdout').info(f'Stacks exported to {args.dir}')
+        return generate_response(f'{summary}.', status=True)
+
     @use_api
     def _deploy_sub_command(self, args: argparse.Namespace) -> dict:
         """Deploy sub-command default function. Excutes deploy functions according given arguments.
@@ -626,45 +1456,108 @@ class PortainerDeployer:
             args (argparse.Namespace): Parsed arguments. 
         """
         
+        if args.endpoint is None:
+            return generate_response('Missing endpoint', 'The argument "--endpoint" is required to deploy a stack.')
+
         if args.stack and args.path:
             logging.getLogger('stdout').warning('Stack stdin and Path are both set. By default the stdin is used, so that, provided path will be ignored.\n')
 
+        # stdin is only read here, when no stack was given in another way. When it is only posted, it is copied to a
+        # temporary file in chunks and uploaded from it, so it is never held whole in memory
+        spooled_stdin = None
+        if args.stack is None and not args.path:
+            try:
+                if args.redeploy or args.watch or args.update_keys or args.vars_file or args.var:
+                    args.stack = read_stdin(max_size=args.max_stdin_size)
+                else:
+                    from .upload import spool_stdin
+                    spooled_stdin = spool_stdin(max_size=args.max_stdin_size)
+            except (ValueError, UnicodeDecodeError) as e:
+                return generate_response('Invalid stack from stdin', str(e))
+
+        if args.stack and args.update_keys:
+            return generate_response('Invalid use of --update-keys', 'You can not use "--update-keys" argument with "stack" positional argument. It is only available for "--path" argument.')
+
+        if args.vars_file or args.var:
+            return self._deploy_variants(args)
+
+        # The compose file is parsed once and updated in memory, the file on disk is left untouched
+        rendered = None
+        if args.path and args.update_keys and not args.stack:
+            try:
+                with open(args.path, 'r') as f:
+                    rendered = render_compose(f.read(), parse_update_pairs(args.update_keys))
+            except FileNotFoundError:
+                return generate_response(f"File {args.path} not found.")
+            except ValueError as e:
+                return generate_response(str(e))
+
+        # Only passed when set, the deploy manifest is used by default
+        manifest_options = {key: True for key in ('force', 'verify') if getattr(args, key)}
+
+        if args.watch:
+            if not args.path or args.stack:
+                return generate_response('Invalid use of --watch', 'The argument "--path" is required to watch a stack, and it can not be passed as a string.')
+
+            if not args.name:
+                return generate_response('Invalid use of --watch', 'The argument "--name" is required to watch a stack.')
+
+            if not args.y and not request_confirmation('Are you sure you want to watch this Stack? It will be updated every time its file changes.'):
+                return generate_response('Watch was canceled', status=False)
+
+            return self._watch_stack(args, manifest_options)
+
         if args.redeploy:
+            if not args.name:
+                return generate_response('Invalid use of --redeploy', 'The argument "--name" is required to redeploy a stack.')
+
             confirmation = True
             if not args.y:
-                confirmation = request_confirmation('Are you sure you want to redeploy this Stack? It will be replaced by the new one.')
+                confirmation = request_confirmation('Are you sure you want to redeploy this Stack? It will be updated with the new one.')
 
-            if confirmation:
-                logging.getLogger('stdout').info('Redeploy is set. It will try to delete the old stack if exists.')
+            if not confirmation:
+                return generate_response('Redeploy was canceled', status=False)
 
-                delete_resp = self.api_consumer.delete_stack_by_name(name=args.name, endpoint_id=args.endpoint)
-                if not delete_resp['status']:
-                    logging.getLogger('stdout').debug(f'Failed to delete stack: {args.name}. {delete_resp["message"]}')
-                else:
-                    logging.getLogger('stdout').debug(f"Recreating stack {args.name}...")
-            
+            logging.getLogger('stdout').info('Redeploy is set. It will try to update the stack if exists.')
+
+            if args.stack or rendered is not None:
+                content = args.stack or rendered
+            elif args.path:
+                try:
+                    with open(args.path, 'r') as f:
+                        content = f.read()
+                except FileNotFoundError:
+                    return generate_response(f"File {args.path} not found.")
             else:
-                return generate_response('Redeploy was canceled', status=False)
+                return generate_response('No stack argument specified', 'No stack specified. Please pass it as stdin or use the "--path" argument.')
+
+            # The stack is updated in place and left as it is if nothing changed
+            response = self.api_consumer.update_stack(
+                stack=content,
+                name=args.name,
+                endpoint_id=args.endpoint,
+                pull_image=args.pull_image,
+                validate=rendered is None,
+                **manifest_options
+            )
+            if response['status'] or response['code'] != 404:
+                return response
 
-        if args.stack:
-            if args.update_keys:
-                return generate_response('Invalid use of --update-keys', 'You can not use "--update-keys" argument with "stack" positional argument. It is only available for "--path" argument.')
+            logging.getLogger('stdout').debug(f"Stack {args.name} does not exist, creating it...")
 
-            response = self.api_consumer.post_stack_from_str(stack=args.stack, name=args.name, endpoint_id=args.endpoint)
+        if args.stack:
+            response = self.api_consumer.post_stack_from_str(stack=args.stack, name=args.name, endpoint_id=args.endpoint, **manifest_options)
         
+        elif rendered is not None:
+            # Already parsed and serialized by render_compose, so it does not need to be validated again
+            response = self.api_consumer.post_stack_from_str(stack=rendered, name=args.name, endpoint_id=args.endpoint, validate=False, **manifest_options)
+
         elif args.path:
-            for pair in args.update_keys:
-                if validate_key_value(pair=pair):
-                    keys, new_value = pair.split('=', 1)
-                    new_value = re_split(', |,', new_value[1:-1]) if new_value.startswith('[') else new_value
-                    edited = edit_yml_file(path=args.path, key_group=keys, new_value=new_value)
-                    if edited:
-                        return generate_response(edited)
-                
-                else:
-                    return generate_response(f'Invalid key=value pair in --update-keys argument: {pair}')
+            response = self.api_consumer.post_stack_from_file(path=args.path, name=args.name, endpoint_id=args.endpoint, **manifest_options)
 
-            response = self.api_consumer.post_stack_from_file(path=args.path, name=args.name, endpoint_id=args.endpoint)
+        elif spooled_stdin is not None:
+            with spooled_stdin:
+                response = self.api_consumer.post_stack_from_file(path=spooled_stdin.name, name=args.name, endpoint_id=args.endpoint, **manifest_options)
 
         else:
             response = generate_response('No stack argument specified', 'No stack specified. Please pass it as stdin or use the "--path" argument.')
@@ -672,6 +1565,241 @@ class PortainerDeployer:
         return response
 
 
+    def _deploy_variants(self, args: argparse.Namespace) -> dict:
+        """Deploy a stack as a template, a stack per variant of its variables. The template is parsed once, and every
+        variant is rendered in memory and deployed using a bounded pool of workers.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments.
+
+        Returns:
+            dict: Summary of the deploys.
+        """
+        if args.watch:
+            return generate_response('Invalid use of --watch', 'A template can not be watched.')
+
+        if not args.name:
+            return generate_response('Invalid use of --vars-file', 'The argument "--name" is required to deploy a template. i.e. --name "web-${{ customer }}"')
+
+        if args.concurrency < 1:
+            return generate_response(f'Invalid concurrency: {args.concurrency}', 'The argument "--concurrency" must be greater than 0.')
+
+        content = args.stack
+        if content is None and args.path:
+            try:
+                with open(args.path, 'r') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                return generate_response(f"File {args.path} not found.")
+
+        if not content:
+            return generate_response('No stack argument specified', 'No stack specified. Please pass it as stdin or use the "--path" argument.')
+
+        try:
+            # --update-keys is applied once to the template, not to every variant
+            if args.update_keys:
+                content = render_compose(content, parse_update_pairs(args.update_keys))
+            template = ComposeTemplate(content)
+            variants = load_variants(args.vars_file, args.var)
+            names = [substitute_variables(args.name, variables) for variables in variants]
+        except FileNotFoundError:
+            return generate_response(f"File {args.vars_file} not found.")
+        except ValueError as e:
+            return generate_response(str(e))
+
+        missing = list(dict.fromkeys(name for variables in variants for name in template.missing_variables(variables)))
+        if missing:
+            return generate_response('Missing template variables', f'Set them with --vars-file or --var: {", ".join(missing)}')
+
+        from collections import Counter
+        duplicates = [name for name, count in Counter(names).items() if count > 1]
+        if duplicates:
+            return generate_response('Duplicated stack names', f'Every variant must render a different --name: {", ".join(duplicates)}')
+
+        if args.redeploy and not args.y and not request_confirmation(f'Are you sure you want to redeploy these {len(variants)} Stacks? They will be updated with the new ones.'):
+            return generate_response('Redeploy was canceled', status=False)
+
+        manifest_options = {key: True for key in ('force', 'verify') if getattr(args, key)}
+
+        def deploy(job: tuple) -> dict:
+            name, variables = job
+            try:
+                with metrics.timer('template.render'):
+                    stack = template.render(variables)
+            except ValueError as e:
+                return generate_response(str(e))
+
+            # Rendered variants are valid yaml by construction, so they are not validated again
+            if args.redeploy:
+                response = self.api_consumer.update_stack(
+                    stack=stack,
+                    name=name,
+                    endpoint_id=args.endpoint,
+                    pull_image=args.pull_image,
+                    validate=False,
+                    **manifest_options
+                )
+                if response['status'] or response['code'] != 404:
+                    return response
+
+            return self.api_consumer.post_stack_from_str(stack=stack, name=name, endpoint_id=args.endpoint, validate=False, **manifest_options)
+
+        jobs = list(zip(names, variants))
+        workers = min(args.concurrency, len(jobs))
+        self.api_consumer.ensure_pool_size(workers)
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(deploy, jobs))
+
+        spacing_str = '{0:<12} {1:<30} {2:<8} {3}'
+        print(spacing_str.format('Endpoint Id', 'Name', 'Status', 'Message'))
+        for name, result in zip(names, results):
+            print(spacing_str.format(args.endpoint, name, 'ok' if result['status'] else 'failed', result['message']))
+
+        failed = [result for result in results if not result['status']]
+        if failed:
+            return generate_response(
+                f'{len(failed)} of {len(results)} stacks failed to deploy.',
+                '\n'.join(f"{result['message']} {result['details'] if result['details'] != result['message'] else ''}".strip() for result in failed)
+            )
+
+        return generate_response(f'{len(results)} stacks deployed successfully.', status=True)
+
+    def _watch_stack(self, args: argparse.Namespace, manifest_options: dict) -> dict:
+        """Deploy a stack from its file and redeploy it every time the file changes, until it is interrupted.
+        The API consumer and the id of the stack are reused between deploys, and nothing is sent if the parsed stack did not change.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments of the deploy sub-command.
+            manifest_options (dict): Options of the deploy manifest passed to the API consumer.
+
+        Returns:
+            dict: Response of the last deploy once the watch is stopped.
+        """
+        updates = parse_update_pairs(args.update_keys) if args.update_keys else []
+        last_digest, stack_id = None, None
+        response = generate_response('Nothing was deployed', status=True)
+
+        logging.getLogger('stdout').info(f'Watching {args.path} for changes. Press Ctrl+C to stop.')
+        changes = watch_files([args.path], interval=args.watch_interval, debounce=args.debounce)
+        try:
+            while True:
+                try:
+                    with open(args.path, 'r') as f:
+                        content = f.read()
+                    # Comments and formatting are ignored when checking if the stack changed
+                    rendered = render_compose(content, updates)
+                except (FileNotFoundError, ValueError) as e:
+                    logging.getLogger('stdout').error(f'Stack {args.name} was not deployed: {e}')
+                else:
+                    digest = content_hash(rendered)
+                    if digest != last_digest:
+                        response = self._deploy_watched_stack(args, rendered if updates else content, stack_id, manifest_options)
+                        self.api_consumer.save_manifest()
+                        if response['status']:
+                            last_digest = digest
+                            stack_id = stack_id or self.__resolve_watched_stack_id(args.name, args.endpoint)
+                        elif response['code'] == 404:
+                            stack_id = None
+                        logging.getLogger('stdout').info(response['message'])
+                    else:
+                        logging.getLogger('stdout').debug(f'Stack {args.name} did not change, nothing to redeploy.')
+
+                next(changes)
+
+        except (KeyboardInterrupt, StopIteration):
+            logging.getLogger('stdout').info(f'Stopped watching {args.path}.')
+        finally:
+            changes.close()
+
+        return response
+
+    def _deploy_watched_stack(self, args: argparse.Namespace, content: str, stack_id: int, manifest_options: dict) -> dict:
+        """Update a watched stack in place, creating it if it does not exist.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments of the deploy sub-command.
+            content (str): Stack to deploy.
+            stack_id (int): Id of the stack if it is already known, None otherwise.
+            manifest_options (dict): Options of the deploy manifest passed to the API consumer.
+
+        Returns:
+            dict: Response of the deploy.
+        """
+        response = self.api_consumer.update_stack(
+            stack=content,
+            name=args.name,
+            stack_id=stack_id,
+            endpoint_id=args.endpoint,
+            pull_image=args.pull_image,
+            validate=False,
+            **manifest_options
+        )
+        if response['status'] or response['code'] != 404:
+            return response
+
+        return self.api_consumer.post_stack_from_str(stack=content, name=args.name, endpoint_id=args.endpoint, validate=False, **manifest_options)
+
+    def __resolve_watched_stack_id(self, name: str, endpoint_id: int) -> int:
+        try:
+            return self.api_consumer.resolve_stack_id(name, endpoint_id=endpoint_id)
+        except (StackNotFoundError, OSError) as e:
+            logging.getLogger('stdout').debug(f'Stack {name} id could not be resolved: {e}')
+            return None
+
+    @use_api
+    def _deploy_batch_sub_command(self, args: argparse.Namespace) -> dict:
+        """Deploy-batch sub-command default function. Deploys every given stack to every given endpoint using a bounded pool of workers.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments. 
+        """
+        if not args.paths:
+            return generate_response('No stack argument specified', 'Please pass at least one compose file or directory.')
+
+        if not args.endpoint:
+            return generate_response('Missing endpoint', 'The argument "--endpoint" is required to deploy stacks.')
+
+        if args.concurrency < 1:
+            return generate_response(f'Invalid concurrency: {args.concurrency}', 'The argument "--concurrency" must be greater than 0.')
+
+        try:
+            files = collect_stack_files(args.paths)
+        except FileNotFoundError as e:
+            return generate_response(str(e))
+
+        if not files:
+            return generate_response('No stack files found', f'No .yml or .yaml files found in {args.paths}.')
+
+        jobs = [(endpoint, file) for endpoint in dict.fromkeys(args.endpoint) for file in files]
+        workers = min(args.concurrency, len(jobs))
+        self.api_consumer.ensure_pool_size(workers)
+
+        manifest_options = {'force': True} if args.force else {}
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                lambda job: self.api_consumer.post_stack_from_file(path=job[1], name=stack_name_from_path(job[1]), endpoint_id=job[0], **manifest_options),
+                jobs
+            ))
+
+        spacing_str = '{0:<12} {1:<30} {2:<8} {3}'
+        print(spacing_str.format('Endpoint Id', 'Name', 'Status', 'Message'))
+        for (endpoint, file), result in zip(jobs, results):
+            print(spacing_str.format(endpoint, stack_name_from_path(file), 'ok' if result['status'] else 'failed', result['message']))
+
+        failed = [result for result in results if not result['status']]
+        if failed:
+            return generate_response(
+                f'{len(failed)} of {len(results)} stacks failed to deploy.',
+                '\n'.join(f"{result['message']} {result['details'] if result['details'] != result['message'] else ''}".strip() for result in failed)
+            )
+
+        return generate_response(f'{len(results)} stacks deployed successfully.', status=True)
+
+
     @use_api
     def _remove_sub_command(self , args: argparse.Namespace) -> dict:
         """Remove sub-command default function. Excutes removal functions according given arguments.
@@ -679,16 +1807,100 @@ class PortainerDeployer:
         Args:
             args (argparse.Namespace): Parsed arguments. 
         """        
-        confirmation = True
-        if not args.y:
-            confirmation = request_confirmation('Are you sure you want to remove this Stack?')
+        names, ids, patterns = args.name or [], args.id or [], (args.match or []) + (args.regex or [])
+        if not names and not ids and not patterns:
+            return generate_response('No stack specified', 'Please pass the stacks to remove with --id, --name, --match or --regex.')
 
-        if confirmation:
-            response = self.api_consumer.delete_stack(stack_name=args.name, stack_id=args.id, endpoint_id=args.endpoint)
-            return response
-        else:
+        if args.endpoint is None and not patterns:
+            return generate_response('Missing endpoint', 'The argument "--endpoint" is required to remove a stack.')
+
+        if args.concurrency < 1:
+            return generate_response(f'Invalid concurrency: {args.concurrency}', 'The argument "--concurrency" must be greater than 0.')
+
+        # A single stack is removed without listing every stack
+        if len(names) + len(ids) == 1 and not patterns:
+            confirmation = True
+            if not args.y:
+                confirmation = request_confirmation('Are you sure you want to remove this Stack?')
+
+            if confirmation:
+                response = self.api_consumer.delete_stack(stack_name=names[0] if names else None, stack_id=ids[0] if ids else None, endpoint_id=args.endpoint)
+                return response
+            else:
+                return generate_response('Stack removal cancelled', status=False)
+
+        return self._remove_stacks(args)
+
+    def _remove_stacks(self, args: argparse.Namespace) -> dict:
+        """Remove every stack selected by the remove sub-command. They are resolved from a single listing, confirmed at once and removed concurrently.
+
+        Args:
+            args (argparse.Namespace): Parsed arguments of the remove sub-command.
+
+        Returns:
+            dict: Response, failed if any stack is missing or could not be removed.
+        """
+        from .base import PortainerAPIError
+
+        try:
+            stacks = match_stacks(
+                self.api_consumer.list_stacks(endpoint_id=args.endpoint),
+                names=args.name, ids=args.id, patterns=args.match, regexes=args.regex, endpoint_id=args.endpoint
+            )
+        except ValueError as e:
+            return generate_response('Invalid pattern', str(e))
+        except PortainerAPIError as e:
+            return e.response
+        except Exception as e:
+            return generate_response('Stacks could not be listed', str(e), code=500)
+
+        # Exact names and ids must exist, while patterns may match nothing
+        missing = [f'Stack {name} not found.' for name in dict.fromkeys(args.name or []) if name not in {stack['Name'] for stack in stacks}]
+        missing += [f'Stack {stack_id} not found.' for stack_id in dict.fromkeys(args.id or []) if stack_id not in {stack['Id'] for stack in stacks}]
+
+        if not stacks:
+            return generate_response('No stacks found', '\n'.join(missing) or 'No stack matched the given patterns.', code=404)
+
+        targets_str = '{0:<8} {1:<12} {2}'
+        print(targets_str.format('Id', 'Endpoint Id', 'Name'))
+        for stack in stacks:
+            print(targets_str.format(stack['Id'], stack['EndpointId'], stack['Name']))
+
+        if not args.y and not request_confirmation(f'Are you sure you want to remove these {len(stacks)} stacks?'):
             return generate_response('Stack removal cancelled', status=False)
 
+        workers = min(args.concurrency, len(stacks))
+        self.api_consumer.ensure_pool_size(workers)
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                lambda stack: self.api_consumer.delete_stack(endpoint_id=stack['EndpointId'], stack_id=stack['Id']),
+                stacks
+            ))
+
+        spacing_str = '{0:<8} {1:<12} {2:<30} {3:<8} {4}'
+        print(spacing_str.format('Id', 'Endpoint Id', 'Name', 'Status', 'Message'))
+        for stack, result in zip(stacks, results):
+            print(spacing_str.format(stack['Id'], stack['EndpointId'], stack['Name'], 'ok' if result['status'] else 'failed', result['message']))
+
+        failed = [f"Stack {stack['Name']} ({stack['Id']}): {result['message']}" for stack, result in zip(stacks, results) if not result['status']]
+        if failed or missing:
+            return generate_response(
+                f'{len(failed)} of {len(results)} stacks failed to be removed' + (f' and {len(missing)} were not found.' if missing else '.'),
+                '\n'.join(missing + failed)
+            )
+
+        return generate_response(f'{len(results)} stacks removed successfully.', status=True)
+
+
+
+def __getattr__(name):
+    # PortainerAPIConsumer lives in .api and is only imported on demand
+    if name == 'PortainerAPIConsumer':
+        from .api import PortainerAPIConsumer
+        return PortainerAPIConsumer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def main():
@@ -0,0 +1,670 @@
+from collections import namedtuple
+from configparser import ConfigParser
+from json import dumps
+from os import path as os_path
+
+from .utils import content_hash, filter_stacks, generate_random_hash, generate_response, validate_yaml, logging, EndpointNotFoundError, StackNotFoundError, StackWriter
+from .config import ConfigManager
+from .cache import StackIndex, DeployManifest, Inventory, EndpointIndex
+from .ratelimit import TokenBucket
+from .upload import StackFile
+
+# Request an operation needs sent to Portainer. form holds multipart fields, whose values can be a (content, filename) tuple,
+# the content being read as it is sent when it is a StackFile. A stream body is decoded as the response arrives and is
+# readable until the next call. A 404 is only returned, instead of raised, when missing_ok is set. Clients may answer
+# concurrent shared calls with a single request.
+Call = namedtuple('Call', 'method path params json form stream missing_ok shared', defaults=(None, None, None, False, False, False))
+
+# Answer to a Call: status code and decoded JSON body. shared is set when the body was fetched for another operation.
+Reply = namedtuple('Reply', 'status body shared', defaults=(False,))
+
+
+class PortainerAPIError(Exception):
+    """Error returned by the Portainer API, already formatted as a response.
+    """
+    def __init__(self, response: dict) -> None:
+        super().__init__(response['message'])
+        self.response = response
+
+
+def api_error(status: int, body, text: str = None) -> PortainerAPIError:
+    """Build the error for a failed response, with the message and details Portainer sent.
+
+    Args:
+        status (int): Status code of the response.
+        body: Decoded JSON body of the response.
+        text (str, optional): Raw body of the response, used if it is not a JSON object. Defaults to None.
+
+    Returns:
+        PortainerAPIError: Error to be raised.
+    """
+    if isinstance(body, dict):
+        return PortainerAPIError(generate_response(body.get('message'), body.get('details'), code=status))
+    return PortainerAPIError(generate_response(text or f'Portainer answered with status {status}.', code=status))
+
+
+def operation(steps=None, handle_errors: bool = True):
+    """Decorator to declare an operation of the API as a generator, which yields a Call for every request it needs and
+    receives its Reply. Each client turns it into a method running the calls with its own transport, so the logic of
+    an operation is written once for the sync and the async clients.
+
+    Args:
+        steps (function): Generator function of the operation.
+        handle_errors (bool, optional): If False, errors are raised instead of returned as a response. Defaults to True.
+
+    Returns:
+        function: Marked generator function.
+    """
+    def decorator(steps):
+        steps._operation = {'handle_errors': handle_errors}
+        return steps
+    return decorator(steps) if steps else decorator
+
+
+class BasePortainerAPIConsumer:
+    """Operations of the Portainer API and the local caches they use, independent of the transport.
+
+    Subclasses implement _bind_operation, to run the calls yielded by the operations, and they get every operation
+    declared here as a method.
+    """
+    # Class limiting the requests in flight, set by the subclasses
+    concurrency_class = None
+
+    def __init__(self, api_config_path: str, section: str = 'PORTAINER') -> None:
+        # Load config of the Portainer instance, PORTAINER by default or a named one like PORTAINER:EU
+        self._portainer_config = ConfigManager(api_config_path, default_section=section)
+        self.use_ssl = self._portainer_config.get_boolean_var('VERIFY_SSL')
+
+        # Set portainer connection parameters
+        self._portainer_url = self._portainer_config.url
+        self._connection_headers = {'X-API-Key': self._portainer_config.token}
+
+        # Connections kept in the pool of the shared session
+        self._pool_maxsize = int(self._portainer_config.get_var_or_default('POOL_MAXSIZE', 10))
+
+        # Client-side rate limit and requests in flight, shrunk when Portainer throttles and grown back on success
+        self._rate_limiter = TokenBucket(
+            float(self._portainer_config.get_var_or_default('RATE_LIMIT', 0)),
+            burst=float(self._portainer_config.get_var_or_default('RATE_BURST', 0)) or None
+        )
+        self._max_concurrency = self._portainer_config.get_var_or_default('MAX_CONCURRENCY', None)
+        self._concurrency = self.concurrency_class(
+            int(self._max_concurrency or self._pool_maxsize),
+            minimum=int(self._portainer_config.get_var_or_default('MIN_CONCURRENCY', 1))
+        )
+        self._throttle_retries = int(self._portainer_config.get_var_or_default('THROTTLE_RETRIES', 5))
+        self._throttle_backoff = float(self._portainer_config.get_var_or_default('THROTTLE_BACKOFF', 0.5))
+        self._max_backoff = float(self._portainer_config.get_var_or_default('MAX_BACKOFF', 30))
+
+        # Multipart uploads are only compressed when Portainer, or a proxy in front of it, decodes gzip request bodies
+        self._compress_uploads = ConfigParser.BOOLEAN_STATES.get(str(self._portainer_config.get_var_or_default('COMPRESS_UPLOADS', 'no')).lower(), False)
+
+        # Local index to resolve stack names without fetching the whole list
+        self._stack_index = StackIndex(
+            self._portainer_url,
+            ttl=float(self._portainer_config.get_var_or_default('CACHE_TTL', 300)),
+            cache_dir=self._portainer_config.get_var_or_default('CACHE_DIR', None)
+        )
+
+        # Local index to resolve endpoint names, refreshed when a name is missing or it is stale
+        self._endpoint_index = EndpointIndex(
+            self._portainer_url,
+            ttl=float(self._portainer_config.get_var_or_default('ENDPOINT_CACHE_TTL', 3600)),
+            cache_dir=self._portainer_config.get_var_or_default('CACHE_DIR', None)
+        )
+
+        # Local manifest of deployed contents to skip identical deploys without any request
+        self._deploy_manifest = DeployManifest(
+            self._portainer_url,
+            manifest_path=self._portainer_config.get_var_or_default('MANIFEST_PATH', None),
+            cache_dir=self._portainer_config.get_var_or_default('CACHE_DIR', None)
+        )
+
+        # Local SQLite inventory filled by the sync sub-command, also used to resolve stack names
+        self._inventory = Inventory(
+            self._portainer_url,
+            db_path=self._portainer_config.get_var_or_default('INVENTORY_PATH', None),
+            cache_dir=self._portainer_config.get_var_or_default('CACHE_DIR', None)
+        )
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        for name, steps in vars(BasePortainerAPIConsumer).items():
+            if hasattr(steps, '_operation') and name not in vars(cls):
+                setattr(cls, name, cls._bind_operation(steps, **steps._operation))
+
+    @classmethod
+    def _bind_operation(cls, steps, handle_errors: bool = True):
+        """Turn the generator function of an operation into a method of the client.
+
+        Args:
+            steps (function): Generator function of the operation.
+            handle_errors (bool, optional): If True, errors are returned as a response. Defaults to True.
+
+        Returns:
+            function: Method running the operation.
+        """
+        raise NotImplementedError
+
+    @property
+    def portainer_url(self) -> str:
+        """Get the url of the Portainer instance.
+
+        Returns:
+            str: Url of the Portainer instance.
+        """
+        return self._portainer_url
+
+    # ============== Local caches ==============
+    def batch(self):
+        """Context manager to write the deploy manifest once for all the operations run inside it, instead of once per deploy. i.e.
+
+            with api.batch():
+                for path in paths:
+                    api.post_stack_from_file(path, endpoint_id=1)
+        """
+        return self._deploy_manifest.batch()
+
+    def save_manifest(self) -> None:
+        """Write the deploys recorded so far in a batch, i.e. between the deploys of a long running command.
+        """
+        self._deploy_manifest.save()
+
+    def is_deployed(self, endpoint_id: int, name: str, digest: str, stack_id: int = None) -> bool:
+        """Check in the deploy manifest, without any request, if a content is the last one deployed for a stack.
+
+        Args:
+            endpoint_id (int): Id of the endpoint in Portainer.
+            name (str): Name of the stack in Portainer.
+            digest (str): sha256 of the content.
+            stack_id (int, optional): Id the stack must have been recorded with, i.e. the one listed by Portainer. Defaults to None.
+
+        Returns:
+            bool: True if the content was the last one deployed, False otherwise.
+        """
+        entry = self._deploy_manifest.get(endpoint_id, name)
+        return bool(entry) and entry.get('sha256') == digest and stack_id in (None, entry.get('Id'))
+
+    def _cached_stack_id(self, name: str, endpoint_id: int = None) -> int:
+        """Look the id of a stack up locally, in the stack index while it is fresh and then in the inventory.
+
+        Args:
+            name (str): Name of the stack in Portainer.
+            endpoint_id (int, optional): Id of the endpoint the stack belongs to. Without it, only unique names are resolved. Defaults to None.
+
+        Returns:
+            int: Id of the stack, or None if it is not known locally.
+        """
+        entry = self._stack_index.get(name, endpoint_id=endpoint_id)
+        if entry:
+            return entry['Id']
+        return self._inventory.stack_id(name, endpoint_id=endpoint_id)
+
+    def _record_deploy(self, stack: dict, endpoint_id: int, name: str, digest: str) -> None:
+        """Add a stack just deployed to the local index and the deploy manifest, or invalidate the index if the response can not be used.
+
+        Args:
+            stack (dict): Body of the create or update response.
+            endpoint_id (int): Id of the endpoint in Portainer.
+            name (str): Name of the stack in Portainer given by the user. Unnamed stacks are not recorded in the manifest.
+            digest (str): sha256 of the content deployed.
+        """
+        try:
+            self._stack_index.upsert(stack)
+            self._inventory.upsert(stack)
+            stack_id = stack.get('Id')
+        except (KeyError, TypeError, AttributeError):
+            self._stack_index.invalidate()
+            stack_id = None
+
+        if name:
+            self._deploy_manifest.record(endpoint_id, name, digest, stack_id=stack_id)
+
+    def _forget_stack(self, stack_id: int) -> None:
+        """Remove a deleted stack from the local index, the deploy manifest and the inventory.
+
+        Args:
+            stack_id (int): Id of the stack.
+        """
+        self._stack_index.discard(stack_id=stack_id)
+        self._deploy_manifest.discard(stack_id=stack_id)
+        self._inventory.discard(stack_id)
+
+    # ============== Steps shared by the operations ==============
+    def _resolve_steps(self, name: str, use_cache: bool = True, endpoint_id: int = None):
+        """Resolve the id of a stack by its name, using the local stack index while it is fresh, or the inventory.
+
+        Args:
+            name (str): Name of the stack in Portainer.
+            use_cache (bool, optional): If False, the index is refreshed from Portainer. Defaults to True.
+            endpoint_id (int, optional): Id of the endpoint the stack belongs to, as the same name can be used on several endpoints. Defaults to None.
+
+        Raises:
+            StackNotFoundError: If the stack does not exist.
+
+        Returns:
+            int: Id of the stack in Portainer.
+        """
+        stack_id = self._cached_stack_id(name, endpoint_id=endpoint_id) if use_cache else None
+        if stack_id is not None:
+            return stack_id
+
+        # Concurrent lookups may share a single list fetch, which was already indexed by the operation that sent it
+        reply = yield Call('GET', '/api/stacks', shared=use_cache)
+        stacks = list(reply.body or [])
+        if not reply.shared:
+            self._stack_index.refresh(stacks)
+
+            # A complete listing keeps the inventory up to date as well, when there is one
+            if self._inventory.exists():
+                self._inventory.sync_stacks(stacks)
+
+        # The first match is kept, as the by-name lookups always did
+        stack = next((
+            stack for stack in stacks
+            if stack.get('Name') == name and (endpoint_id is None or stack.get('EndpointId') == endpoint_id)
+        ), None)
+        if not stack:
+            raise StackNotFoundError(f"Stack {name} not found in the database.")
+
+        return stack['Id']
+
+    def _unchanged_steps(self, endpoint_id: int, name: str, digest: str, verify: bool = False):
+        """Check the deploy manifest to know if a content was already deployed, without any request unless verify is set.
+
+        Args:
+            endpoint_id (int): Id of the endpoint in Portainer.
+            name (str): Name of the stack in Portainer.
+            digest (str): sha256 of the content to be deployed.
+            verify (bool, optional): If True, the file on the server is checked as well. Defaults to False.
+
+        Returns:
+            dict: Response to return if the deploy can be skipped, None otherwise.
+        """
+        if not name or not self._deploy_manifest.is_unchanged(endpoint_id, name, digest):
+            return None
+
+        if verify:
+            stack_id = self._deploy_manifest.get(endpoint_id, name).get('Id')
+            reply = yield Call('GET', f'/api/stacks/{stack_id}/file', missing_ok=True)
+
+            # The stack was removed or changed outside this tool, so it has to be deployed
+            if reply.status == 404 or content_hash((reply.body or {}).get('StackFileContent', '')) != digest:
+                self._deploy_manifest.discard(endpoint_id, name)
+                return None
+
+        logging.getLogger('stdout').info(f"Stack {name} is unchanged since its last deploy, skipping it.")
+        return generate_response(f'Stack {name} is unchanged since its last deploy.', status=True)
+
+    def _delete_steps(self, endpoint_id: int, stack_name: str = None, stack_id: int = None):
+        """Delete a stack by its id, or by its name if the id is not set.
+
+        Args:
+            endpoint_id (int): Id of the endpoint in Portainer.
+            stack_name (str, optional): Name of the stack in Portainer. Defaults to None.
+            stack_id (int, optional): Id of the stack in Portainer. Defaults to None.
+
+        Returns:
+            dict: Dictionary with the status and detail of the operation.
+        """
+        if not stack_name and not stack_id:
+            raise Exception('Invalid stack', 'Stack name or id is required.')
+
+        # Takes stack_name only if stack_id is not provided
+        cached = False
+        if stack_name and not stack_id:
+            cached = self._cached_stack_id(stack_name, endpoint_id=endpoint_id) is not None
+            stack_id = yield from self._resolve_steps(stack_name, endpoint_id=endpoint_id)
+
+        params = {
+            "endpointId": endpoint_id,
+            "external": 'false'
+        }
+        reply = yield Call('DELETE', f'/api/stacks/{stack_id}', params=params, missing_ok=cached)
+
+        # The cached id may be outdated if the stack was removed outside this tool
+        if cached and reply.status == 404:
+            stack_id = yield from self._resolve_steps(stack_name, use_cache=False, endpoint_id=endpoint_id)
+            reply = yield Call('DELETE', f'/api/stacks/{stack_id}', params=params)
+
+        self._forget_stack(stack_id)
+        logging.getLogger('stdout').info("Deleted successfully!!!")
+        return generate_response('Stack(s) deleted successfully', status=True, code=reply.status)
+
+    # ============== Operations ==============
+    @operation(handle_errors=False)
+    def resolve_stack_id(self, name: str, endpoint_id: int = None) -> int:
+        """Get the id of a stack by its name. It does not request Portainer while the local stack index is fresh.
+
+        Args:
+            name (str): Name of the stack in Portainer.
+            endpoint_id (int, optional): Id of the endpoint the stack belongs to. Defaults to None.
+
+        Raises:
+            StackNotFoundError: If the stack does not exist.
+
+        Returns:
+            int: Id of the stack in Portainer.
+        """
+        return (yield from self._resolve_steps(name, endpoint_id=endpoint_id))
+
+    @operation(handle_errors=False)
+    def list_endpoints(self) -> list:
+        """Get the endpoints of Portainer in a single request. It refreshes the local endpoint index.
+
+        Returns:
+            list: Raw endpoints from Portainer.
+        """
+        reply = yield Call('GET', '/api/endpoints')
+        endpoints = list(reply.body or [])
+        self._endpoint_index.refresh(endpoints)
+        return endpoints
+
+    @operation(handle_errors=False)
+    def resolve_endpoint_id(self, endpoint) -> int:
+        """Get the id of an endpoint by its name. The endpoints are only listed when the name is not in the local
+        endpoint index or the index is stale.
+
+        Args:
+            endpoint (int | str): Id or name of the endpoint. Ids are returned as they are.
+
+        Raises:
+            EndpointNotFoundError: If the endpoint does not exist.
+
+        Returns:
+            int: Id of the endpoint in Portainer.
+        """
+        if isinstance(endpoint, int):
+            return endpoint
+
+        endpoint_id = self._endpoint_index.get(endpoint)
+        if endpoint_id is not None:
+            return endpoint_id
+
+        # Concurrent lookups may share a single list fetch, which was already indexed by the operation that sent it
+        reply = yield Call('GET', '/api/endpoints', shared=True)
+        endpoints = list(reply.body or [])
+        if not reply.shared:
+            self._endpoint_index.refresh(endpoints)
+
+        endpoint_id = next((item['Id'] for item in endpoints if item.get('Name') == endpoint), None)
+        if endpoint_id is None:
+            raise EndpointNotFoundError(f"Endpoint {endpoint} not found.")
+
+        return endpoint_id
+
+    @operation(handle_errors=False)
+    def list_stacks(self, endpoint_id: int = None) -> list:
+        """Get the stacks of Portainer in a single request. A complete listing refreshes the local stack index.
+
+        Args:
+            endpoint_id (int, optional): Only list stacks of this endpoint. Defaults to None.
+
+        Returns:
+            list: Raw stacks from Portainer.
+        """
+        reply = yield Call('GET', '/api/stacks', params={'filters': dumps({'EndpointID': endpoint_id})} if endpoint_id is not None else None)
+        stacks = list(reply.body or [])
+        if endpoint_id is None:
+            self._stack_index.refresh(stacks)
+            if self._inventory.exists():
+                self._inventory.sync_stacks(stacks)
+
+        return stacks
+
+    @operation(handle_errors=False)
+    def get_stack_file(self, stack_id: int) -> str:
+        """Get the compose file of a stack.
+
+        Args:
+            stack_id (int): Id of the stack in Portainer.
+
+        Returns:
+            str: Content of the compose file, or None if the stack does not exist.
+        """
+        reply = yield Call('GET', f'/api/stacks/{stack_id}/file', missing_ok=True)
+        if reply.status == 404:
+            return None
+        return (reply.body or {}).get('StackFileContent', '')
+
+    @operation
+    def get_stack(self, name: str = None, stack_id: int = None, endpoint_id: int = None, name_prefix: str = None, output: str = 'table', columns: list = None, writer: StackWriter = None) -> dict:
+        """Get a stack from portainer
+
+        Args:
+            name (str, optional): Name of the stack in Portainer. Defaults to None.
+            stack_id (int, optional): Id of the stack in Portainer. Defaults to None.
+            endpoint_id (int, optional): Only list stacks of this endpoint, or the endpoint of the stack got by name. Defaults to None.
+            name_prefix (str, optional): Only list stacks whose name starts with this prefix. Defaults to None.
+            output (str, optional): Format the stacks are printed in, one of table, json, ndjson or tsv. Defaults to 'table'.
+            columns (list, optional): Columns to print. Defaults to id, endpoint, name, created and updated.
+            writer (StackWriter, optional): Writer to print the stacks with instead of a new one, i.e. shared by several instances. Defaults to None.
+
+        Returns:
+            dict: Dictionary with the status and detail of the operation.
+        """
+        writer = writer or StackWriter(output=output, columns=columns)
+
+        if stack_id or name:
+            cached = False
+            if not stack_id:
+                cached = self._cached_stack_id(name, endpoint_id=endpoint_id) is not None
+                stack_id = yield from self._resolve_steps(name, endpoint_id=endpoint_id)
+
+            reply = yield Call('GET', f'/api/stacks/{stack_id}', missing_ok=cached)
+
+            # The cached id may be outdated if the stack was changed outside this tool
+            body = reply.body or {}
+            if cached and (reply.status == 404 or body.get('Name') != name or endpoint_id not in (None, body.get('EndpointId'))):
+                stack_id = yield from self._resolve_steps(name, use_cache=False, endpoint_id=endpoint_id)
+                reply = yield Call('GET', f'/api/stacks/{stack_id}')
+
+            with writer:
+                writer.write(reply.body)
+
+        else:
+            # Let Portainer filter by endpoint, the body is then decoded as a stream and rows are printed as they arrive
+            reply = yield Call(
+                'GET',
+                '/api/stacks',
+                params={'filters': dumps({'EndpointID': endpoint_id})} if endpoint_id is not None else None,
+                stream=True
+            )
+
+            # Only a complete listing can replace the local index
+            indexed = [] if endpoint_id is None else None
+
+            def index_stacks(stacks):
+                for stack in stacks:
+                    if indexed is not None:
+                        indexed.append({key: stack.get(key) for key in ('Id', 'Name', 'EndpointId', 'UpdateDate')})
+                    yield stack
+
+            with writer:
+                for stack in filter_stacks(index_stacks(reply.body), endpoint_id=endpoint_id, name_prefix=name_prefix):
+                    writer.write(stack)
+
+            if indexed is not None:
+                self._stack_index.refresh(indexed)
+
+        return generate_response('Stack(s) pulled successfully', status=True, code=reply.status)
+
+    @operation
+    def sync_inventory(self) -> dict:
+        """Mirror the stacks and endpoints of Portainer into the local inventory. Only the stacks whose UpdateDate changed are written.
+
+        Returns:
+            dict: Dictionary with the status and detail of the operation.
+        """
+        reply = yield Call('GET', '/api/stacks', stream=True)
+        stacks = self._inventory.sync_stacks(reply.body)
+
+        reply = yield Call('GET', '/api/endpoints', stream=True)
+        endpoints = self._inventory.sync_endpoints(reply.body)
+
+        logging.getLogger('stdout').info(f"Inventory synced to {self._inventory.path}")
+        return generate_response(
+            f"Inventory synced: {stacks['written']} stacks written, {stacks['deleted']} removed and {stacks['unchanged']} unchanged; {endpoints} endpoints.",
+            status=True,
+            code=reply.status
+        )
+
+    @operation
+    def post_stack_from_str(self, stack: str, endpoint_id: int, name: str = None, validate: bool = True, force: bool = False, verify: bool = False) -> dict:
+        """Post a stack from str.
+
+        Args:
+            stack (str): String of the stack.
+            endpoint_id (int): Id of the endpoint in Portainer.
+            name (str): Name of the stack in Portainer.
+            validate (bool, optional): If False, the stack is not parsed before posting it, i.e. when it was already serialized from yaml. Defaults to True.
+            force (bool, optional): If True, the stack is posted even if the deploy manifest says it is unchanged. Defaults to False.
+            verify (bool, optional): If True, an unchanged stack is checked against the server before skipping it. Defaults to False.
+
+        Returns:
+            dict: Dictionary with the status and detail of the operation.
+        """
+        digest = content_hash(stack)
+        skipped = None if force else (yield from self._unchanged_steps(endpoint_id, name, digest, verify=verify))
+        if skipped:
+            return skipped
+
+        if validate and not validate_yaml(data=stack):
+            raise Exception('Invalid stack', 'Stack is not in a valid yaml format.')
+
+        requested_name = name
+        name = name if name else generate_random_hash()
+
+        params = {
+            "type": 2,
+            "endpointId": endpoint_id,
+            "method": "string"
+        }
+
+        reply = yield Call('POST', '/api/stacks', params=params, json={"name": name, "stackFileContent": stack})
+        self._record_deploy(reply.body, endpoint_id, requested_name, digest)
+
+        logging.getLogger('stdout').info(f"Stack {name} created successfully!!!")
+        return generate_response('Stack(s) pushed successfully', status=True, code=reply.status)
+
+    @operation
+    def post_stack_from_file(self, path: str, endpoint_id: int, name: str = None, force: bool = False, verify: bool = False) -> dict:
+        """Post a stack from a file.
+
+        Args:
+            path (str): Path to the file.
+            endpoint_id (int): Id of the endpoint in Portainer.
+            name (str): Name of the stack in Portainer.
+            force (bool, optional): If True, the stack is posted even if the deploy manifest says it is unchanged. Defaults to False.
+            verify (bool, optional): If True, an unchanged stack is checked against the server before skipping it. Defaults to False.
+
+        Returns:
+            dict: Dictionary with the status and detail of the operation.
+        """
+        requested_name = name
+        name = name if name else generate_random_hash()
+
+        # The file is mapped and read in chunks to hash, validate and upload it, so it is never held whole in memory
+        with StackFile(path) as stack_file:
+            digest = stack_file.digest()
+            skipped = None if force else (yield from self._unchanged_steps(endpoint_id, requested_name, digest, verify=verify))
+            if skipped:
+                return skipped
+
+            if not stack_file.is_valid_yaml():
+                raise Exception('Invalid stack', 'Stack is not in a valid yaml format.')
+
+            params = {
+                "type": 2,
+                "endpointId": endpoint_id,
+                "method": "file"
+            }
+
+            reply = yield Call('POST', '/api/stacks', params=params, form={'Name': name, 'file': (stack_file, os_path.basename(path))})
+            self._record_deploy(reply.body, endpoint_id, requested_name, digest)
+
+        logging.getLogger('stdout').info(f"Stack {name} created successfully!!!")
+        return generate_response(f'Stack {name} from {path} posted successfully under the endpoint {endpoint_id}.', status=True, code=reply.status)
+
+    @operation
+    def update_stack(self, stack: str, endpoint_id: int, name: str = None, stack_id: int = None, pull_image: bool = False, validate: bool = True, force: bool = False, verify: bool = False) -> dict:
+        """Update an existing stack in place, doing nothing if its current file is identical to the new one.
+
+        Args:
+            stack (str): String of the stack.
+            endpoint_id (int): Id of the endpoint in Portainer.
+            name (str, optional): Name of the stack in Portainer, used if stack_id is not set. Defaults to None.
+            stack_id (int, optional): Id of the stack in Portainer. Defaults to None.
+            pull_image (bool, optional): If True, Portainer pulls the images again before updating. Defaults to False.
+            validate (bool, optional): If False, the stack is not parsed before posting it. Defaults to True.
+            force (bool, optional): If True, the deploy manifest is not used to skip the update. Defaults to False.
+            verify (bool, optional): If True, an unchanged stack is checked against the server before skipping it. Defaults to False.
+
+        Returns:
+            dict: Dictionary with the status and detail of the operation. Its code is 404 if the stack does not exist.
+        """
+        if not name and not stack_id:
+            raise Exception('Invalid stack', 'Stack name or id is required.')
+
+        digest = content_hash(stack)
+        skipped = None if force else (yield from self._unchanged_steps(endpoint_id, name, digest, verify=verify))
+        if skipped:
+            return skipped
+
+        if validate and not validate_yaml(data=stack):
+            raise Exception('Invalid stack', 'Stack is not in a valid yaml format.')
+
+        cached = False
+        if not stack_id:
+            cached = self._cached_stack_id(name, endpoint_id=endpoint_id) is not None
+            stack_id = yield from self._resolve_steps(name, endpoint_id=endpoint_id)
+
+        reply = yield Call('GET', f'/api/stacks/{stack_id}/file', missing_ok=cached)
+
+        # The cached id may be outdated if the stack was removed outside this tool
+        if cached and reply.status == 404:
+            stack_id = yield from self._resolve_steps(name, use_cache=False, endpoint_id=endpoint_id)
+            reply = yield Call('GET', f'/api/stacks/{stack_id}/file')
+
+        if content_hash((reply.body or {}).get('StackFileContent', '')) == digest:
+            if name:
+                self._deploy_manifest.record(endpoint_id, name, digest, stack_id=stack_id)
+            logging.getLogger('stdout').info(f"Stack {name or stack_id} is up to date, nothing to redeploy.")
+            return generate_response(f'Stack {name or stack_id} is up to date.', status=True, code=reply.status)
+
+        # Current environment variables are sent back, otherwise the update would drop them
+        existing = (yield Call('GET', f'/api/stacks/{stack_id}')).body or {}
+        payload = {
+            "stackFileContent": stack,
+            "env": existing.get('Env') or [],
+            "prune": False,
+            "pullImage": pull_image
+        }
+        reply = yield Call('PUT', f'/api/stacks/{stack_id}', params={"endpointId": endpoint_id}, json=payload)
+        self._record_deploy(reply.body, endpoint_id, name, digest)
+
+        logging.getLogger('stdout').info(f"Stack {name or stack_id} updated successfully!!!")
+        return generate_response(f'Stack {name or stack_id} updated successfully under the endpoint {endpoint_id}.', status=True, code=reply.status)
+
+    @operation
+    def delete_stack_by_id(self, stack_id: int, endpoint_id: int) -> dict:
+        return (yield from self._delete_steps(endpoint_id, stack_id=stack_id))
+
+    @operation
+    def delete_stack_by_name(self, name: str, endpoint_id: int) -> dict:
+        logging.getLogger('stdout').debug(f"Deleting stack {name}...")
+        return (yield from self._delete_steps(endpoint_id, stack_name=name))
+
+    @operation
+    def delete_stack(self, endpoint_id: int, stack_name: str = None, stack_id: int = None) -> dict:
+        """Delete a stack.
+
+        Args:
+            endpoint_id (int): Id of the endpoint in Portainer.
+            stack_name (str): Name of the stack in Portainer.
+            stack_id (int): Id of the stack in Portainer.
+
+        Returns:
+            dict: Dictionary with the status and detail of the operation.
+        """
+        return (yield from self._delete_steps(endpoint_id, stack_name=stack_name, stack_id=stack_id))
@@ -0,0 +1,6 @@
+from .stack_index import StackIndex
+from .deploy_manifest import DeployManifest
+from .inventory import Inventory
+from .endpoint_index import EndpointIndex
+
+__all__ = ['StackIndex', 'DeployManifest', 'Inventory', 'EndpointIndex']
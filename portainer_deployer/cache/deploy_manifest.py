@@ -0,0 +1,150 @@
+from contextlib import contextmanager
+from hashlib import sha256
+from os import path
+from threading import RLock
+from time import time
+
+from .storage import default_cache_dir, read_json, write_json_atomic
+
+
+class DeployManifest:
+    """Class to manage the local manifest of deployed stacks. It records, per endpoint and stack name,
+    the sha256 of the last content successfully posted and the id of the stack, so identical deploys can be skipped.
+    """
+    def __init__(self, portainer_url: str, manifest_path: str = None, cache_dir: str = None) -> None:
+        """Initialize the DeployManifest class.
+
+        Args:
+            portainer_url (str): Url of the Portainer instance the manifest belongs to.
+            manifest_path (str, optional): Path of the manifest file. Defaults to a file in cache_dir.
+            cache_dir (str, optional): Directory to store the manifest if manifest_path is not set. Defaults to $XDG_CACHE_HOME/portainer-deployer.
+        """
+        if not manifest_path:
+            manifest_path = path.join(
+                cache_dir or default_cache_dir(),
+                f"manifest-{sha256(portainer_url.encode('utf-8')).hexdigest()[:16]}.json"
+            )
+
+        self._path = manifest_path
+        self._data = None
+        self._lock = RLock()
+
+        # Changes recorded inside a batch are written once, when it ends
+        self._batch_depth = 0
+        self._dirty = False
+
+    # ============== Setters & Getters ==============
+    @property
+    def path(self) -> str:
+        """Get the path of the manifest file.
+
+        Returns:
+            str: Path of the manifest file.
+        """
+        return self._path
+
+    @property
+    def stacks(self) -> dict:
+        """Get the recorded deploys keyed by endpoint and name, loading them from disk on first access.
+
+        Returns:
+            dict: Recorded deploys.
+        """
+        if self._data is None:
+            self._data = read_json(self._path, {})
+        return self._data
+
+    # ============== Public Methods ==============
+    @contextmanager
+    def batch(self):
+        """Context manager to group the deploys recorded inside it into a single write of the manifest. i.e.
+
+            with manifest.batch():
+                for endpoint_id in endpoints:
+                    manifest.record(endpoint_id, 'web', digest)
+        """
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            # Deploys recorded before an error did happen, so they are saved as well
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.save()
+
+    def save(self) -> None:
+        """Write the manifest atomically if it has unsaved changes.
+        """
+        with self._lock:
+            if self._dirty:
+                write_json_atomic(self._path, self._data)
+                self._dirty = False
+
+    def get(self, endpoint_id: int, name: str) -> dict:
+        """Get the last deploy recorded for a stack.
+
+        Args:
+            endpoint_id (int): Id of the endpoint in Portainer.
+            name (str): Name of the stack.
+
+        Returns:
+            dict: Entry with the sha256 of the content and the stack Id, or None if not recorded.
+        """
+        return self.stacks.get(self.__key(endpoint_id, name))
+
+    def is_unchanged(self, endpoint_id: int, name: str, digest: str) -> bool:
+        """Check if a content is the same one that was last deployed for a stack.
+
+        Args:
+            endpoint_id (int): Id of the endpoint in Portainer.
+            name (str): Name of the stack.
+            digest (str): sha256 of the content to be deployed.
+
+        Returns:
+            bool: True if the content is unchanged, False otherwise.
+        """
+        entry = self.get(endpoint_id, name)
+        return bool(entry) and entry.get('sha256') == digest
+
+    def record(self, endpoint_id: int, name: str, digest: str, stack_id: int = None) -> None:
+        """Record a successful deploy.
+
+        Args:
+            endpoint_id (int): Id of the endpoint in Portainer.
+            name (str): Name of the stack.
+            digest (str): sha256 of the content deployed.
+            stack_id (int, optional): Id Portainer returned for the stack. Defaults to None.
+        """
+        with self._lock:
+            self.stacks[self.__key(endpoint_id, name)] = {'sha256': digest, 'Id': stack_id, 'deployed_at': time()}
+            self.__changed()
+
+    def discard(self, endpoint_id: int = None, name: str = None, stack_id: int = None) -> None:
+        """Forget a stack, by its endpoint and name or by its id.
+
+        Args:
+            endpoint_id (int, optional): Id of the endpoint in Portainer. Defaults to None.
+            name (str, optional): Name of the stack. Defaults to None.
+            stack_id (int, optional): Id of the stack. Defaults to None.
+        """
+        with self._lock:
+            if name is not None:
+                keys = [self.__key(endpoint_id, name)]
+            else:
+                keys = [key for key, entry in self.stacks.items() if stack_id is not None and entry.get('Id') == stack_id]
+
+            removed = [key for key in keys if self.stacks.pop(key, None) is not None]
+            if removed:
+                self.__changed()
+
+    # ============== Private Methods ==============
+    def __changed(self) -> None:
+        self._dirty = True
+        if not self._batch_depth:
+            self.save()
+
+    @staticmethod
+    def __key(endpoint_id: int, name: str) -> str:
+        return f'{endpoint_id}/{name}'
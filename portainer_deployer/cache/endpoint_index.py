@@ -0,0 +1,96 @@
+from hashlib import sha256
+from os import path
+from threading import RLock
+from time import time
+
+from .storage import default_cache_dir, read_json, write_json_atomic
+
+# Version of the index file, files written with another layout are ignored
+INDEX_VERSION = 1
+
+
+class EndpointIndex:
+    """Class to manage the local on-disk index of Portainer endpoints, to resolve their names to ids without a request.
+    """
+    def __init__(self, portainer_url: str, ttl: float = 3600, cache_dir: str = None) -> None:
+        """Initialize the EndpointIndex class.
+
+        Args:
+            portainer_url (str): Url of the Portainer instance the index belongs to.
+            ttl (float, optional): Seconds the index is considered fresh. Defaults to 3600.
+            cache_dir (str, optional): Directory to store the index. Defaults to $XDG_CACHE_HOME/portainer-deployer.
+        """
+        if not cache_dir:
+            cache_dir = default_cache_dir()
+
+        self.ttl = ttl
+        self._path = path.join(cache_dir, f"endpoints-{sha256(portainer_url.encode('utf-8')).hexdigest()[:16]}.json")
+        self._data = None
+        self._lock = RLock()
+
+    # ============== Setters & Getters ==============
+    @property
+    def path(self) -> str:
+        """Get the path of the index file.
+
+        Returns:
+            str: Path of the index file.
+        """
+        return self._path
+
+    @property
+    def endpoints(self) -> dict:
+        """Get the indexed endpoint ids keyed by name, loading them from disk on first access.
+
+        Returns:
+            dict: Indexed endpoint ids.
+        """
+        if self._data is None:
+            self._data = self.__read()
+        return self._data['endpoints']
+
+    # ============== Public Methods ==============
+    def is_fresh(self) -> bool:
+        """Check if the index is still within its ttl.
+
+        Returns:
+            bool: True if fresh, False otherwise.
+        """
+        if self._data is None:
+            self._data = self.__read()
+        return self.ttl > 0 and time() - self._data['updated_at'] < self.ttl
+
+    def get(self, name: str) -> int:
+        """Get the id of an endpoint by its name.
+
+        Args:
+            name (str): Name of the endpoint.
+
+        Returns:
+            int: Id of the endpoint, or None if not indexed or the index is stale.
+        """
+        if not self.is_fresh():
+            return None
+        return self.endpoints.get(name)
+
+    def refresh(self, endpoints: list) -> None:
+        """Replace the index with a raw list of endpoints from Portainer.
+
+        Args:
+            endpoints (list): Raw list of endpoints from Portainer.
+        """
+        entries = {}
+        for endpoint in endpoints:
+            # Keep the first match, names are not required to be unique
+            entries.setdefault(endpoint['Name'], endpoint['Id'])
+
+        with self._lock:
+            self._data = {'version': INDEX_VERSION, 'updated_at': time(), 'endpoints': entries}
+            write_json_atomic(self._path, self._data)
+
+    # ============== Private Methods ==============
+    def __read(self) -> dict:
+        data = read_json(self._path, {})
+        if data.get('version') == INDEX_VERSION and isinstance(data.get('endpoints'), dict):
+            return data
+        return {'version': INDEX_VERSION, 'updated_at': 0, 'endpoints': {}}
@@ -0,0 +1,260 @@
+from hashlib import sha256
+from os import path, makedirs
+from threading import RLock
+from time import time
+from typing import Iterable
+
+from .storage import default_cache_dir
+
+
+STACK_FIELDS = ('Id', 'Name', 'EndpointId', 'CreationDate', 'UpdateDate', 'CreatedBy', 'UpdatedBy')
+
+ENDPOINT_FIELDS = ('Id', 'Name', 'URL', 'Type', 'Status')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stacks (
+    Id INTEGER PRIMARY KEY,
+    Name TEXT NOT NULL,
+    EndpointId INTEGER,
+    CreationDate INTEGER,
+    UpdateDate INTEGER,
+    CreatedBy TEXT,
+    UpdatedBy TEXT
+);
+CREATE INDEX IF NOT EXISTS stacks_name ON stacks (Name, EndpointId);
+CREATE INDEX IF NOT EXISTS stacks_endpoint ON stacks (EndpointId);
+CREATE INDEX IF NOT EXISTS stacks_updated_by ON stacks (UpdatedBy, UpdateDate);
+CREATE TABLE IF NOT EXISTS endpoints (
+    Id INTEGER PRIMARY KEY,
+    Name TEXT NOT NULL,
+    URL TEXT,
+    Type INTEGER,
+    Status INTEGER
+);
+CREATE INDEX IF NOT EXISTS endpoints_name ON endpoints (Name);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+'''
+
+
+class Inventory:
+    """Class to manage the local SQLite inventory of Portainer stacks and endpoints.
+    It is only created by a sync, lookups on a missing inventory find nothing.
+    """
+    def __init__(self, portainer_url: str, db_path: str = None, cache_dir: str = None) -> None:
+        """Initialize the Inventory class.
+
+        Args:
+            portainer_url (str): Url of the Portainer instance the inventory belongs to.
+            db_path (str, optional): Path of the SQLite database. Defaults to a file in cache_dir.
+            cache_dir (str, optional): Directory to store the database if db_path is not set. Defaults to $XDG_CACHE_HOME/portainer-deployer.
+        """
+        if not db_path:
+            db_path = path.join(
+                cache_dir or default_cache_dir(),
+                f"inventory-{sha256(portainer_url.encode('utf-8')).hexdigest()[:16]}.db"
+            )
+
+        self._path = db_path
+        self._connection = None
+        self._lock = RLock()
+
+    # ============== Setters & Getters ==============
+    @property
+    def path(self) -> str:
+        """Get the path of the database.
+
+        Returns:
+            str: Path of the database.
+        """
+        return self._path
+
+    @property
+    def synced_at(self) -> float:
+        """Get when the stacks were last synced.
+
+        Returns:
+            float: Timestamp of the last sync, or None if never synced.
+        """
+        if not self.exists():
+            return None
+        row = self.__connect().execute("SELECT value FROM meta WHERE key = 'stacks_synced_at'").fetchone()
+        return row[0] if row else None
+
+    # ============== Public Methods ==============
+    def exists(self) -> bool:
+        """Check if the inventory was created by a sync.
+
+        Returns:
+            bool: True if the database exists, False otherwise.
+        """
+        return self._connection is not None or path.isfile(self._path)
+
+    def sync_stacks(self, stacks: Iterable) -> dict:
+        """Mirror a complete listing of stacks, only writing the rows whose UpdateDate changed and removing the missing ones.
+
+        Args:
+            stacks (Iterable): Raw stacks from Portainer. It may be a generator, it is consumed once.
+
+        Returns:
+            dict: Number of stacks written, deleted and unchanged.
+        """
+        with self._lock:
+            connection = self.__connect()
+            with connection:
+                known = dict(connection.execute('SELECT Id, UpdateDate FROM stacks'))
+                seen = set()
+                changed = []
+
+                for stack in stacks:
+                    seen.add(stack['Id'])
+                    if stack['Id'] not in known or known[stack['Id']] != stack.get('UpdateDate'):
+                        changed.append(tuple(stack.get(field) for field in STACK_FIELDS))
+
+                deleted = [(stack_id,) for stack_id in known if stack_id not in seen]
+
+                connection.executemany(f"INSERT OR REPLACE INTO stacks ({', '.join(STACK_FIELDS)}) VALUES ({', '.join('?' * len(STACK_FIELDS))})", changed)
+                connection.executemany('DELETE FROM stacks WHERE Id = ?', deleted)
+                connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stacks_synced_at', ?)", (time(),))
+
+        return {'written': len(changed), 'deleted': len(deleted), 'unchanged': len(seen) - len(changed)}
+
+    def sync_endpoints(self, endpoints: Iterable) -> int:
+        """Replace the endpoints with a complete listing.
+
+        Args:
+            endpoints (Iterable): Raw endpoints from Portainer.
+
+        Returns:
+            int: Number of endpoints stored.
+        """
+        rows = [tuple(endpoint.get(field) for field in ENDPOINT_FIELDS) for endpoint in endpoints]
+
+        with self._lock:
+            connection = self.__connect()
+            with connection:
+                connection.execute('DELETE FROM endpoints')
+                connection.executemany(f"INSERT INTO endpoints ({', '.join(ENDPOINT_FIELDS)}) VALUES ({', '.join('?' * len(ENDPOINT_FIELDS))})", rows)
+
+        return len(rows)
+
+    def upsert(self, stack: dict) -> None:
+        """Add or update a single stack, i.e. one just deployed, if the inventory exists.
+
+        Args:
+            stack (dict): Raw stack info from Portainer.
+        """
+        if not self.exists():
+            return
+
+        with self._lock:
+            connection = self.__connect()
+            with connection:
+                connection.execute(
+                    f"INSERT OR REPLACE INTO stacks ({', '.join(STACK_FIELDS)}) VALUES ({', '.join('?' * len(STACK_FIELDS))})",
+                    tuple(stack.get(field) for field in STACK_FIELDS)
+                )
+
+    def discard(self, stack_id: int) -> None:
+        """Remove a stack, i.e. one just deleted, if the inventory exists.
+
+        Args:
+            stack_id (int): Id of the stack.
+        """
+        if not self.exists():
+            return
+
+        with self._lock:
+            connection = self.__connect()
+            with connection:
+                connection.execute('DELETE FROM stacks WHERE Id = ?', (stack_id,))
+
+    def query_stacks(self, stack_id: int = None, name: str = None, endpoint_id: int = None, name_prefix: str = None) -> list:
+        """Query the stacks using the indexes of the inventory.
+
+        Args:
+            stack_id (int, optional): Id of the stack. Defaults to None.
+            name (str, optional): Name of the stack. Defaults to None.
+            endpoint_id (int, optional): Only stacks of this endpoint. Defaults to None.
+            name_prefix (str, optional): Only stacks whose name starts with this prefix. Defaults to None.
+
+        Returns:
+            list: Stacks as dictionaries with the fields in STACK_FIELDS, sorted by Id.
+        """
+        if not self.exists():
+            return []
+
+        conditions, params = [], []
+        if stack_id is not None:
+            conditions.append('Id = ?')
+            params.append(stack_id)
+        if name is not None:
+            conditions.append('Name = ?')
+            params.append(name)
+        if endpoint_id is not None:
+            conditions.append('EndpointId = ?')
+            params.append(endpoint_id)
+        if name_prefix:
+            # A range instead of LIKE, so the index on Name is used and the prefix is taken literally
+            conditions.append('Name >= ? AND Name < ?')
+            params.extend((name_prefix, name_prefix + '\U0010ffff'))
+
+        query = f"SELECT {', '.join(STACK_FIELDS)} FROM stacks"
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        with self._lock:
+            rows = self.__connect().execute(query + ' ORDER BY Id', params).fetchall()
+
+        return [dict(zip(STACK_FIELDS, row)) for row in rows]
+
+    def stack_id(self, name: str, endpoint_id: int = None) -> int:
+        """Look a stack id up by its name. Without an endpoint, the id is only returned if the name is unique.
+
+        Args:
+            name (str): Name of the stack.
+            endpoint_id (int, optional): Id of the endpoint the stack belongs to. Defaults to None.
+
+        Returns:
+            int: Id of the stack, or None if it is not in the inventory or it is ambiguous.
+        """
+        stacks = self.query_stacks(name=name, endpoint_id=endpoint_id)
+        return stacks[0]['Id'] if len(stacks) == 1 else None
+
+    def endpoint_id(self, name: str) -> int:
+        """Look an endpoint id up by its name.
+
+        Args:
+            name (str): Name of the endpoint.
+
+        Returns:
+            int: Id of the endpoint, or None if it is not in the inventory.
+        """
+        if not self.exists():
+            return None
+
+        with self._lock:
+            row = self.__connect().execute('SELECT Id FROM endpoints WHERE Name = ? ORDER BY Id LIMIT 1', (name,)).fetchone()
+
+        return row[0] if row else None
+
+    def close(self) -> None:
+        """Close the connection to the database.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # ============== Private Methods ==============
+    def __connect(self):
+        if self._connection is None:
+            # Imported here, so that commands not using the inventory do not pay for it
+            import sqlite3
+
+            makedirs(path.dirname(path.abspath(self._path)), exist_ok=True)
+            self._connection = sqlite3.connect(self._path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
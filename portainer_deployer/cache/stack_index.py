@@ -0,0 +1,155 @@
+from hashlib import sha256
+from os import path
+from threading import RLock
+from time import time
+
+from .storage import default_cache_dir, read_json, write_json_atomic
+
+# Version of the index file, files written with another layout are ignored
+INDEX_VERSION = 2
+
+
+class StackIndex:
+    """Class to manage the local on-disk index of Portainer stacks.
+    """
+    def __init__(self, portainer_url: str, ttl: float = 300, cache_dir: str = None) -> None:
+        """Initialize the StackIndex class.
+
+        Args:
+            portainer_url (str): Url of the Portainer instance the index belongs to.
+            ttl (float, optional): Seconds the index is considered fresh. Defaults to 300.
+            cache_dir (str, optional): Directory to store the index. Defaults to $XDG_CACHE_HOME/portainer-deployer.
+        """
+        if not cache_dir:
+            cache_dir = default_cache_dir()
+
+        self.ttl = ttl
+        self._path = path.join(cache_dir, f"stacks-{sha256(portainer_url.encode('utf-8')).hexdigest()[:16]}.json")
+        self._data = None
+        self._lock = RLock()
+
+    # ============== Setters & Getters ==============
+    @property
+    def path(self) -> str:
+        """Get the path of the index file.
+
+        Returns:
+            str: Path of the index file.
+        """
+        return self._path
+
+    @property
+    def stacks(self) -> dict:
+        """Get the indexed stacks keyed by endpoint and name, loading them from disk on first access.
+
+        Returns:
+            dict: Indexed stacks.
+        """
+        if self._data is None:
+            self._data = self.__read()
+        return self._data['stacks']
+
+    # ============== Public Methods ==============
+    def is_fresh(self) -> bool:
+        """Check if the index is still within its ttl.
+
+        Returns:
+            bool: True if fresh, False otherwise.
+        """
+        if self._data is None:
+            self._data = self.__read()
+        return self.ttl > 0 and time() - self._data['updated_at'] < self.ttl
+
+    def get(self, name: str, endpoint_id: int = None) -> dict:
+        """Get a stack entry by its name. Portainer allows the same name on several endpoints,
+        so without an endpoint the entry is only returned if the name is unique.
+
+        Args:
+            name (str): Name of the stack.
+            endpoint_id (int, optional): Id of the endpoint the stack belongs to. Defaults to None.
+
+        Returns:
+            dict: Stack entry or None if not indexed, ambiguous or the index is stale.
+        """
+        if not self.is_fresh():
+            return None
+
+        if endpoint_id is not None:
+            return self.stacks.get(self.__key(endpoint_id, name))
+
+        matches = [entry for entry in self.stacks.values() if entry['Name'] == name]
+        return matches[0] if len(matches) == 1 else None
+
+    def refresh(self, stacks: list) -> None:
+        """Replace the index with a raw list of stacks from Portainer.
+
+        Args:
+            stacks (list): Raw list of stacks from Portainer.
+        """
+        entries = {}
+        for stack in stacks:
+            # Keep the first match, as the by-name lookups always did
+            entries.setdefault(self.__key(stack.get('EndpointId'), stack['Name']), self.__entry(stack))
+
+        with self._lock:
+            self._data = {'version': INDEX_VERSION, 'updated_at': time(), 'stacks': entries}
+            self.__write()
+
+    def upsert(self, stack: dict) -> None:
+        """Add or update a single stack in the index without changing its freshness.
+
+        Args:
+            stack (dict): Raw stack info from Portainer.
+        """
+        with self._lock:
+            if not self.is_fresh():
+                return
+            self.stacks[self.__key(stack.get('EndpointId'), stack['Name'])] = self.__entry(stack)
+            self.__write()
+
+    def discard(self, name: str = None, stack_id: int = None, endpoint_id: int = None) -> None:
+        """Remove a stack from the index by its endpoint and name, or by its id.
+
+        Args:
+            name (str, optional): Name of the stack. Defaults to None.
+            stack_id (int, optional): Id of the stack. Defaults to None.
+            endpoint_id (int, optional): Id of the endpoint the stack belongs to, used with the name. Defaults to None.
+        """
+        with self._lock:
+            if name is not None:
+                key = self.__key(endpoint_id, name)
+            else:
+                key = next((key for key, entry in self.stacks.items() if stack_id is not None and entry['Id'] == stack_id), None)
+
+            if self.stacks.pop(key, None) is not None:
+                self.__write()
+
+    def invalidate(self) -> None:
+        """Mark the whole index as stale.
+        """
+        with self._lock:
+            self._data = {'version': INDEX_VERSION, 'updated_at': 0, 'stacks': {}}
+            self.__write()
+
+    # ============== Private Methods ==============
+    @staticmethod
+    def __key(endpoint_id: int, name: str) -> str:
+        return f'{endpoint_id}/{name}'
+
+    @staticmethod
+    def __entry(stack: dict) -> dict:
+        return {
+            'Id': stack['Id'],
+            'Name': stack['Name'],
+            'EndpointId': stack.get('EndpointId'),
+            'UpdateDate': stack.get('UpdateDate')
+        }
+
+    def __read(self) -> dict:
+        data = read_json(self._path, {})
+        if data.get('version') == INDEX_VERSION and isinstance(data.get('stacks'), dict):
+            return data
+        return {'version': INDEX_VERSION, 'updated_at': 0, 'stacks': {}}
+
+    def __write(self) -> None:
+        write_json_atomic(self._path, self._data)
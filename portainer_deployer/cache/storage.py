@@ -0,0 +1,49 @@
+from json import load, dump
+from os import path, makedirs, replace, environ
+from tempfile import NamedTemporaryFile
+
+
+def default_cache_dir() -> str:
+    """Get the default directory for local caches.
+
+    Returns:
+        str: $XDG_CACHE_HOME/portainer-deployer, or ~/.cache/portainer-deployer if not set.
+    """
+    return path.join(environ.get('XDG_CACHE_HOME', path.expanduser('~/.cache')), 'portainer-deployer')
+
+
+def read_json(path_to_file: str, default: dict) -> dict:
+    """Read a JSON object from a file.
+
+    Args:
+        path_to_file (str): Path to the file.
+        default (dict): Value returned if the file does not exist or is not a JSON object.
+
+    Returns:
+        dict: Content of the file.
+    """
+    try:
+        with open(path_to_file, 'r') as f:
+            data = load(f)
+        if isinstance(data, dict):
+            return data
+    except (OSError, ValueError):
+        pass
+    return default
+
+
+def write_json_atomic(path_to_file: str, data: dict) -> None:
+    """Write a JSON object through a temporary file renamed over the target, ignoring failures,
+    since losing a cache must never break a command.
+
+    Args:
+        path_to_file (str): Path to the file.
+        data (dict): Data to be written.
+    """
+    try:
+        makedirs(path.dirname(path_to_file), exist_ok=True)
+        with NamedTemporaryFile('w', dir=path.dirname(path_to_file), delete=False) as f:
+            dump(data, f)
+        replace(f.name, path_to_file)
+    except OSError:
+        pass
@@ -1,5 +1,10 @@
 import configparser
-from os import path
+from contextlib import contextmanager
+from os import path, stat, chmod, replace, unlink
+from stat import S_IMODE
+from tempfile import NamedTemporaryFile
+
+from ..metrics import metrics
 
 class ConfigManager:
     """Class to manage config files.
@@ -18,6 +23,12 @@ class ConfigManager:
 
         else:
             raise FileNotFoundError(f"{path_to_config_file} does not exist or is not a file.")
+
+        # The file is parsed once and kept in memory until its mtime changes
+        self._parser = None
+        self._mtime = None
+        self._batch_depth = 0
+        self._dirty = False
         
         if default_section:
             self.section = default_section
@@ -45,6 +56,28 @@ class ConfigManager:
         self.__dict__.update(self.get_section_config(section))
 
 
+    @property
+    def config(self) -> configparser.ConfigParser:
+        """Get the parsed config file, parsing it again only if it was modified since the last read.
+
+        Returns:
+            configparser.ConfigParser: Parsed config.
+        """
+        try:
+            mtime = stat(self._path_to_config_file).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        # Pending changes of a batch are never dropped by a reload
+        if self._parser is None or (mtime != self._mtime and not self._dirty):
+            with metrics.timer('config.parse'):
+                parser = configparser.ConfigParser()
+                parser.read(self._path_to_config_file)
+            self._parser, self._mtime = parser, mtime
+
+        return self._parser
+
+
     # ============== decorators ==============
     def _use_default_section(func):
         """Decorator to pass the default section to the function.
@@ -61,6 +94,52 @@ class ConfigManager:
 
 
     # ============== Public Methods ==============
+    @contextmanager
+    def batch(self):
+        """Context manager to group several set_var calls into a single write of the config file. i.e.
+
+            with config.batch():
+                config.set_var(key='url', new_value='https://localhost:9443', section='PORTAINER')
+                config.set_var(key='token', new_value='my-token', section='PORTAINER')
+
+        If the outermost batch raises, its pending changes are discarded and the file is read again on the next access.
+        """
+        self._batch_depth += 1
+        completed = False
+        try:
+            yield self
+            completed = True
+        finally:
+            self._batch_depth -= 1
+
+            if self._batch_depth == 0 and self._dirty:
+                if completed:
+                    self.save()
+                else:
+                    self._parser, self._dirty = None, False
+
+    def save(self) -> None:
+        """Write the in-memory config atomically, through a temporary file renamed over the config file.
+        """
+        directory = path.dirname(path.abspath(self._path_to_config_file))
+        tmp = None
+        try:
+            mode = S_IMODE(stat(self._path_to_config_file).st_mode)
+            with NamedTemporaryFile('w', dir=directory, delete=False) as tmp:
+                self.config.write(tmp)
+            chmod(tmp.name, mode)
+            replace(tmp.name, self._path_to_config_file)
+
+        except PermissionError:
+            # The directory may not be writable even if the file is, so fall back to write it in place
+            if tmp is not None and path.exists(tmp.name):
+                unlink(tmp.name)
+            with open(self._path_to_config_file, 'w') as configfile:
+                self.config.write(configfile)
+
+        self._dirty = False
+        self._mtime = stat(self._path_to_config_file).st_mtime_ns
+
     def reset_section(self) -> None:
         """Reset the section to the default section value (None).
         """        
@@ -82,11 +161,11 @@ class ConfigManager:
             bool: True if the value was set, False otherwise. 
         """
         try:
-            config = configparser.ConfigParser()
-            config.read(self._path_to_config_file)
-            config[section.upper()][key] = new_value
-            with open(self._path_to_config_file, 'w') as configfile:
-                config.write(configfile)
+            self.config[section.upper()][key] = new_value
+            self._dirty = True
+
+            if not self._batch_depth:
+                self.save()
             return True
 
         except configparser.Error as e:
@@ -108,14 +187,29 @@ class ConfigManager:
             str: Value of the key. 
         """
         try:
-            config = configparser.ConfigParser()
-            config.read(self._path_to_config_file)
-            return config[section.upper()][key]
+            return self.config[section.upper()][key]
 
         except configparser.Error as e:
             raise configparser.Error(f"Error: {e}")
 
 
+    @_use_default_section
+    def get_var_or_default(self, key: str, default: str, section: str) -> str:
+        """ Get a value from the config file, falling back to a default when the key is not set.
+
+        Args:
+            section (str): Section to get the value from. 
+            key (str): Key to get the value. 
+            default (str): Value returned in case the key does not exist or is empty.
+
+        Returns:
+            str: Value of the key or the given default. 
+        """
+        config = self.config
+        value = config[section.upper()].get(key) if config.has_section(section.upper()) else None
+        return value if value else default
+
+
     @_use_default_section
     def get_boolean_var(self, key: str, section: str) -> bool:
         """ Get a boolean value from the config file.
@@ -131,9 +225,7 @@ class ConfigManager:
             bool: Boolean value of the key. 
         """
         try:
-            config = configparser.ConfigParser()
-            config.read(self._path_to_config_file)
-            return config.getboolean(section, key)
+            return self.config.getboolean(section, key)
 
         except configparser.Error as e:
             raise configparser.Error(f"Error: {e}")
@@ -151,9 +243,7 @@ class ConfigManager:
             dict: Section config. 
         """
         try:
-            config = configparser.ConfigParser()
-            config.read(self._path_to_config_file)
-            return dict(config[section])
+            return dict(self.config[section])
 
         except configparser.Error as e:
             raise configparser.Error(f"Error: {e}")
@@ -0,0 +1,247 @@
+from os import environ, getcwd, path
+import sys
+
+# Overrides the path of the socket, or disables the delegation to the daemon when set to 1
+SOCKET_ENV = 'PORTAINER_DEPLOYER_SOCKET'
+NO_DAEMON_ENV = 'PORTAINER_DEPLOYER_NO_DAEMON'
+
+
+def default_socket_path() -> str:
+    """Get the path of the socket the daemon listens on.
+
+    Returns:
+        str: $PORTAINER_DEPLOYER_SOCKET, or portainer-deployer.sock in $XDG_RUNTIME_DIR or in the cache directory.
+    """
+    if environ.get(SOCKET_ENV):
+        return environ[SOCKET_ENV]
+
+    directory = environ.get('XDG_RUNTIME_DIR') or path.join(environ.get('XDG_CACHE_HOME', path.expanduser('~/.cache')), 'portainer-deployer')
+    return path.join(directory, 'portainer-deployer.sock')
+
+
+def daemon_running(socket_path: str = None) -> bool:
+    """Check, without connecting, if a daemon may be listening.
+
+    Args:
+        socket_path (str, optional): Path of the socket. Defaults to default_socket_path().
+
+    Returns:
+        bool: True if the delegation is enabled and the socket exists, False otherwise.
+    """
+    return environ.get(NO_DAEMON_ENV) != '1' and path.exists(socket_path or default_socket_path())
+
+
+def delegate(argv: list, stdin: str = None, socket_path: str = None) -> dict:
+    """Run a command in the daemon, printing its output as it arrives. Only this function is used by the CLI, and it
+    does not import anything unless the socket exists, so commands do not pay for it when no daemon is running.
+
+    Args:
+        argv (list): Arguments of the command line, without the program name.
+        stdin (str, optional): Content of stdin, for the commands reading a stack from it. Defaults to None.
+        socket_path (str, optional): Path of the socket. Defaults to default_socket_path().
+
+    Returns:
+        dict: Response of the command, or None if no daemon is running, so the command runs locally.
+    """
+    socket_path = socket_path or default_socket_path()
+    if not daemon_running(socket_path):
+        return None
+
+    from json import dumps, loads
+    import socket
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        # The daemon stopped without removing its socket
+        client.close()
+        return None
+
+    with client, client.makefile('r', encoding='utf-8') as replies:
+        client.sendall(dumps({'argv': argv, 'cwd': getcwd(), 'stdin': stdin}).encode('utf-8') + b'\n')
+
+        for line in replies:
+            message = loads(line)
+            if 'stdout' in message:
+                sys.stdout.write(message['stdout'])
+            elif 'stderr' in message:
+                sys.stderr.write(message['stderr'])
+            elif 'response' in message:
+                sys.stdout.flush()
+                return message['response']
+
+    # The command may have run partially, so it is not run again locally
+    from .utils import generate_response
+    return generate_response('The daemon closed the connection before answering.', code=500)
+
+
+class _ReplyStream:
+    """Text stream sending what is written to it to the client, as stdout or stderr frames.
+    """
+    def __init__(self, send, kind: str) -> None:
+        self._send = send
+        self._kind = kind
+
+    def write(self, text: str) -> int:
+        if text:
+            self._send({self._kind: text})
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+class DeployerDaemon:
+    """Serve the commands of a PortainerDeployer over a Unix socket, keeping its API consumers, their connection pools
+    and their stack indexes warm between commands.
+
+    The protocol is one JSON object per line. The client sends {"argv": [...], "cwd": "...", "stdin": "..."} and
+    receives {"stdout": "..."} and {"stderr": "..."} frames as the command writes them, then {"response": {...}}.
+    Commands run one at a time, as they share the working directory and the standard streams of the process.
+    """
+    def __init__(self, deployer, socket_path: str = None, idle_timeout: float = None) -> None:
+        """Initialize the DeployerDaemon class.
+
+        Args:
+            deployer (PortainerDeployer): CLI running the commands, it is switched to keep its API consumers.
+            socket_path (str, optional): Path of the socket. Defaults to default_socket_path().
+            idle_timeout (float, optional): Seconds without commands after which the daemon stops. Defaults to None, never.
+        """
+        from threading import Lock
+
+        self._deployer = deployer
+        self._deployer.keep_api_consumers()
+        self._socket_path = socket_path or default_socket_path()
+        self._idle_timeout = idle_timeout or None
+        self._lock = Lock()
+
+    @property
+    def socket_path(self) -> str:
+        """Get the path of the socket.
+
+        Returns:
+            str: Path of the socket.
+        """
+        return self._socket_path
+
+    def serve(self, ready=None) -> None:
+        """Listen on the socket until interrupted or idle for idle_timeout seconds, then remove the socket.
+
+        Args:
+            ready (threading.Event, optional): Event set once the socket is listening. Defaults to None.
+
+        Raises:
+            OSError: If another daemon is already listening on the socket.
+        """
+        from os import makedirs, umask, unlink
+        from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+        import socket
+
+        if path.exists(self._socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self._socket_path)
+                raise OSError(f'A daemon is already listening on {self._socket_path}.')
+            except ConnectionRefusedError:
+                # Left by a daemon that did not stop cleanly
+                unlink(self._socket_path)
+            finally:
+                probe.close()
+
+        daemon = self
+
+        class Handler(StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if line:
+                    daemon._handle(line, self.wfile)
+
+        makedirs(path.dirname(path.abspath(self._socket_path)), exist_ok=True)
+
+        # Only the user running the daemon can connect to it
+        previous_umask = umask(0o177)
+        try:
+            server = ThreadingUnixStreamServer(self._socket_path, Handler)
+        finally:
+            umask(previous_umask)
+
+        server.daemon_threads = True
+        server.timeout = self._idle_timeout
+        self._idle = False
+        server.handle_timeout = self.__stop_when_idle
+
+        if ready is not None:
+            ready.set()
+
+        try:
+            while not self._idle:
+                server.handle_request()
+        finally:
+            server.server_close()
+            if path.exists(self._socket_path):
+                unlink(self._socket_path)
+
+    def _handle(self, line: bytes, wfile) -> None:
+        """Run the command of a request and send its output and response.
+
+        Args:
+            line (bytes): JSON request.
+            wfile: Binary stream of the connection.
+        """
+        from io import BytesIO, TextIOWrapper
+        from json import dumps, loads
+        from os import chdir
+        from threading import Lock
+        from .utils import generate_response
+        from .utils.utils import custom_handler
+
+        send_lock = Lock()
+
+        def send(message: dict) -> None:
+            with send_lock:
+                try:
+                    wfile.write(dumps(message).encode('utf-8') + b'\n')
+                    wfile.flush()
+                except OSError:
+                    # The client went away, the command still runs to the end
+                    pass
+
+        try:
+            request = loads(line)
+            argv = [str(arg) for arg in request['argv']]
+        except (ValueError, KeyError, TypeError) as e:
+            return send({'response': generate_response('Invalid request', str(e))})
+
+        stdout, stderr = _ReplyStream(send, 'stdout'), _ReplyStream(send, 'stderr')
+        with self._lock:
+            streams = sys.stdin, sys.stdout, sys.stderr
+            cwd = getcwd()
+            log_stream = custom_handler.setStream(stderr)
+            try:
+                chdir(request.get('cwd') or cwd)
+                sys.stdin = TextIOWrapper(BytesIO(request['stdin'].encode('utf-8')), encoding='utf-8') if request.get('stdin') is not None else None
+                sys.stdout, sys.stderr = stdout, stderr
+
+                args = self._deployer.parser.parse_args(argv)
+                response = args.func(args)
+
+            except SystemExit as e:
+                # argparse exits on invalid arguments and --help, after printing them
+                response = generate_response('Invalid arguments', code=2) if e.code else generate_response('Help shown.', status=True)
+            except Exception as e:
+                response = generate_response(str(e), code=500)
+            finally:
+                sys.stdin, sys.stdout, sys.stderr = streams
+                custom_handler.setStream(log_stream)
+                chdir(cwd)
+
+        send({'response': response})
+
+    def __stop_when_idle(self) -> None:
+        # A command running for longer than the timeout is not interrupted
+        if not self._lock.locked():
+            self._idle = True
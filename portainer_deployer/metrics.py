@@ -0,0 +1,195 @@
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from time import perf_counter, time
+from re import sub
+import sys
+
+PROMETHEUS_PREFIX = 'portainer_deployer_phase_seconds'
+
+
+def route_of(url: str) -> str:
+    """Get the route of a Portainer API url, so calls to different stacks are aggregated. i.e. /api/stacks/12/file -> /api/stacks/{id}/file
+
+    Args:
+        url (str): Url or path of the request.
+
+    Returns:
+        str: Path with the numeric segments replaced by {id}.
+    """
+    path = sub(r'^[a-z]+://[^/]+', '', url).split('?', 1)[0]
+    return sub(r'/\d+(?=/|$)', '/{id}', path) or '/'
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Registry of the time spent per phase of a command, i.e. config parsing, yaml validation, http calls or output rendering.
+    It is disabled by default, so timers only cost a flag check until --profile or --metrics-file enable it.
+    """
+    def __init__(self) -> None:
+        self.enabled = False
+        self._phases = {}
+        self._lock = Lock()
+
+    # ============== Public Methods ==============
+    def enable(self) -> None:
+        """Start recording timings.
+        """
+        self.enabled = True
+
+    def reset(self) -> None:
+        """Stop recording timings and drop the recorded ones.
+        """
+        with self._lock:
+            self.enabled = False
+            self._phases = {}
+
+    def record(self, phase: str, seconds: float, count: int = 1, **labels) -> None:
+        """Record the time spent in a phase.
+
+        Args:
+            phase (str): Name of the phase, i.e. http.request.
+            seconds (float): Time spent.
+            count (int, optional): Number of operations the time covers. Defaults to 1.
+            labels: Labels splitting the phase, i.e. method='GET'.
+        """
+        if not self.enabled:
+            return
+
+        key = (phase, tuple(sorted(labels.items())))
+        with self._lock:
+            entry = self._phases.get(key)
+            if entry is None:
+                self._phases[key] = {'count': count, 'total': seconds, 'min': seconds, 'max': seconds}
+            else:
+                entry['count'] += count
+                entry['total'] += seconds
+                entry['min'] = min(entry['min'], seconds)
+                entry['max'] = max(entry['max'], seconds)
+
+    @contextmanager
+    def timer(self, phase: str, **labels):
+        """Context manager recording the time spent inside it. i.e.
+
+            with metrics.timer('yaml.validate'):
+                ...
+
+        Args:
+            phase (str): Name of the phase.
+            labels: Labels splitting the phase.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, perf_counter() - start, **labels)
+
+    def timed(self, phase: str):
+        """Decorator recording the time spent in every call of a function.
+
+        Args:
+            phase (str): Name of the phase.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.timer(phase):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> list:
+        """Get the recorded phases.
+
+        Returns:
+            list: Phases as dictionaries with phase, labels, count, total, min and max, sorted by total time.
+        """
+        with self._lock:
+            phases = [{'phase': phase, 'labels': dict(labels), **entry} for (phase, labels), entry in self._phases.items()]
+        return sorted(phases, key=lambda entry: entry['total'], reverse=True)
+
+    def report(self, stream=None) -> None:
+        """Print a breakdown of the recorded phases, to stderr by default so it does not mix with the output of the command.
+
+        Args:
+            stream (optional): Text stream to write to. Defaults to sys.stderr.
+        """
+        stream = stream or sys.stderr
+        spacing_str = '{0:<20} {1:<40} {2:>6} {3:>11} {4:>10} {5:>10}\n'
+        stream.write(spacing_str.format('Phase', 'Labels', 'Count', 'Total (ms)', 'Mean (ms)', 'Max (ms)'))
+        for entry in self.snapshot():
+            stream.write(spacing_str.format(
+                entry['phase'],
+                ' '.join(f'{key}={value}' for key, value in entry['labels'].items()),
+                entry['count'],
+                f"{entry['total'] * 1000:.2f}",
+                f"{entry['total'] * 1000 / entry['count']:.2f}",
+                f"{entry['max'] * 1000:.2f}"
+            ))
+
+    def to_json(self, **extra) -> str:
+        """Serialize the recorded phases as JSON.
+
+        Args:
+            extra: Fields added to the document, i.e. the command.
+
+        Returns:
+            str: JSON document.
+        """
+        from json import dumps
+        return dumps({**extra, 'timestamp': time(), 'phases': self.snapshot()}, indent=2)
+
+    def to_prometheus(self, **extra) -> str:
+        """Serialize the recorded phases in the Prometheus text exposition format, i.e. for a node exporter textfile collector.
+
+        Args:
+            extra: Labels added to every sample, i.e. the command.
+
+        Returns:
+            str: Prometheus text format.
+        """
+        lines = [
+            f'# HELP {PROMETHEUS_PREFIX} Time spent per phase of a portainer-deployer command.',
+            f'# TYPE {PROMETHEUS_PREFIX} summary'
+        ]
+        maxima = []
+        for entry in self.snapshot():
+            labels = ','.join(
+                f'{key}="{_escape_label(value)}"' for key, value in {**extra, 'phase': entry['phase'], **entry['labels']}.items()
+            )
+            lines.append(f"{PROMETHEUS_PREFIX}_sum{{{labels}}} {entry['total']:.6f}")
+            lines.append(f"{PROMETHEUS_PREFIX}_count{{{labels}}} {entry['count']}")
+            maxima.append(f"{PROMETHEUS_PREFIX}_max{{{labels}}} {entry['max']:.6f}")
+
+        if maxima:
+            lines += [f'# HELP {PROMETHEUS_PREFIX}_max Longest operation per phase.', f'# TYPE {PROMETHEUS_PREFIX}_max gauge', *maxima]
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path_to_file: str, metrics_format: str = None, **extra) -> None:
+        """Write the recorded phases to a file.
+
+        Args:
+            path_to_file (str): Path to the file.
+            metrics_format (str, optional): json or prometheus. Defaults to prometheus for .prom files and json otherwise.
+            extra: Fields or labels added to the metrics, i.e. the command.
+        """
+        if metrics_format is None:
+            metrics_format = 'prometheus' if path_to_file.endswith('.prom') else 'json'
+
+        content = self.to_prometheus(**extra) if metrics_format == 'prometheus' else self.to_json(**extra)
+        with open(path_to_file, 'w') as f:
+            f.write(content)
+
+
+# Registry shared by the whole process
+metrics = Metrics()
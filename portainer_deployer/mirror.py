@@ -0,0 +1,145 @@
+from os import path, makedirs, remove, replace
+from re import compile as re_compile
+from tempfile import NamedTemporaryFile
+from threading import Lock
+
+from .cache.storage import read_json, write_json_atomic
+
+# Index of the exported stacks, kept in the directory of the mirror
+INDEX_NAME = '.portainer-export.json'
+
+# Version of the index file, files written with another layout are ignored
+INDEX_VERSION = 1
+
+# Characters replaced in the names of the files
+UNSAFE_CHARS = re_compile(r'[^A-Za-z0-9_.-]')
+
+
+class StackMirror:
+    """Class to manage a local directory mirroring the compose files of Portainer stacks, one file per stack in a
+    directory per endpoint. An index records the UpdateDate of every stack exported, so the stacks unchanged since the
+    last export are not downloaded again.
+    """
+    def __init__(self, directory: str, portainer_url: str) -> None:
+        """Initialize the StackMirror class.
+
+        Args:
+            directory (str): Directory of the mirror, created if it does not exist.
+            portainer_url (str): Url of the Portainer instance mirrored. The index of another instance is ignored.
+        """
+        self.directory = directory
+        self._portainer_url = portainer_url
+        self._index_path = path.join(directory, INDEX_NAME)
+        self._lock = Lock()
+
+        data = read_json(self._index_path, {})
+        if data.get('version') != INDEX_VERSION or data.get('url') != portainer_url or not isinstance(data.get('stacks'), dict):
+            data = {'version': INDEX_VERSION, 'url': portainer_url, 'stacks': {}}
+        self._data = data
+
+    # ============== Public Methods ==============
+    def path_of(self, stack: dict) -> str:
+        """Get the path a stack is exported to.
+
+        Args:
+            stack (dict): Raw stack info from Portainer.
+
+        Returns:
+            str: Path of the compose file of the stack, <directory>/<endpoint id>/<name>.yml.
+        """
+        name = UNSAFE_CHARS.sub('_', str(stack['Name'])).lstrip('.') or str(stack['Id'])
+        return path.join(self.directory, str(stack.get('EndpointId')), f'{name}.yml')
+
+    def is_current(self, stack: dict) -> bool:
+        """Check if a stack was exported and did not change since.
+
+        Args:
+            stack (dict): Raw stack info from Portainer.
+
+        Returns:
+            bool: True if its file is up to date, False otherwise.
+        """
+        entry = self._data['stacks'].get(str(stack['Id']))
+        return (
+            entry is not None
+            and entry.get('UpdateDate') == stack.get('UpdateDate')
+            and entry.get('path') == self.__relative(self.path_of(stack))
+            and path.isfile(self.path_of(stack))
+        )
+
+    def write(self, stack: dict, content: str) -> str:
+        """Write the compose file of a stack atomically, through a temporary file renamed over it, and record it in the index.
+
+        Args:
+            stack (dict): Raw stack info from Portainer.
+            content (str): Content of the compose file.
+
+        Raises:
+            OSError: If the file could not be written.
+
+        Returns:
+            str: Path of the file.
+        """
+        file_path = self.path_of(stack)
+        makedirs(path.dirname(file_path), exist_ok=True)
+
+        with NamedTemporaryFile('w', dir=path.dirname(file_path), prefix='.', suffix='.tmp', delete=False, encoding='utf-8', newline='') as f:
+            try:
+                f.write(content)
+            except BaseException:
+                f.close()
+                remove(f.name)
+                raise
+        replace(f.name, file_path)
+
+        with self._lock:
+            previous = self._data['stacks'].get(str(stack['Id']))
+            self._data['stacks'][str(stack['Id'])] = {
+                'Name': stack['Name'],
+                'EndpointId': stack.get('EndpointId'),
+                'UpdateDate': stack.get('UpdateDate'),
+                'path': self.__relative(file_path)
+            }
+
+            # The stack was renamed or moved to another endpoint since the last export, its old file is removed
+            # unless another stack took its place
+            moved = previous and previous.get('path') != self.__relative(file_path)
+            if moved and not any(entry['path'] == previous.get('path') for entry in self._data['stacks'].values()):
+                self.__remove(previous['path'])
+
+        return file_path
+
+    def prune(self, stacks: list) -> list:
+        """Remove the files of the exported stacks that no longer exist in Portainer.
+
+        Args:
+            stacks (list): Complete listing of the stacks of Portainer.
+
+        Returns:
+            list: Paths of the files removed.
+        """
+        existing = {str(stack['Id']) for stack in stacks}
+        removed = []
+        with self._lock:
+            for stack_id in [stack_id for stack_id in self._data['stacks'] if stack_id not in existing]:
+                entry = self._data['stacks'].pop(stack_id)
+                if self.__remove(entry['path']):
+                    removed.append(path.join(self.directory, entry['path']))
+        return removed
+
+    def save(self) -> None:
+        """Write the index atomically.
+        """
+        with self._lock:
+            write_json_atomic(self._index_path, self._data)
+
+    # ============== Private Methods ==============
+    def __relative(self, file_path: str) -> str:
+        return path.relpath(file_path, self.directory)
+
+    def __remove(self, relative_path: str) -> bool:
+        try:
+            remove(path.join(self.directory, relative_path))
+            return True
+        except OSError:
+            return False
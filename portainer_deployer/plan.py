@@ -0,0 +1,225 @@
+from collections import namedtuple
+from fnmatch import fnmatchcase
+from os import path
+
+from .utils import generate_response
+
+# Stack declared in a plan file. key identifies it in depends_on, it defaults to its name
+StackSpec = namedtuple('StackSpec', 'key name endpoint file update_keys depends_on absent')
+
+# Step of a plan, one of ACTIONS. after holds the keys of the actions that must succeed before it runs
+Action = namedtuple('Action', 'kind key name endpoint_id stack_id path content after', defaults=(None, None, None, ()))
+
+ACTIONS = ('create', 'update', 'delete', 'noop')
+
+
+def load_plan_file(plan_path: str) -> tuple:
+    """Load the stacks declared in a plan file. i.e.
+
+        stacks:
+          - name: db
+            file: stacks/db.yml
+            endpoint: production
+          - name: web
+            file: stacks/web.yml
+            endpoint: 1
+            update_keys: ['services.web.image=nginx:1.25']
+            depends_on: [db]
+          - name: legacy
+            endpoint: 1
+            absent: true
+        prune: ['pr-*']
+
+    Args:
+        plan_path (str): Path of the yaml file. Stack files are relative to its directory.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        ValueError: If the file is not valid, a dependency is unknown or dependencies are circular.
+
+    Returns:
+        tuple: List of StackSpec in the order of the file, and list of glob patterns of the stacks to prune.
+    """
+    from yaml import load, YAMLError
+    from .utils import yaml_loader_dumper
+
+    Loader, _ = yaml_loader_dumper()
+    try:
+        with open(plan_path, 'r') as f:
+            data = load(f, Loader=Loader) or {}
+    except YAMLError as e:
+        raise ValueError(f'Plan file {plan_path} is not in a valid yaml format. {e}')
+
+    if not isinstance(data, dict) or not isinstance(data.get('stacks', []), list) or not isinstance(data.get('prune', []), list):
+        raise ValueError(f'Plan file {plan_path} must be a mapping with a list of stacks and an optional list of prune patterns.')
+
+    base_dir = path.dirname(path.abspath(plan_path))
+    specs = []
+    for position, entry in enumerate(data.get('stacks') or [], start=1):
+        if not isinstance(entry, dict) or not entry.get('name') or entry.get('endpoint') in (None, ''):
+            raise ValueError(f'Stack {position} of {plan_path} must have a name and an endpoint.')
+
+        absent = bool(entry.get('absent', False))
+        if not absent and not entry.get('file'):
+            raise ValueError(f"Stack {entry['name']} of {plan_path} must have a file.")
+
+        update_keys = entry.get('update_keys') or []
+        depends_on = entry.get('depends_on') or []
+        if not isinstance(update_keys, list) or not isinstance(depends_on, list):
+            raise ValueError(f"update_keys and depends_on of stack {entry['name']} must be lists.")
+
+        endpoint = entry['endpoint']
+        specs.append(StackSpec(
+            key=str(entry.get('id', entry['name'])),
+            name=str(entry['name']),
+            endpoint=endpoint if isinstance(endpoint, int) else str(endpoint),
+            file=path.join(base_dir, entry['file']) if entry.get('file') else None,
+            update_keys=[str(pair) for pair in update_keys],
+            depends_on=[str(key) for key in depends_on],
+            absent=absent
+        ))
+
+    check_dependencies(specs)
+    return specs, [str(pattern) for pattern in data.get('prune') or []]
+
+
+def check_dependencies(specs: list) -> None:
+    """Check that the keys of the stacks are unique and their dependencies form a DAG.
+
+    Args:
+        specs (list): StackSpec of the plan.
+
+    Raises:
+        ValueError: If a key is duplicated, a dependency is unknown or absent, or dependencies are circular.
+    """
+    by_key = {}
+    for spec in specs:
+        if spec.key in by_key:
+            raise ValueError(f'Stack {spec.key} is declared twice, set a different id to each of them.')
+        by_key[spec.key] = spec
+
+    for spec in specs:
+        for key in spec.depends_on:
+            if key not in by_key:
+                raise ValueError(f'Stack {spec.key} depends on {key}, which is not declared.')
+            if by_key[key].absent and not spec.absent:
+                raise ValueError(f'Stack {spec.key} depends on {key}, which is absent.')
+
+    # Depth first search, a stack found again while its dependencies are visited closes a cycle
+    visiting, visited = [], set()
+
+    def visit(key: str) -> None:
+        if key in visited:
+            return
+        if key in visiting:
+            cycle = visiting[visiting.index(key):] + [key]
+            raise ValueError(f'Circular dependencies: {" -> ".join(cycle)}.')
+        visiting.append(key)
+        for dependency in by_key[key].depends_on:
+            visit(dependency)
+        visiting.pop()
+        visited.add(key)
+
+    for spec in specs:
+        visit(spec.key)
+
+
+def compute_actions(specs: list, endpoint_ids: dict, remote: dict, desired: dict, prune: list = None) -> list:
+    """Compute the actions taking Portainer from its current state to the one declared.
+
+    Args:
+        specs (list): StackSpec of the plan.
+        endpoint_ids (dict): Endpoint ids by the endpoint of every StackSpec, as written in the plan file.
+        remote (dict): Stacks of Portainer keyed by (endpoint id, name).
+        desired (dict): By key of the stacks present, a (content, changed) tuple, where changed is True if the content
+            differs from the one in Portainer. Missing stacks are not looked up.
+        prune (list, optional): Glob patterns of the stacks to delete from the endpoints of the plan when they are not
+            declared. Defaults to None.
+
+    Returns:
+        list: Actions, with their ordering constraints in after.
+    """
+    by_key = {spec.key: spec for spec in specs}
+    actions = []
+    for spec in specs:
+        endpoint_id = endpoint_ids[spec.endpoint]
+        stack = remote.get((endpoint_id, spec.name))
+        stack_id = stack['Id'] if stack else None
+
+        if spec.absent:
+            # Stacks depending on a deleted one are deleted first
+            after = tuple(other.key for other in specs if spec.key in other.depends_on and other.absent)
+            actions.append(Action('delete' if stack else 'noop', spec.key, spec.name, endpoint_id, stack_id, after=after))
+            continue
+
+        content, changed = desired[spec.key]
+        kind = 'create' if stack is None else 'update' if changed else 'noop'
+        after = tuple(key for key in spec.depends_on if not by_key[key].absent)
+        actions.append(Action(kind, spec.key, spec.name, endpoint_id, stack_id, spec.file, content, after))
+
+    if prune:
+        endpoints = set(endpoint_ids.values())
+        declared = {(endpoint_ids[spec.endpoint], spec.name) for spec in specs}
+        for (endpoint_id, name), stack in sorted(remote.items(), key=lambda item: item[1]['Id']):
+            if endpoint_id in endpoints and (endpoint_id, name) not in declared and any(fnmatchcase(name, pattern) for pattern in prune):
+                actions.append(Action('delete', f'{endpoint_id}/{name}', name, endpoint_id, stack['Id']))
+
+    return actions
+
+
+def run_actions(actions: list, run, workers: int) -> dict:
+    """Run the actions of a plan in parallel, every one as soon as the ones it comes after succeeded. The actions
+    coming after a failed one are skipped.
+
+    Args:
+        actions (list): Actions of the plan.
+        run (function): Function running an action and returning a response.
+        workers (int): Maximum number of actions run at the same time.
+
+    Returns:
+        dict: Responses by key of the action.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    by_key = {action.key: action for action in actions}
+    waiting = {action.key: {key for key in action.after if key in by_key} for action in actions}
+    dependents = {action.key: [] for action in actions}
+    for action in actions:
+        for key in waiting[action.key]:
+            dependents[key].append(action.key)
+
+    results = {}
+
+    def skip(key: str) -> None:
+        for dependent in dependents[key]:
+            if dependent in waiting:
+                del waiting[dependent]
+                results[dependent] = generate_response(f'Skipped, as {key} failed.')
+                skip(dependent)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while True:
+            for key in [key for key, pending in waiting.items() if not pending]:
+                del waiting[key]
+                running[executor.submit(run, by_key[key])] = key
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    results[key] = generate_response(str(e))
+
+                if results[key]['status']:
+                    for dependent in dependents[key]:
+                        if dependent in waiting:
+                            waiting[dependent].discard(key)
+                else:
+                    skip(key)
+
+    return results
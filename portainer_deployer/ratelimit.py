@@ -0,0 +1,218 @@
+from email.utils import parsedate_to_datetime
+from random import uniform
+from threading import Condition, Lock
+from time import monotonic, sleep, time
+
+# Statuses meaning Portainer, or a proxy in front of it, is throttling the client
+THROTTLE_STATUS = (429, 503)
+
+# 503 responses are only retried for methods that are safe to repeat, a 429 was never processed
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+
+def is_throttled(status: int, method: str) -> bool:
+    """Check if a response means the request was throttled and can be retried.
+
+    Args:
+        status (int): Status code of the response.
+        method (str): HTTP method of the request.
+
+    Returns:
+        bool: True if the request can be retried after a backoff, False otherwise.
+    """
+    return status in THROTTLE_STATUS and (status != 503 or method.upper() in IDEMPOTENT_METHODS)
+
+
+def retry_after_seconds(value: str) -> float:
+    """Parse a Retry-After header, given in seconds or as an HTTP date.
+
+    Args:
+        value (str): Value of the header.
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Get an exponential backoff with full jitter, so throttled clients do not retry in lockstep.
+
+    Args:
+        attempt (int): Number of the retry, starting at 0.
+        base (float): Seconds of the first backoff window.
+        cap (float): Maximum seconds to wait.
+
+    Returns:
+        float: Seconds to wait.
+    """
+    return uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Client-side rate limiter. Every request takes a token, tokens are refilled at a constant rate up to a burst size.
+    """
+    def __init__(self, rate: float, burst: float = None) -> None:
+        """Initialize the TokenBucket class.
+
+        Args:
+            rate (float): Requests per second. 0 disables the limiter.
+            burst (float, optional): Maximum requests sent at once after being idle. Defaults to the rate, at least 1.
+        """
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated_at = monotonic()
+        self._lock = Lock()
+
+    def reserve(self) -> float:
+        """Take a token, going into debt if there is none, so every caller waits for its own token in order.
+
+        Returns:
+            float: Seconds to wait before sending the request.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate) - 1
+            self._updated_at = now
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> None:
+        """Block until a request can be sent.
+        """
+        delay = self.reserve()
+        if delay:
+            sleep(delay)
+
+    async def acquire_async(self) -> None:
+        """Wait, without blocking the event loop, until a request can be sent.
+        """
+        delay = self.reserve()
+        if delay:
+            import asyncio
+            await asyncio.sleep(delay)
+
+
+class AdaptiveConcurrency:
+    """Limit of requests in flight, adapted with AIMD: it grows by one per window of successful requests
+    and is multiplied by a factor when Portainer throttles. Use it as a context manager around every request.
+    """
+    def __init__(self, limit: int, minimum: int = 1, maximum: int = None, decrease_factor: float = 0.5, cooldown: float = 1.0) -> None:
+        """Initialize the AdaptiveConcurrency class.
+
+        Args:
+            limit (int): Initial number of requests in flight.
+            minimum (int, optional): The limit never goes below it. Defaults to 1.
+            maximum (int, optional): The limit never goes above it. Defaults to the initial limit.
+            decrease_factor (float, optional): Factor applied to the limit when throttled. Defaults to 0.5.
+            cooldown (float, optional): Seconds after a decrease in which other throttled responses, sent before it, are ignored. Defaults to 1.0.
+        """
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum or limit)
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self._limit = float(min(max(limit, self.minimum), self.maximum))
+        self._active = 0
+        self._decreased_at = None
+        self._condition = Condition()
+
+    # ============== Setters & Getters ==============
+    @property
+    def limit(self) -> int:
+        """Get the current number of requests allowed in flight.
+
+        Returns:
+            int: Current limit.
+        """
+        return max(self.minimum, int(self._limit))
+
+    # ============== Public Methods ==============
+    def expand(self, size: int) -> None:
+        """Raise the maximum and the current limit to at least the given size, i.e. when more workers are started.
+
+        Args:
+            size (int): Number of concurrent requests expected.
+        """
+        with self._condition:
+            self.maximum = max(self.maximum, size)
+            self._limit = max(self._limit, float(size))
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        """Grow the limit additively, by one after as many successes as the current limit.
+        """
+        with self._condition:
+            self._limit = min(float(self.maximum), self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    def on_throttle(self) -> None:
+        """Shrink the limit multiplicatively, once per cooldown.
+        """
+        with self._condition:
+            now = monotonic()
+            if self._decreased_at is not None and now - self._decreased_at < self.cooldown:
+                return
+            self._decreased_at = now
+            self._limit = max(float(self.minimum), self._limit * self.decrease_factor)
+
+    def acquire(self) -> None:
+        """Block until a request can be sent within the limit.
+        """
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self) -> None:
+        """Release the slot of a finished request.
+        """
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def __enter__(self) -> 'AdaptiveConcurrency':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class AsyncAdaptiveConcurrency(AdaptiveConcurrency):
+    """AdaptiveConcurrency for asyncio code. Use it as an async context manager around every request.
+    Waiters are woken up when a request finishes, which is also when the limit grows.
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        # Created inside the running event loop on first use
+        self._async_condition = None
+
+    async def __aenter__(self) -> 'AsyncAdaptiveConcurrency':
+        if self._async_condition is None:
+            import asyncio
+            self._async_condition = asyncio.Condition()
+
+        async with self._async_condition:
+            await self._async_condition.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        async with self._async_condition:
+            self._active -= 1
+            self._async_condition.notify_all()
@@ -0,0 +1,339 @@
+from hashlib import sha256
+from os import fstat, urandom
+import mmap
+import sys
+
+# Bytes read from a stack file at a time, and released from memory at once. A multiple of the page size
+CHUNK_SIZE = 1024 * 1024
+
+# Compressed bodies are kept in memory up to this size, and in a temporary file past it
+SPOOL_SIZE = 1024 * 1024
+
+
+class StackFile:
+    """Stack file mapped in memory and read in chunks, so it is hashed, validated and uploaded without ever being held
+    whole in memory. The pages already read are released, so the memory used does not grow with the size of the file.
+    """
+    def __init__(self, path: str) -> None:
+        """Initialize the StackFile class.
+
+        Args:
+            path (str): Path to the file.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        self.size = fstat(self._file.fileno()).st_size
+
+        # Empty files can not be mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._released = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        """Read a part of the file and release the pages read before it.
+
+        Args:
+            offset (int): Position of the first byte.
+            size (int): Maximum number of bytes.
+
+        Returns:
+            bytes: Bytes read, empty at the end of the file.
+        """
+        if self._map is None or offset >= self.size:
+            return b''
+
+        data = self._map[offset:offset + size]
+
+        # The chunks left behind are released, they stay in the page cache and are only removed from the memory of the
+        # process. Only whole chunks are released: touching a released page again would map its neighbours back too
+        if hasattr(self._map, 'madvise'):
+            released = offset - offset % CHUNK_SIZE
+            if released < self._released:
+                # Read again from an earlier position, i.e. when a request is retried
+                self._released = released
+            elif released > self._released:
+                self._map.madvise(mmap.MADV_DONTNEED, self._released, released - self._released)
+                self._released = released
+        return data
+
+    def chunks(self):
+        """Iterate over the content of the file.
+
+        Yields:
+            bytes: Chunks of CHUNK_SIZE bytes, the last one may be shorter.
+        """
+        for offset in range(0, self.size, CHUNK_SIZE):
+            yield self.read_at(offset, CHUNK_SIZE)
+
+    def digest(self) -> str:
+        """Hash the content of the file, as content_hash does.
+
+        Returns:
+            str: sha256 hex digest of the content.
+        """
+        digest = sha256()
+        for chunk in self.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def is_valid_yaml(self) -> bool:
+        """Check that the file is a non empty yaml document, as validate_yaml does. It is parsed as a stream of events,
+        checked as the composer and the constructor would, so the document is never built in memory.
+
+        Returns:
+            bool: True if is valid, False otherwise.
+        """
+        from yaml import parse, YAMLError
+        from .utils import yaml_loader_dumper
+
+        if not self.size:
+            return False
+
+        Loader, _ = yaml_loader_dumper()
+        try:
+            _check_events(parse(_StackFileReader(self), Loader=Loader), Loader)
+            return True
+        except (YAMLError, UnicodeDecodeError):
+            return False
+
+
+def _check_events(events, Loader) -> None:
+    """Raise the errors loading the document would, without building it: undefined aliases, duplicate anchors, several
+    documents, unknown tags and collections used as mapping keys. Only the anchors and the open collections are kept.
+
+    Raises:
+        yaml.ComposerError: If an alias, an anchor or the number of documents is not valid.
+        yaml.ConstructorError: If a tag is unknown or a key is not hashable.
+    """
+    from yaml import events as yaml_events
+    from yaml.composer import ComposerError
+    from yaml.constructor import ConstructorError
+
+    documents = 0
+    # Anchors of the document, with True for collections
+    anchors = {}
+    # Open collections, with True for mappings expecting a key
+    expecting_key = []
+    for event in events:
+        if isinstance(event, yaml_events.DocumentStartEvent):
+            documents += 1
+            if documents > 1:
+                raise ComposerError('expected a single document in the stream', None, 'but found another document', event.start_mark)
+            anchors = {}
+            continue
+
+        if isinstance(event, yaml_events.CollectionEndEvent):
+            expecting_key.pop()
+            continue
+
+        if not isinstance(event, yaml_events.NodeEvent):
+            continue
+
+        is_collection = isinstance(event, yaml_events.CollectionStartEvent)
+        if isinstance(event, yaml_events.AliasEvent):
+            if event.anchor not in anchors:
+                raise ComposerError(None, None, f'found undefined alias {event.anchor!r}', event.start_mark)
+            is_collection = anchors[event.anchor]
+        else:
+            if event.anchor is not None:
+                if event.anchor in anchors:
+                    raise ComposerError(f'found duplicate anchor {event.anchor!r}', None, 'second occurrence', event.start_mark)
+                anchors[event.anchor] = is_collection
+
+            tag = event.tag
+            if tag not in (None, '!') and tag not in Loader.yaml_constructors and not any(tag.startswith(prefix) for prefix in Loader.yaml_multi_constructors):
+                raise ConstructorError(None, None, f'could not determine a constructor for the tag {tag!r}', event.start_mark)
+
+        if expecting_key:
+            if expecting_key[-1] is True and is_collection:
+                raise ConstructorError('while constructing a mapping', None, 'found unhashable key', event.start_mark)
+            if expecting_key[-1] is not None:
+                expecting_key[-1] = not expecting_key[-1]
+
+        if isinstance(event, yaml_events.CollectionStartEvent):
+            # Sequences have no keys
+            expecting_key.append(True if isinstance(event, yaml_events.MappingStartEvent) else None)
+
+
+class _StackFileReader:
+    """File-like reader of a StackFile, releasing the pages as they are read.
+    """
+    def __init__(self, stack_file: StackFile) -> None:
+        self._stack_file = stack_file
+        self._position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stack_file.read_at(self._position, size if size >= 0 else self._stack_file.size)
+        self._position += len(data)
+        return data
+
+
+class MultipartBody:
+    """Sized file-like body of a multipart/form-data request, reading the files of the form as it is sent instead of
+    building the whole body in memory. It is rewound with seek(0) to send it again.
+    """
+    def __init__(self, form: dict, compress: bool = False) -> None:
+        """Initialize the MultipartBody class.
+
+        Args:
+            form (dict): Multipart fields, values can be a (content, filename) tuple, where content is a StackFile, bytes or str.
+            compress (bool, optional): If True, the body is sent gzip compressed, with a Content-Encoding header. Defaults to False.
+        """
+        boundary = urandom(16).hex()
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+
+        self._parts = []
+        for field, value in form.items():
+            if isinstance(value, tuple):
+                content, filename = value
+                self._parts.append(
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                    f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8')
+                )
+                self._parts.append(content.encode('utf-8') if isinstance(content, str) else content)
+                self._parts.append(b'\r\n')
+            else:
+                self._parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+        self._parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+
+        self._sizes = [part.size if isinstance(part, StackFile) else len(part) for part in self._parts]
+        self._length = sum(self._sizes)
+        self._position = 0
+
+        self._compressed = None
+        if compress:
+            self._compressed = self.__compress()
+
+    @property
+    def headers(self) -> dict:
+        """Get the headers describing the body.
+
+        Returns:
+            dict: Content-Type, Content-Length and Content-Encoding if compressed.
+        """
+        headers = {'Content-Type': self.content_type, 'Content-Length': str(len(self))}
+        if self._compressed is not None:
+            headers['Content-Encoding'] = 'gzip'
+        return headers
+
+    def __len__(self) -> int:
+        if self._compressed is not None:
+            return self._compressed_length
+        return self._length
+
+    def tell(self) -> int:
+        return self._compressed.tell() if self._compressed is not None else self._position
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if self._compressed is not None:
+            return self._compressed.seek(offset, whence)
+
+        base = {0: 0, 1: self._position, 2: self._length}[whence]
+        self._position = max(0, min(self._length, base + offset))
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        """Read the next bytes of the body.
+
+        Args:
+            size (int, optional): Maximum number of bytes, everything left if negative. Defaults to -1.
+
+        Returns:
+            bytes: Bytes read, empty at the end of the body.
+        """
+        if self._compressed is not None:
+            return self._compressed.read(size)
+
+        size = self._length - self._position if size is None or size < 0 else min(size, self._length - self._position)
+        chunks = []
+        offset = 0
+        for part, part_size in zip(self._parts, self._sizes):
+            if size <= 0:
+                break
+            if self._position < offset + part_size:
+                start = self._position - offset
+                length = min(size, part_size - start)
+                chunks.append(part.read_at(start, length) if isinstance(part, StackFile) else part[start:start + length])
+                self._position += length
+                size -= length
+            offset += part_size
+        return b''.join(chunks)
+
+    def close(self) -> None:
+        if self._compressed is not None:
+            self._compressed.close()
+
+    def __compress(self):
+        """Compress the body into a spooled temporary file, chunk by chunk.
+
+        Returns:
+            SpooledTemporaryFile: Compressed body, rewound.
+        """
+        from gzip import GzipFile
+        from tempfile import SpooledTemporaryFile
+
+        spool = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        with GzipFile(fileobj=spool, mode='wb', compresslevel=6, mtime=0) as gzip:
+            while True:
+                chunk = self.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                gzip.write(chunk)
+
+        self._compressed_length = spool.tell()
+        spool.seek(0)
+        return spool
+
+
+def spool_stdin(max_size: int):
+    """Copy stdin to a temporary file in chunks, so a stack read from it is uploaded as a file.
+
+    Args:
+        max_size (int): Maximum number of bytes allowed.
+
+    Raises:
+        ValueError: If stdin is bigger than max_size.
+
+    Returns:
+        NamedTemporaryFile: Temporary file with the content of stdin, removed when closed, or None if stdin is a terminal or empty.
+    """
+    from tempfile import NamedTemporaryFile
+
+    if sys.stdin is None or sys.stdin.isatty():
+        return None
+
+    stream = getattr(sys.stdin, 'buffer', None)
+    spool = NamedTemporaryFile(prefix='stdin-', suffix='.yml')
+    try:
+        written = 0
+        while True:
+            chunk = stream.read(CHUNK_SIZE) if stream is not None else sys.stdin.read(CHUNK_SIZE).encode('utf-8')
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_size:
+                raise ValueError(f'Stack from stdin is bigger than {max_size} bytes.')
+            spool.write(chunk)
+        spool.flush()
+        if not written:
+            spool.close()
+            return None
+    except BaseException:
+        spool.close()
+        raise
+
+    return spool
@@ -12,7 +12,29 @@ from .utils import \
     StdoutFormatter, \
     FormatterDispatcher, \
     logging, \
-    request_confirmation
+    request_confirmation, \
+    collect_stack_files, \
+    stack_name_from_path, \
+    iter_json_array, \
+    filter_stacks, \
+    match_stacks, \
+    read_stdin, \
+    watch_files, \
+    yaml_loader_dumper, \
+    parse_update_pairs, \
+    render_compose, \
+    content_hash, \
+    StackWriter, \
+    STACK_COLUMNS, \
+    DEFAULT_STACK_COLUMNS, \
+    OUTPUT_FORMATS, \
+    StackNotFoundError, \
+    EndpointNotFoundError, \
+    endpoint_ref
+from .template import \
+    ComposeTemplate, \
+    load_variants, \
+    substitute_variables
 
 __all__ = [
         'edit_yml_file', 
@@ -27,5 +49,26 @@ __all__ = [
         'StdoutFormatter',
         'FormatterDispatcher',
         'logging',
-        'request_confirmation'
+        'request_confirmation',
+        'collect_stack_files',
+        'stack_name_from_path',
+        'iter_json_array',
+        'filter_stacks',
+        'match_stacks',
+        'read_stdin',
+        'watch_files',
+        'yaml_loader_dumper',
+        'parse_update_pairs',
+        'render_compose',
+        'content_hash',
+        'StackWriter',
+        'STACK_COLUMNS',
+        'DEFAULT_STACK_COLUMNS',
+        'OUTPUT_FORMATS',
+        'StackNotFoundError',
+        'EndpointNotFoundError',
+        'endpoint_ref',
+        'ComposeTemplate',
+        'load_variants',
+        'substitute_variables'
     ]
\ No newline at end of file
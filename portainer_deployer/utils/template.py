@@ -0,0 +1,198 @@
+from json import dumps
+from re import compile as re_compile
+
+from ..metrics import metrics
+
+# ${{ name }} or ${{ name:-default }}. Unlike ${NAME}, it is not interpolated by Docker Compose
+PLACEHOLDER = re_compile(r'\$\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*(?::-(.*?))?\s*\}\}')
+
+# Values kept as they are in plain scalars, anything else is quoted. They can not start with an indicator, i.e. @ or -,
+# nor end with a colon, which would start a mapping
+SAFE_PLAIN = re_compile(r'[A-Za-z0-9_./][A-Za-z0-9_./+=@~:-]*(?<!:)')
+
+
+def substitute_variables(text: str, variables: dict) -> str:
+    """Replace the placeholders of a text, without any quoting.
+
+    Args:
+        text (str): Text with ${{ name }} placeholders, i.e. a stack name.
+        variables (dict): Values of the variables.
+
+    Raises:
+        ValueError: If a variable without default is missing.
+
+    Returns:
+        str: Text with the values of the variables.
+    """
+    missing = [match.group(1) for match in PLACEHOLDER.finditer(text) if match.group(1) not in variables and match.group(2) is None]
+    if missing:
+        raise ValueError(f'Missing template variables: {", ".join(dict.fromkeys(missing))}.')
+    return PLACEHOLDER.sub(lambda match: variables.get(match.group(1), match.group(2)), text)
+
+
+class ComposeTemplate:
+    """Compose document with ${{ name }} placeholders, parsed once and rendered for any number of variants.
+
+    The template is parsed when it is compiled, to find the yaml scalar each placeholder belongs to. Rendering is then a
+    join of text segments, with every value quoted as its scalar needs, so a variant is valid yaml whatever its values
+    and is never parsed again. Values of plain scalars are left unquoted when they are safe, i.e. replicas: ${{ n }}
+    renders as a number.
+    """
+    def __init__(self, content: str) -> None:
+        """Compile a template.
+
+        Args:
+            content (str): Compose document with placeholders.
+
+        Raises:
+            ValueError: If the template is not valid yaml.
+        """
+        from yaml import parse, ScalarEvent, YAMLError
+        from . import yaml_loader_dumper
+
+        Loader, _ = yaml_loader_dumper()
+        # Literal text and scalars with placeholders, in order
+        self._segments = []
+        self.variables = {}
+
+        position = 0
+        try:
+            with metrics.timer('yaml.validate'):
+                for event in parse(content, Loader=Loader):
+                    if not isinstance(event, ScalarEvent) or '${{' not in event.value:
+                        continue
+
+                    start, end = event.start_mark.index, event.end_mark.index
+                    self._segments.append(content[position:start])
+                    self._segments.append(self.__compile_scalar(content, start, end, event.value, event.style or None))
+                    position = end
+        except YAMLError as e:
+            raise ValueError(f'Template is not in a valid yaml format. {e}')
+
+        self._segments.append(content[position:])
+
+    def __compile_scalar(self, content: str, start: int, end: int, value: str, style: str) -> tuple:
+        """Split a scalar with placeholders into text and variables.
+
+        Returns:
+            tuple: Style of the scalar, indentation of its line, parts of its raw text and parts of its value. Parts
+            alternate text and (name, default) tuples.
+        """
+        def parts(text: str) -> list:
+            result, last = [], 0
+            for match in PLACEHOLDER.finditer(text):
+                result += [text[last:match.start()], (match.group(1), match.group(2))]
+                self.variables.setdefault(match.group(1), match.group(2))
+                last = match.end()
+            return result + [text[last:]]
+
+        line_start = content.rfind('\n', 0, start) + 1
+        line = content[line_start:start]
+        indentation = line[:len(line) - len(line.lstrip(' '))]
+        if style in ('|', '>'):
+            # Block scalars are indented one level more than the line they start on
+            first_line = content[content.find('\n', start) + 1:end]
+            indentation = first_line[:len(first_line) - len(first_line.lstrip(' '))]
+
+        return style, indentation, parts(content[start:end]), parts(value)
+
+    def missing_variables(self, variables: dict) -> list:
+        """Get the variables without default that are not set.
+
+        Args:
+            variables (dict): Values of the variables.
+
+        Returns:
+            list: Names of the missing variables.
+        """
+        return [name for name, default in self.variables.items() if default is None and name not in variables]
+
+    def render(self, variables: dict) -> str:
+        """Render a variant of the template.
+
+        Args:
+            variables (dict): Values of the variables, as str.
+
+        Raises:
+            ValueError: If a variable without default is missing.
+
+        Returns:
+            str: Compose document.
+        """
+        missing = self.missing_variables(variables)
+        if missing:
+            raise ValueError(f'Missing template variables: {", ".join(missing)}.')
+
+        rendered = []
+        for segment in self._segments:
+            rendered.append(segment if isinstance(segment, str) else self.__render_scalar(segment, variables))
+        return ''.join(rendered)
+
+    @staticmethod
+    def __render_scalar(scalar: tuple, variables: dict) -> str:
+        style, indentation, raw_parts, value_parts = scalar
+        values = {part[0]: variables.get(part[0], part[1]) for part in raw_parts if isinstance(part, tuple)}
+
+        if style in ('|', '>'):
+            return ''.join(part if isinstance(part, str) else values[part[0]].replace('\n', f'\n{indentation}') for part in raw_parts)
+
+        if style == '"':
+            return ''.join(part if isinstance(part, str) else dumps(values[part[0]], ensure_ascii=False)[1:-1] for part in raw_parts)
+
+        if style == "'" and not any('\n' in value for value in values.values()):
+            return ''.join(part if isinstance(part, str) else values[part[0]].replace("'", "''") for part in raw_parts)
+
+        if style is None:
+            text = ''.join(part if isinstance(part, str) else values[part[0]] for part in raw_parts)
+            if '\n' not in text and SAFE_PLAIN.fullmatch(text):
+                return text
+
+        # Anything else is written as a double-quoted scalar holding the exact value
+        return dumps(''.join(part if isinstance(part, str) else values[part[0]] for part in value_parts), ensure_ascii=False)
+
+
+def load_variants(path: str = None, pairs: list = None) -> list:
+    """Load the variables of the variants to render, from a vars file and KEY=VALUE pairs.
+
+    Args:
+        path (str, optional): yaml or JSON file with a mapping of variables, or a list of them for several variants. Defaults to None.
+        pairs (list, optional): KEY=VALUE pairs set in every variant. Defaults to None.
+
+    Raises:
+        ValueError: If the file or a pair is not valid.
+
+    Returns:
+        list: Variables of every variant, as dicts of str.
+    """
+    variants = [{}]
+    if path:
+        from yaml import load, YAMLError
+        from . import yaml_loader_dumper
+
+        Loader, _ = yaml_loader_dumper()
+        try:
+            with open(path, 'r') as f:
+                data = load(f, Loader=Loader)
+        except YAMLError as e:
+            raise ValueError(f'Vars file {path} is not in a valid yaml format. {e}')
+
+        variants = data if isinstance(data, list) else [data]
+        if not variants or not all(isinstance(variant, dict) for variant in variants):
+            raise ValueError(f'Vars file {path} must hold a mapping of variables, or a list of them.')
+
+    overrides = {}
+    for pair in pairs or []:
+        name, separator, value = pair.partition('=')
+        if not separator or not PLACEHOLDER.fullmatch(f'${{{{ {name} }}}}'):
+            raise ValueError(f'Invalid KEY=VALUE pair in --var argument: {pair}')
+        overrides[name] = value
+
+    return [{**{str(name): _scalar_str(value, name) for name, value in variant.items()}, **overrides} for variant in variants]
+
+
+def _scalar_str(value, name) -> str:
+    if isinstance(value, (dict, list)):
+        raise ValueError(f'Template variable {name} must be a scalar.')
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return '' if value is None else str(value)
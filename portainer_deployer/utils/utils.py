@@ -1,10 +1,15 @@
 from datetime import datetime as dt
-from hashlib import sha256
-from yaml import Loader, load, dump, YAMLError
-from re import match
-from typing import Any
-from os import path, access, W_OK, R_OK
+from fnmatch import fnmatchcase
+from re import compile as re_compile, match, split as re_split
+from typing import Any, Iterable, Iterator
+from json import JSONDecoder, JSONDecodeError, dumps
+from codecs import getincrementaldecoder
+from os import path, access, listdir, stat, W_OK, R_OK
+from time import sleep, strftime, localtime, perf_counter
+from threading import RLock
+from ..metrics import metrics
 import logging
+import sys
 
 
 def format_stack_info_generator(stacks: list):
@@ -21,12 +26,120 @@ def format_stack_info_generator(stacks: list):
             stack['Id'], 
             stack['EndpointId'], 
             stack['Name'], 
-            f"{dt.fromtimestamp(stack['CreationDate']).strftime('%m-%d-%y %H:%m')} by {stack['CreatedBy']}",
-            f"{dt.fromtimestamp(stack['UpdateDate']).strftime('%m-%d-%y %H:%m')} by {stack['UpdatedBy']}"
+            f"{dt.fromtimestamp(stack['CreationDate']).strftime('%m-%d-%y %H:%M')} by {stack['CreatedBy']}",
+            f"{dt.fromtimestamp(stack['UpdateDate']).strftime('%m-%d-%y %H:%M')} by {stack['UpdatedBy']}"
         )
         yield stack_info
 
 
+def iter_json_array(chunks: Iterable) -> Iterator:
+    """Decode a JSON array incrementally, yielding its items as soon as they are complete, so the whole body never has to be held in memory.
+
+    Args:
+        chunks (Iterable): Chunks of the JSON document, as bytes (utf-8) or str.
+
+    Raises:
+        ValueError: If the document is not a JSON array or it is truncated.
+
+    Yields:
+        Any: Items of the array.
+    """
+    decoder = JSONDecoder()
+    utf8 = getincrementaldecoder('utf-8')()
+    buffer = ''
+    started = False
+
+    for chunk in chunks:
+        buffer += utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        pos = 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+
+            if pos == len(buffer):
+                break
+
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('Expected a JSON array.')
+                started = True
+                pos += 1
+                continue
+
+            if buffer[pos] == ']':
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except JSONDecodeError:
+                # Incomplete item, wait for the next chunk
+                break
+
+            # Numbers and literals have no closing delimiter, so they are only complete once a separator follows them.
+            # i.e. 1 of 1.5 split as [1. and 5]
+            if not isinstance(item, (dict, list, str)) and (end == len(buffer) or buffer[end] not in ' \t\r\n,]'):
+                break
+
+            yield item
+            pos = end
+
+        buffer = buffer[pos:]
+
+    raise ValueError('Truncated JSON array.')
+
+
+def filter_stacks(stacks: Iterable, endpoint_id: int = None, name_prefix: str = None) -> Iterator:
+    """Filter raw stacks from Portainer by endpoint and name prefix.
+
+    Args:
+        stacks (Iterable): Raw stacks from Portainer.
+        endpoint_id (int, optional): Id of the endpoint the stacks must belong to. Defaults to None.
+        name_prefix (str, optional): Prefix the stack names must start with. Defaults to None.
+
+    Yields:
+        dict: Raw stacks matching the filters.
+    """
+    for stack in stacks:
+        if endpoint_id is not None and stack.get('EndpointId') != endpoint_id:
+            continue
+        if name_prefix and not stack.get('Name', '').startswith(name_prefix):
+            continue
+        yield stack
+
+
+def match_stacks(stacks: Iterable, names: list = None, ids: list = None, patterns: list = None, regexes: list = None, endpoint_id: int = None) -> list:
+    """Select raw stacks from Portainer by their exact names or ids, or by glob patterns or regular expressions of their names.
+
+    Args:
+        stacks (Iterable): Raw stacks from Portainer.
+        names (list, optional): Exact names of the stacks. Defaults to None.
+        ids (list, optional): Ids of the stacks. Defaults to None.
+        patterns (list, optional): Glob patterns the names must match, i.e. pr-*. Defaults to None.
+        regexes (list, optional): Regular expressions searched in the names, i.e. ^pr-[0-9]+$. Defaults to None.
+        endpoint_id (int, optional): Id of the endpoint the stacks must belong to. Defaults to None.
+
+    Raises:
+        ValueError: If a regular expression is invalid.
+
+    Returns:
+        list: Stacks matching any of the selectors, in the order of the listing.
+    """
+    names, ids, patterns = set(names or ()), set(ids or ()), list(patterns or ())
+    try:
+        regexes = [re_compile(regex) for regex in regexes or ()]
+    except Exception as e:
+        raise ValueError(f'Invalid regular expression: {e}')
+
+    return [
+        stack for stack in filter_stacks(stacks, endpoint_id=endpoint_id)
+        if stack.get('Name') in names
+        or stack.get('Id') in ids
+        or any(fnmatchcase(stack.get('Name', ''), pattern) for pattern in patterns)
+        or any(regex.search(stack.get('Name', '')) for regex in regexes)
+    ]
+
+
 def format_stack_info(stack: dict):
     """Format the stack info from Portainer.
 
@@ -43,17 +156,209 @@ def format_stack_info(stack: dict):
         stack['Id'], 
         stack['EndpointId'], 
         stack['Name'], 
-        f"{dt.fromtimestamp(stack['CreationDate']).strftime('%m-%d-%y %H:%m')} by {stack['CreatedBy']}",
-        f"{dt.fromtimestamp(stack['UpdateDate']).strftime('%m-%d-%y %H:%m')} by {stack['UpdatedBy']}"
+        f"{dt.fromtimestamp(stack['CreationDate']).strftime('%m-%d-%y %H:%M')} by {stack['CreatedBy']}",
+        f"{dt.fromtimestamp(stack['UpdateDate']).strftime('%m-%d-%y %H:%M')} by {stack['UpdatedBy']}"
     )
 
 
+def _format_timestamp(timestamp: int) -> str:
+    return strftime('%m-%d-%y %H:%M', localtime(timestamp))
+
+
+# Columns of a stack: (header, width in the table, getter). Dates are only formatted for the columns requested
+STACK_COLUMNS = {
+    'instance': ('Instance', 12, lambda stack: stack.get('Instance')),
+    'id': ('Id', 5, lambda stack: stack['Id']),
+    'endpoint': ('Endpoint Id', 12, lambda stack: stack['EndpointId']),
+    'name': ('Name', 30, lambda stack: stack['Name']),
+    'created': ('Creation', 30, lambda stack: f"{_format_timestamp(stack['CreationDate'])} by {stack['CreatedBy']}"),
+    'updated': ('Last Updated', 30, lambda stack: f"{_format_timestamp(stack['UpdateDate'])} by {stack['UpdatedBy']}"),
+    'creation_date': ('Creation Date', 14, lambda stack: stack['CreationDate']),
+    'created_by': ('Created By', 20, lambda stack: stack['CreatedBy']),
+    'update_date': ('Update Date', 14, lambda stack: stack['UpdateDate']),
+    'updated_by': ('Updated By', 20, lambda stack: stack['UpdatedBy']),
+    'status': ('Status', 8, lambda stack: stack.get('Status')),
+    'type': ('Type', 6, lambda stack: stack.get('Type')),
+}
+
+DEFAULT_STACK_COLUMNS = ('id', 'endpoint', 'name', 'created', 'updated')
+
+OUTPUT_FORMATS = ('table', 'json', 'ndjson', 'tsv')
+
+
+class StackWriter:
+    """Write stacks to a stream as they arrive, as a table, a JSON array, NDJSON or TSV.
+    Use it as a context manager, so the header and the end of the document are written.
+    """
+    def __init__(self, output: str = 'table', columns: list = None, stream=None) -> None:
+        """Initialize the StackWriter class.
+
+        Args:
+            output (str, optional): One of OUTPUT_FORMATS. Defaults to 'table'.
+            columns (list, optional): Columns to write, from STACK_COLUMNS. Defaults to DEFAULT_STACK_COLUMNS.
+            stream (optional): Text stream to write to. Defaults to sys.stdout.
+
+        Raises:
+            ValueError: If the output format or a column is unknown.
+        """
+        if output not in OUTPUT_FORMATS:
+            raise ValueError(f'Unknown output format: {output}. Use one of {", ".join(OUTPUT_FORMATS)}.')
+
+        columns = list(columns or DEFAULT_STACK_COLUMNS)
+        unknown = [column for column in columns if column not in STACK_COLUMNS]
+        if unknown:
+            raise ValueError(f'Unknown columns: {", ".join(unknown)}. Use any of {", ".join(STACK_COLUMNS)}.')
+
+        self._output = output
+        self._columns = columns
+        self._getters = [STACK_COLUMNS[column][2] for column in columns]
+        self._stream = stream
+        self._count = 0
+        self._lock = RLock()
+        self._render_seconds = 0.0
+
+        # The row format of the table is built once
+        self._row_format = ' '.join(f'{{{i}:<{STACK_COLUMNS[column][1]}}}' for i, column in enumerate(columns))
+
+    @property
+    def count(self) -> int:
+        """Get the number of stacks written.
+
+        Returns:
+            int: Number of stacks written.
+        """
+        return self._count
+
+    def __enter__(self):
+        if self._stream is None:
+            self._stream = sys.stdout
+
+        if self._output == 'table':
+            self._stream.write(self._row_format.format(*(STACK_COLUMNS[column][0] for column in self._columns)) + '\n')
+        elif self._output == 'tsv':
+            self._stream.write('\t'.join(self._columns) + '\n')
+        elif self._output == 'json':
+            self._stream.write('[')
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._output == 'json':
+            self._stream.write('\n]\n' if self._count else ']\n')
+        self._stream.flush()
+
+        # Only the time spent rendering rows is recorded, not the time waiting for them
+        metrics.record('output.render', self._render_seconds, count=self._count or 1, output=self._output)
+
+    @property
+    def columns(self) -> list:
+        """Get the columns written.
+
+        Returns:
+            list: Columns written.
+        """
+        return self._columns
+
+    def tagged(self, **fields) -> 'TaggedStackWriter':
+        """Get a writer adding fields to every stack written through this one, i.e. the instance the stacks come from.
+
+        Returns:
+            TaggedStackWriter: Writer sharing the stream of this one.
+        """
+        return TaggedStackWriter(self, fields)
+
+    def write(self, stack: dict) -> None:
+        """Write a stack. It is safe to call it from several threads.
+
+        Args:
+            stack (dict): Raw stack from Portainer.
+        """
+        start = perf_counter() if metrics.enabled else None
+        values = [getter(stack) for getter in self._getters]
+
+        with self._lock:
+            self.__write_values(values)
+            self._count += 1
+            if start is not None:
+                self._render_seconds += perf_counter() - start
+
+    def __write_values(self, values: list) -> None:
+        if self._output == 'table':
+            self._stream.write(self._row_format.format(*('' if value is None else value for value in values)) + '\n')
+        elif self._output == 'tsv':
+            self._stream.write('\t'.join('' if value is None else str(value).replace('\t', ' ').replace('\n', ' ') for value in values) + '\n')
+        elif self._output == 'json':
+            self._stream.write(('\n' if not self._count else ',\n') + dumps(dict(zip(self._columns, values))))
+        else:
+            # Every line is flushed, so consumers can start with the first stack
+            self._stream.write(dumps(dict(zip(self._columns, values))) + '\n')
+            self._stream.flush()
+
+
+class TaggedStackWriter:
+    """Writer adding fixed fields to every stack before passing it to a shared StackWriter.
+    Entering it does nothing, the shared writer is entered once by its owner.
+    """
+    def __init__(self, writer: StackWriter, fields: dict) -> None:
+        self._writer = writer
+        self._fields = fields
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def write(self, stack: dict) -> None:
+        """Write a stack with the fields added.
+
+        Args:
+            stack (dict): Raw stack from Portainer.
+        """
+        self._writer.write({**stack, **self._fields})
+
+
+class StackNotFoundError(Exception):
+    """Raised when a stack can not be found in Portainer."""
+
+
+class EndpointNotFoundError(Exception):
+    """Raised when an endpoint can not be found in Portainer."""
+
+
+def endpoint_ref(value: str):
+    """Parse an --endpoint argument, given by id or by name.
+
+    Args:
+        value (str): Value of the argument.
+
+    Returns:
+        int | str: Id of the endpoint if the value is a number, its name otherwise.
+    """
+    return int(value) if value.isdigit() else value
+
+
+def content_hash(content) -> str:
+    """Hash the content of a stack file.
+
+    Args:
+        content (str | bytes): Content of the stack file.
+
+    Returns:
+        str: sha256 hex digest of the content (str is encoded as utf-8).
+    """
+    from hashlib import sha256
+
+    return sha256(content.encode('utf-8') if isinstance(content, str) else content).hexdigest()
+
+
 def generate_random_hash() -> str:
     """Generate a pseudo-random hash.
 
     Returns:
         str: Random hash.
     """    
+    from hashlib import sha256
+
     random_hash = sha256(str(dt.now()).encode('utf-8')).hexdigest()
     return random_hash
 
@@ -91,6 +396,77 @@ def recursive_dict(dictionary: dict, keys: list, new_value: Any=None) -> dict:
     return dictionary
 
 
+def yaml_loader_dumper() -> tuple:
+    """Get the yaml Loader and Dumper classes, using the libyaml based ones when available.
+
+    Returns:
+        tuple: Loader and Dumper classes.
+    """
+    # yaml is only imported by the commands handling stack files
+    try:
+        from yaml import CLoader as Loader, CDumper as Dumper
+    except ImportError:
+        from yaml import Loader, Dumper
+
+    return Loader, Dumper
+
+
+def parse_update_pairs(pairs: list) -> list:
+    """Parse a list of key=value pairs, where the key is in dot notation. i.e. a.b.c=value1 d='[value2, value3]'
+
+    Args:
+        pairs (list): List of key=value pairs.
+
+    Raises:
+        ValueError: If a pair is not valid.
+
+    Returns:
+        list: List of (keys, value) tuples, where keys is the list of keys and value a str or a list of str.
+    """
+    updates = []
+    for pair in pairs:
+        if not validate_key_value(pair=pair):
+            raise ValueError(f'Invalid key=value pair in --update-keys argument: {pair}')
+
+        keys, new_value = pair.split('=', 1)
+        new_value = re_split(', |,', new_value[1:-1]) if new_value.startswith('[') else new_value
+        updates.append((keys.split('.'), new_value))
+
+    return updates
+
+
+@metrics.timed('yaml.render')
+def render_compose(stack: str, updates: list) -> str:
+    """Parse a compose document once, apply all the updates in memory and serialize it back.
+
+    Args:
+        stack (str): Compose document.
+        updates (list): List of (keys, value) tuples as returned by parse_update_pairs.
+
+    Raises:
+        ValueError: If the document is not valid yaml or it is not a mapping.
+
+    Returns:
+        str: Updated compose document.
+    """
+    from yaml import load, dump, YAMLError
+
+    Loader, Dumper = yaml_loader_dumper()
+    try:
+        data = load(stack, Loader=Loader) or dict()
+    except YAMLError as e:
+        raise ValueError(f'Stack is not in a valid yaml format. {e}')
+
+    if not isinstance(data, dict):
+        raise ValueError('Stack is not in a valid yaml format. A mapping is expected at the top level.')
+
+    for keys, new_value in updates:
+        recursive_dict(data, keys, new_value)
+
+    return dump(data, Dumper=Dumper)
+
+
+@metrics.timed('yaml.edit')
 def edit_yml_file(path: str, key_group:str, new_value: Any) -> None:
     """Edit a yaml file base in a chain of keys in dot notation. i.e. 'a.b.c'
 
@@ -99,6 +475,9 @@ def edit_yml_file(path: str, key_group:str, new_value: Any) -> None:
         keys (str): Keys in dot notation. 
         new_value (Any): New value to be set for the last key in the keys.
     """    
+    from yaml import load, dump
+
+    Loader, Dumper = yaml_loader_dumper()
     data = {}
     keys = key_group.split('.')
     
@@ -115,7 +494,7 @@ def edit_yml_file(path: str, key_group:str, new_value: Any) -> None:
             except KeyError:
                 return f"Wrong key secuence {keys}, not found in {path}."
 
-            dump(data, f) 
+            dump(data, f, Dumper=Dumper) 
     
     except FileNotFoundError:
         return f"File {path} not found."
@@ -142,6 +521,7 @@ def validate_key_value(pair: str) -> bool:
     return False
 
 
+@metrics.timed('yaml.validate')
 def validate_yaml(path: str = None, data: str = None) -> bool:
     """Validate a yaml file.
 
@@ -152,6 +532,9 @@ def validate_yaml(path: str = None, data: str = None) -> bool:
     Returns:
         bool: True if is valid, False otherwise.
     """    
+    from yaml import load, YAMLError
+
+    Loader, _ = yaml_loader_dumper()
     try:
         if path:
             with open(path, 'r') as f:
@@ -171,6 +554,159 @@ def validate_yaml(path: str = None, data: str = None) -> bool:
         return False
 
 
+def collect_stack_files(paths: list) -> list:
+    """Collect compose files from a list of files and directories. Directories are scanned (not recursively) for .yml and .yaml files.
+
+    Args:
+        paths (list): Paths to compose files or directories containing them.
+
+    Raises:
+        FileNotFoundError: If a path does not exist.
+
+    Returns:
+        list: Sorted paths of the compose files, without duplicates.
+    """
+    files = []
+    for item in paths:
+        if path.isdir(item):
+            files.extend(
+                path.join(item, name) for name in sorted(listdir(item))
+                if name.endswith(('.yml', '.yaml')) and path.isfile(path.join(item, name))
+            )
+        elif path.isfile(item):
+            files.append(item)
+        else:
+            raise FileNotFoundError(f"File {item} not found.")
+
+    return list(dict.fromkeys(files))
+
+
+def stack_name_from_path(path_to_file: str) -> str:
+    """Get a stack name from the name of its compose file. i.e. /path/to/web.yml -> web
+
+    Args:
+        path_to_file (str): Path to the compose file.
+
+    Returns:
+        str: Stack name.
+    """
+    return path.splitext(path.basename(path_to_file))[0]
+
+
+def _file_signature(path_to_file: str) -> tuple:
+    try:
+        st = stat(path_to_file)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _inotify_waiter(directories: list):
+    """Build a function that blocks until something changes in the given directories, using inotify.
+
+    Args:
+        directories (list): Directories to watch. Directories are watched instead of files, so files replaced by editors are noticed too.
+
+    Returns:
+        function: Function receiving a timeout in seconds and returning True if an event arrived, or None if inotify is not available.
+    """
+    try:
+        import ctypes, ctypes.util, os, select
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError, TypeError):
+        return None
+
+    if fd < 0:
+        return None
+
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    mask = 0x2 | 0x4 | 0x8 | 0x80 | 0x100 | 0x200
+    for directory in directories:
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            os.close(fd)
+            return None
+
+    def wait(timeout: float) -> bool:
+        ready, _, _ = select.select([fd], [], [], timeout)
+        try:
+            while ready and os.read(fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return bool(ready)
+
+    wait.close = lambda: os.close(fd)
+    return wait
+
+
+def watch_files(paths: list, interval: float = 1.0, debounce: float = 0.5, use_inotify: bool = True) -> Iterator:
+    """Watch files and yield every time some of them changed, once they stopped changing for debounce seconds.
+    inotify is used when available, falling back to polling the files every interval seconds.
+
+    Args:
+        paths (list): Paths of the files to watch.
+        interval (float, optional): Seconds between checks when polling. Defaults to 1.0.
+        debounce (float, optional): Seconds the files must stay unchanged before yielding, so bursts of writes are yielded once. Defaults to 0.5.
+        use_inotify (bool, optional): If False, the files are always polled. Defaults to True.
+
+    Yields:
+        list: Paths of the files that changed.
+    """
+    last = {item: _file_signature(item) for item in paths}
+    wait = _inotify_waiter(list(dict.fromkeys(path.dirname(path.abspath(item)) for item in paths))) if use_inotify else None
+
+    try:
+        while True:
+            if wait:
+                wait(interval)
+            else:
+                sleep(interval)
+
+            current = {item: _file_signature(item) for item in paths}
+            if current == last:
+                continue
+
+            # Wait until the writes settle down
+            while True:
+                sleep(debounce)
+                settled = {item: _file_signature(item) for item in paths}
+                if settled == current:
+                    break
+                current = settled
+
+            changed = [item for item in paths if current[item] != last[item]]
+            last = current
+            yield changed
+    finally:
+        if wait:
+            wait.close()
+
+
+def read_stdin(max_size: int) -> str:
+    """Read the whole stdin in a single bulk read, as long as it is not a terminal.
+
+    Args:
+        max_size (int): Maximum number of bytes allowed.
+
+    Raises:
+        ValueError: If stdin is bigger than max_size.
+
+    Returns:
+        str: Content of stdin decoded as utf-8, or None if stdin is a terminal.
+    """
+    if sys.stdin is None or sys.stdin.isatty():
+        return None
+
+    # Read one byte over the limit to know if it was exceeded without reading everything
+    stream = getattr(sys.stdin, 'buffer', None)
+    data = stream.read(max_size + 1) if stream is not None else sys.stdin.read(max_size + 1)
+    if len(data) > max_size:
+        raise ValueError(f'Stack from stdin is bigger than {max_size} bytes.')
+
+    return data.decode('utf-8') if isinstance(data, bytes) else data
+
+
 def generate_response(message: str, details: str=None, status: bool=False, code: int = None) -> dict:
     """Generate a response to be returned to the client.
     
@@ -39,6 +39,9 @@ setup(
         "PyYAML~=6.0",
         "requests~=2.27.1",
     ],
+    extras_require={
+        "async": ["aiohttp~=3.8"],
+    },
     tests_require=['unittest'],
     python_requires=">=3.8.0",
     packages=find_packages(),
@@ -0,0 +1,284 @@
+import gzip
+import json
+import re
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from urllib.parse import urlsplit, parse_qs
+from os import path as os_path
+
+from portainer_deployer.api import PortainerAPIConsumer
+from portainer_deployer.utils import EndpointNotFoundError, StackWriter
+
+
+def fake_stack(stack_id: int, name: str, endpoint_id: int = 1, content: str = '') -> dict:
+    return {'Id': stack_id, 'Name': name, 'EndpointId': endpoint_id, 'CreationDate': 0, 'UpdateDate': 0, 'CreatedBy': 'admin', 'UpdatedBy': 'admin', 'content': content}
+
+
+class FakePortainer(BaseHTTPRequestHandler):
+    """Minimal Portainer stacks API, recording the requests it receives.
+    """
+    stacks = {}
+    endpoints = []
+    requests = []
+    throttled = 0
+
+    def do_GET(self):
+        self.__handle('GET')
+
+    def do_POST(self):
+        self.__handle('POST')
+
+    def do_PUT(self):
+        self.__handle('PUT')
+
+    def do_DELETE(self):
+        self.__handle('DELETE')
+
+    def log_message(self, *args):
+        pass
+
+    def __send(self, code: int, body=None) -> None:
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def __handle(self, method: str) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            raw = gzip.decompress(raw)
+        self.requests.append((method, url.path, query))
+
+        if self.throttled:
+            FakePortainer.throttled -= 1
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if url.path == '/api/endpoints' and method == 'GET':
+            return self.__send(200, self.endpoints)
+
+        if url.path == '/api/stacks' and method == 'GET':
+            return self.__send(200, list(self.stacks.values()))
+
+        if url.path == '/api/stacks' and method == 'POST':
+            if query.get('method') == ['string']:
+                body = json.loads(raw)
+                name, content = body['name'], body['stackFileContent']
+            else:
+                name = re.search(rb'name="Name"\r\n\r\n([^\r]*)', raw).group(1).decode('utf-8')
+                content = raw.split(b'filename=', 1)[1].split(b'\r\n\r\n', 1)[1].rsplit(b'\r\n--', 1)[0].decode('utf-8')
+            stack = fake_stack(max(self.stacks, default=0) + 1, name, int(query['endpointId'][0]), content)
+            self.stacks[stack['Id']] = stack
+            return self.__send(200, stack)
+
+        match = re.match(r'^/api/stacks/(\d+)(/file)?$', url.path)
+        stack = self.stacks.get(int(match.group(1))) if match else None
+        if stack is None:
+            return self.__send(404, {'message': 'Not found', 'details': 'Stack not found'})
+
+        if method == 'GET':
+            return self.__send(200, {'StackFileContent': stack['content']} if match.group(2) else stack)
+        if method == 'PUT':
+            stack['content'] = json.loads(raw)['stackFileContent']
+            return self.__send(200, stack)
+        if method == 'DELETE':
+            del self.stacks[stack['Id']]
+            return self.__send(204)
+
+
+class PortainerAPIConsumerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakePortainer)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakePortainer.stacks.clear()
+        FakePortainer.endpoints = [{'Id': 1, 'Name': 'local', 'URL': 'unix:///var/run/docker.sock', 'Type': 1, 'Status': 1}]
+        FakePortainer.requests.clear()
+        FakePortainer.throttled = 0
+
+        self._tmp = TemporaryDirectory()
+        config_path = os_path.join(self._tmp.name, 'app.conf')
+        with open(config_path, 'w') as f:
+            f.write(f'[PORTAINER]\nurl=http://127.0.0.1:{self.server.server_port}\ntoken=t\nverify_ssl=no\ncache_dir={self._tmp.name}\n')
+
+        self.api = PortainerAPIConsumer(config_path)
+
+    def tearDown(self):
+        self.api.close()
+        self._tmp.cleanup()
+
+    def requests(self, method: str = None, path: str = None) -> list:
+        return [request for request in FakePortainer.requests if method in (None, request[0]) and path in (None, request[1])]
+
+    def test_verify_ssl_is_not_replaced_by_the_environment(self):
+        with patch.dict('os.environ', {'REQUESTS_CA_BUNDLE': '/etc/ssl/certs/ca-certificates.crt'}), \
+                patch.object(self.api._session, 'request', wraps=self.api._session.request) as request:
+            self.api.get_stack(writer=StackWriter('ndjson', stream=StringIO()))
+
+        self.assertIs(request.call_args.kwargs['verify'], False)
+
+    def test_update_stack(self):
+        FakePortainer.stacks[1] = fake_stack(1, 'web', content='version: "3"\n')
+
+        response = self.api.update_stack('version: "3"\n', endpoint_id=1, name='web')
+        self.assertTrue(response['status'])
+        self.assertEqual(self.requests('PUT'), [])
+
+        response = self.api.update_stack('version: "3.8"\n', endpoint_id=1, name='web')
+        self.assertTrue(response['status'])
+        self.assertEqual(FakePortainer.stacks[1]['content'], 'version: "3.8"\n')
+        self.assertEqual(self.requests('PUT')[0][2], {'endpointId': ['1']})
+
+        response = self.api.update_stack('version: "3"\n', endpoint_id=1, name='missing')
+        self.assertEqual(response['code'], 404)
+
+    def test_cached_id_is_resolved_again_after_a_404(self):
+        self.api.post_stack_from_str('version: "3"\n', endpoint_id=1, name='web')
+        self.api.get_stack(writer=StackWriter('ndjson', stream=StringIO()))
+
+        # The stack is recreated outside this tool, with another id
+        FakePortainer.stacks = {7: {**FakePortainer.stacks.pop(1), 'Id': 7}}
+        FakePortainer.requests.clear()
+
+        response = self.api.get_stack(name='web', writer=StackWriter('json', stream=StringIO()))
+        self.assertTrue(response['status'])
+        self.assertEqual(
+            [(method, path) for method, path, _ in FakePortainer.requests],
+            [('GET', '/api/stacks/1'), ('GET', '/api/stacks'), ('GET', '/api/stacks/7')]
+        )
+
+        response = self.api.delete_stack(1, stack_name='web')
+        self.assertTrue(response['status'])
+        self.assertEqual(FakePortainer.stacks, {})
+
+    def test_get_stack_file(self):
+        FakePortainer.stacks[1] = fake_stack(1, 'web', content='version: "3"\n')
+        self.assertEqual(self.api.get_stack_file(1), 'version: "3"\n')
+        self.assertIsNone(self.api.get_stack_file(2))
+
+    def test_endpoint_names_are_resolved_from_the_cache(self):
+        self.assertEqual(self.api.resolve_endpoint_id('local'), 1)
+        self.assertEqual(self.api.resolve_endpoint_id('local'), 1)
+        self.assertEqual(self.api.resolve_endpoint_id(2), 2)
+        self.assertEqual(len(self.requests('GET', '/api/endpoints')), 1)
+
+        # A name missing from the cache lists the endpoints again
+        FakePortainer.endpoints.append({'Id': 2, 'Name': 'edge', 'URL': 'tcp://edge:9001', 'Type': 4, 'Status': 2})
+        self.assertEqual(self.api.resolve_endpoint_id('edge'), 2)
+        with self.assertRaises(EndpointNotFoundError):
+            self.api.resolve_endpoint_id('missing')
+        self.assertEqual(len(self.requests('GET', '/api/endpoints')), 3)
+
+        # The cache is kept on disk for the next commands
+        api = PortainerAPIConsumer(os_path.join(self._tmp.name, 'app.conf'))
+        self.assertEqual(api.resolve_endpoint_id('edge'), 2)
+        self.assertEqual(len(self.requests('GET', '/api/endpoints')), 3)
+        api.close()
+
+    def test_manifest_skips_identical_deploys(self):
+        path = os_path.join(self._tmp.name, 'docker-compose.yml')
+        with open(path, 'w') as f:
+            f.write('version: "3"\nservices:\n  web:\n    image: nginx\n')
+
+        response = self.api.post_stack_from_file(path, endpoint_id=1, name='web')
+        self.assertTrue(response['status'])
+        self.assertEqual(FakePortainer.stacks[1]['content'], 'version: "3"\nservices:\n  web:\n    image: nginx\n')
+        FakePortainer.requests.clear()
+
+        response = self.api.post_stack_from_file(path, endpoint_id=1, name='web')
+        self.assertTrue(response['status'])
+        self.assertEqual(FakePortainer.requests, [])
+
+        # Verification checks the file on the server, and deploys again once it is gone
+        del FakePortainer.stacks[1]
+        self.api.post_stack_from_file(path, endpoint_id=1, name='web', verify=True)
+        self.assertEqual([(method, path) for method, path, _ in FakePortainer.requests], [('GET', '/api/stacks/1/file'), ('POST', '/api/stacks')])
+
+    def test_stack_file_is_uploaded_again_when_throttled(self):
+        path = os_path.join(self._tmp.name, 'docker-compose.yml')
+        content = 'version: "3"\nservices:\n' + ''.join(f'  web{i}:\n    image: nginx\n' for i in range(50000))
+        with open(path, 'w') as f:
+            f.write(content)
+
+        FakePortainer.throttled = 1
+        response = self.api.post_stack_from_file(path, endpoint_id=1, name='big')
+
+        self.assertTrue(response['status'])
+        self.assertEqual(len(self.requests('POST', '/api/stacks')), 2)
+        self.assertEqual(FakePortainer.stacks[1]['content'], content)
+
+    def test_stack_file_is_compressed_when_enabled(self):
+        path = os_path.join(self._tmp.name, 'docker-compose.yml')
+        with open(path, 'w') as f:
+            f.write('version: "3"\nservices:\n  web:\n    image: nginx\n')
+
+        config_path = os_path.join(self._tmp.name, 'app.conf')
+        with open(config_path, 'a') as f:
+            f.write('compress_uploads=yes\n')
+        api = PortainerAPIConsumer(config_path)
+        with patch.object(api._session, 'request', wraps=api._session.request) as request:
+            response = api.post_stack_from_file(path, endpoint_id=1, name='web')
+        api.close()
+
+        self.assertTrue(response['status'])
+        self.assertEqual(request.call_args.kwargs['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(FakePortainer.stacks[1]['content'], 'version: "3"\nservices:\n  web:\n    image: nginx\n')
+
+    def test_streamed_listing(self):
+        for stack_id in range(1, 6):
+            FakePortainer.stacks[stack_id] = fake_stack(stack_id, f'stack-{stack_id}', endpoint_id=stack_id % 2 + 1)
+
+        stream = StringIO()
+        response = self.api.get_stack(writer=StackWriter('ndjson', columns=['id', 'name'], stream=stream))
+        self.assertTrue(response['status'])
+        self.assertEqual([json.loads(line)['id'] for line in stream.getvalue().splitlines()], [1, 2, 3, 4, 5])
+
+        # The complete listing filled the index, so names are resolved without listing again
+        FakePortainer.requests.clear()
+        self.assertEqual(self.api.resolve_stack_id('stack-4'), 4)
+        self.assertEqual(FakePortainer.requests, [])
+
+        stream = StringIO()
+        self.api.get_stack(endpoint_id=1, name_prefix='stack-', writer=StackWriter('ndjson', columns=['id'], stream=stream))
+        self.assertEqual([json.loads(line)['id'] for line in stream.getvalue().splitlines()], [2, 4])
+        self.assertEqual(self.requests('GET', '/api/stacks')[0][2], {'filters': ['{"EndpointID": 1}']})
+
+    def test_same_name_on_several_endpoints(self):
+        for endpoint_id in (1, 2, 3):
+            self.api.post_stack_from_str('version: "3"\n', endpoint_id=endpoint_id, name='web')
+
+        self.assertEqual(self.api.resolve_stack_id('web', endpoint_id=2), 2)
+
+        response = self.api.update_stack('version: "3.8"\n', endpoint_id=2, name='web')
+        self.assertTrue(response['status'])
+        self.assertEqual([stack['content'] for stack in FakePortainer.stacks.values()], ['version: "3"\n', 'version: "3.8"\n', 'version: "3"\n'])
+
+        stream = StringIO()
+        self.api.get_stack(name='web', endpoint_id=3, writer=StackWriter('ndjson', columns=['id'], stream=stream))
+        self.assertEqual(json.loads(stream.getvalue())['id'], 3)
+
+        response = self.api.delete_stack(1, stack_name='web')
+        self.assertTrue(response['status'])
+        self.assertEqual(self.requests('DELETE'), [('DELETE', '/api/stacks/1', {'endpointId': ['1'], 'external': ['false']})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from os import path as os_path
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+except ImportError:
+    web = None
+
+from portainer_deployer.aio import AsyncPortainerAPIConsumer
+
+
+def fake_stack(stack_id: int, name: str) -> dict:
+    return {'Id': stack_id, 'Name': name, 'EndpointId': 1, 'CreationDate': 0, 'UpdateDate': 0, 'CreatedBy': 'admin', 'UpdatedBy': 'admin'}
+
+
+@unittest.skipIf(web is None, 'aiohttp is not installed')
+class AsyncPortainerAPIConsumerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stacks = {i: fake_stack(i, f'stack-{i}') for i in range(1, 51)}
+        self.list_calls = 0
+        self.updates = 0
+        self.throttled = 0
+        self.uploads = []
+
+        async def list_stacks(request):
+            self.list_calls += 1
+            return web.json_response(list(self.stacks.values()))
+
+        async def get_stack(request):
+            if self.throttled:
+                self.throttled -= 1
+                return web.json_response({'message': 'Too many requests'}, status=429, headers={'Retry-After': '0'})
+            stack = self.stacks.get(int(request.match_info['id']))
+            if not stack:
+                return web.json_response({'message': 'Not found', 'details': 'Stack not found'}, status=404)
+            return web.json_response(stack)
+
+        async def delete_stack(request):
+            if self.stacks.pop(int(request.match_info['id']), None) is None:
+                return web.json_response({'message': 'Not found', 'details': 'Stack not found'}, status=404)
+            return web.Response(status=204)
+
+        async def get_stack_file(request):
+            stack = self.stacks.get(int(request.match_info['id']))
+            if not stack:
+                return web.json_response({'message': 'Not found', 'details': 'Stack not found'}, status=404)
+            return web.json_response({'StackFileContent': stack.get('content', '')})
+
+        async def update_stack(request):
+            stack = self.stacks[int(request.match_info['id'])]
+            stack['content'] = (await request.json())['stackFileContent']
+            self.updates += 1
+            return web.json_response(stack)
+
+        async def create_stack(request):
+            if self.throttled:
+                self.throttled -= 1
+                return web.json_response({'message': 'Too many requests'}, status=429, headers={'Retry-After': '0'})
+            if request.query.get('method') == 'file':
+                form = await request.post()
+                stack = fake_stack(max(self.stacks, default=0) + 1, form['Name'])
+                stack['content'] = form['file'].file.read().decode('utf-8')
+                self.uploads.append(request.headers.get('Content-Encoding'))
+            else:
+                stack = fake_stack(max(self.stacks, default=0) + 1, (await request.json())['name'])
+            stack['EndpointId'] = int(request.query.get('endpointId', 1))
+            self.stacks[stack['Id']] = stack
+            return web.json_response(stack)
+
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_get('/api/stacks', list_stacks)
+        app.router.add_post('/api/stacks', create_stack)
+        app.router.add_get('/api/stacks/{id}', get_stack)
+        app.router.add_delete('/api/stacks/{id}', delete_stack)
+        app.router.add_get('/api/stacks/{id}/file', get_stack_file)
+        app.router.add_put('/api/stacks/{id}', update_stack)
+
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        self._tmp = TemporaryDirectory()
+        config_path = os_path.join(self._tmp.name, 'app.conf')
+        with open(config_path, 'w') as f:
+            f.write(f'[PORTAINER]\nurl={str(self.server.make_url("")).rstrip("/")}\ntoken=t\nverify_ssl=no\ncache_dir={self._tmp.name}\nbackoff_factor=0\n')
+
+        self.config_path = config_path
+        self.api = AsyncPortainerAPIConsumer(config_path)
+
+    async def asyncTearDown(self):
+        await self.api.close()
+        await self.server.close()
+        self._tmp.cleanup()
+
+    async def test_concurrent_delete_by_name(self):
+        names = [f'stack-{i}' for i in range(1, 31)]
+        responses = await asyncio.gather(*(self.api.delete_stack(1, stack_name=name) for name in names))
+
+        self.assertTrue(all(response['status'] for response in responses))
+        self.assertEqual(len(self.stacks), 20)
+        self.assertEqual(self.list_calls, 1)
+
+    async def test_error_contract(self):
+        response = await self.api.get_stack(stack_id=999)
+        self.assertEqual(response, {'message': 'Not found', 'details': 'Stack not found', 'status': False, 'code': 404})
+
+        response = await self.api.delete_stack(1, stack_name='missing')
+        self.assertFalse(response['status'])
+        self.assertEqual(response['code'], 404)
+
+    async def test_stack_file_is_uploaded_again_when_throttled(self):
+        path = os_path.join(self._tmp.name, 'docker-compose.yml')
+        content = 'version: "3"\nservices:\n' + ''.join(f'  web{i}:\n    image: nginx\n' for i in range(50000))
+        with open(path, 'w') as f:
+            f.write(content)
+
+        self.throttled = 1
+        response = await self.api.post_stack_from_file(path, endpoint_id=1, name='big')
+
+        self.assertTrue(response['status'], response)
+        self.assertEqual(self.throttled, 0)
+        self.assertEqual(self.stacks[51]['content'], content)
+
+        # Compressed when the config allows it, and decoded by the server
+        with open(self.config_path, 'a') as f:
+            f.write('compress_uploads=yes\n')
+        async with AsyncPortainerAPIConsumer(self.config_path) as api:
+            response = await api.post_stack_from_file(path, endpoint_id=1, name='big-gzip', force=True)
+
+        self.assertTrue(response['status'], response)
+        self.assertEqual(self.stacks[52]['content'], content)
+        self.assertEqual(self.uploads, [None, 'gzip'])
+
+    async def test_throttled_requests_are_retried(self):
+        self.throttled = 2
+        response = await self.api.get_stack(stack_id=1)
+        self.assertTrue(response['status'])
+        self.assertEqual(self.throttled, 0)
+        self.assertLess(self.api._concurrency.limit, 10)
+
+    async def test_post_and_get_by_name(self):
+        response = await self.api.post_stack_from_str('version: "3"\n', endpoint_id=1, name='web')
+        self.assertTrue(response['status'])
+
+        # The created stack is resolved from the local index once it is fresh
+        await self.api.get_stack()
+        calls = self.list_calls
+        response = await self.api.get_stack(name='web')
+        self.assertTrue(response['status'])
+        self.assertEqual(self.list_calls, calls)
+
+
+    async def test_same_name_on_several_endpoints(self):
+        for endpoint_id in (1, 2, 3):
+            await self.api.post_stack_from_str('version: "3"\n', endpoint_id=endpoint_id, name='web')
+        web_ids = {stack['EndpointId']: stack['Id'] for stack in self.stacks.values() if stack['Name'] == 'web'}
+
+        response = await self.api.delete_stack(1, stack_name='web')
+        self.assertTrue(response['status'])
+        self.assertNotIn(web_ids[1], self.stacks)
+        self.assertIn(web_ids[2], self.stacks)
+        self.assertIn(web_ids[3], self.stacks)
+
+        # The stack index still resolves the remaining ones by endpoint
+        response = await self.api.delete_stack(3, stack_name='web')
+        self.assertTrue(response['status'])
+        self.assertEqual([stack['EndpointId'] for stack in self.stacks.values() if stack['Name'] == 'web'], [2])
+
+    async def test_manifest_is_written_once_per_context(self):
+        with patch('portainer_deployer.cache.deploy_manifest.write_json_atomic') as write:
+            async with AsyncPortainerAPIConsumer(self.config_path) as api:
+                responses = await asyncio.gather(*(api.post_stack_from_str('version: "3"\n', endpoint_id=i, name='web') for i in range(1, 21)))
+                self.assertEqual(write.call_count, 0)
+
+        self.assertTrue(all(response['status'] for response in responses))
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(len(write.call_args[0][1]), 20)
+
+    async def test_update_skips_unchanged_stacks(self):
+        self.stacks[1]['content'] = 'version: "3"\n'
+
+        response = await self.api.update_stack('version: "3"\n', endpoint_id=1, name='stack-1')
+        self.assertTrue(response['status'])
+        self.assertEqual(self.updates, 0)
+
+        response = await self.api.update_stack('version: "3.8"\n', endpoint_id=1, name='stack-1')
+        self.assertTrue(response['status'])
+        self.assertEqual((self.updates, self.stacks[1]['content']), (1, 'version: "3.8"\n'))
+
+        response = await self.api.update_stack('version: "3"\n', endpoint_id=1, name='missing')
+        self.assertEqual(response['code'], 404)
+
+    async def test_manifest_skips_identical_deploys(self):
+        await self.api.post_stack_from_str('version: "3"\n', endpoint_id=1, name='web')
+        created = len(self.stacks)
+
+        response = await self.api.post_stack_from_str('version: "3"\n', endpoint_id=1, name='web')
+        self.assertTrue(response['status'])
+        self.assertIn('unchanged', response['message'])
+        self.assertEqual(len(self.stacks), created)
+
+        # The stack was removed outside this tool, so verify deploys it again
+        self.stacks.pop(created)
+        response = await self.api.post_stack_from_str('version: "3"\n', endpoint_id=1, name='web', verify=True)
+        self.assertNotIn('unchanged', response['message'])
+        self.assertEqual(len(self.stacks), created)
+
+    async def test_local_work_runs_off_the_event_loop(self):
+        threads = []
+
+        def validate_yaml(data):
+            threads.append(threading.get_ident())
+            return True
+
+        with patch('portainer_deployer.base.validate_yaml', validate_yaml):
+            response = await self.api.post_stack_from_str('version: "3"\n', endpoint_id=1, name='web')
+
+        self.assertTrue(response['status'])
+        self.assertNotEqual(threads, [threading.get_ident()])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from os import path, stat, utime, replace
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from portainer_deployer.config import ConfigManager
+
+
+class ConfigManagerTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.config_path = path.join(self._tmp.name, 'app.conf')
+        with open(self.config_path, 'w') as f:
+            f.write('[PORTAINER]\nurl=http://localhost:9000\ntoken=abc\nverify_ssl=yes\n')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_file_is_parsed_once(self):
+        with patch('configparser.ConfigParser.read', autospec=True, side_effect=lambda parser, filenames: parser.read_string(open(filenames).read())) as read:
+            config = ConfigManager(self.config_path, default_section='PORTAINER')
+            config.get_var('url')
+            config.get_boolean_var('verify_ssl')
+            config.get_var_or_default('pool_maxsize', 10)
+
+            self.assertEqual(read.call_count, 1)
+            self.assertEqual(config.url, 'http://localhost:9000')
+
+    def test_reload_on_mtime_change(self):
+        config = ConfigManager(self.config_path, default_section='PORTAINER')
+        self.assertEqual(config.get_var('token'), 'abc')
+
+        mtime = stat(self.config_path).st_mtime_ns
+        with open(self.config_path, 'w') as f:
+            f.write('[PORTAINER]\nurl=http://localhost:9000\ntoken=xyz\nverify_ssl=yes\n')
+        utime(self.config_path, ns=(mtime + 10**9, mtime + 10**9))
+
+        self.assertEqual(config.get_var('token'), 'xyz')
+
+    def test_batch_writes_once(self):
+        config = ConfigManager(self.config_path)
+        with patch('portainer_deployer.config.config.replace', wraps=replace) as atomic_replace:
+            with config.batch():
+                config.set_var(key='url', new_value='https://portainer.lab', section='portainer')
+                config.set_var(key='token', new_value='new-token', section='portainer')
+
+            atomic_replace.assert_called_once()
+
+        reloaded = ConfigManager(self.config_path, default_section='PORTAINER')
+        self.assertEqual((reloaded.url, reloaded.token), ('https://portainer.lab', 'new-token'))
+
+    def test_failed_batch_is_discarded(self):
+        config = ConfigManager(self.config_path)
+        with patch('portainer_deployer.config.config.replace', wraps=replace) as atomic_replace:
+            with self.assertRaises(RuntimeError):
+                with config.batch():
+                    config.set_var(key='token', new_value='new-token', section='portainer')
+                    raise RuntimeError('Interrupted')
+
+            atomic_replace.assert_not_called()
+        self.assertEqual(config.get_var(key='token', section='PORTAINER'), 'abc')
+
+        # Assert the file is still reloaded when it changes afterwards
+        mtime = stat(self.config_path).st_mtime_ns
+        with open(self.config_path, 'w') as f:
+            f.write('[PORTAINER]\nurl=http://localhost:9000\ntoken=xyz\nverify_ssl=yes\n')
+        utime(self.config_path, ns=(mtime + 10**9, mtime + 10**9))
+
+        self.assertEqual(config.get_var(key='token', section='PORTAINER'), 'xyz')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from os import path
+import json
+import logging
+import subprocess
+import sys
+
+from portainer_deployer.app import PortainerDeployer
+from portainer_deployer.daemon import DeployerDaemon, delegate
+from portainer_deployer.utils import generate_response
+
+# The client runs in a process of its own, as the daemon swaps the standard streams of its process
+CLIENT = (
+    'import json, sys\n'
+    'from portainer_deployer.daemon import delegate\n'
+    'response = delegate(sys.argv[2:], stdin=sys.stdin.read() or None, socket_path=sys.argv[1])\n'
+    'print(json.dumps(response))\n'
+)
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = path.join(tmp.name, 'deployer.sock')
+
+        config_path = path.join(tmp.name, 'app.conf')
+        with open(config_path, 'w') as f:
+            f.write(f'[PORTAINER]\nurl=http://127.0.0.1:9\ntoken=test\ncache_dir={tmp.name}\n')
+
+        consumer_class = patch('portainer_deployer.api.PortainerAPIConsumer')
+        self.consumer_class = consumer_class.start()
+        self.addCleanup(consumer_class.stop)
+        self.consumer = self.consumer_class.return_value = MagicMock()
+
+        deployer = PortainerDeployer()
+        deployer.PATH_TO_CONFIG = config_path
+        self.daemon = DeployerDaemon(deployer, socket_path=self.socket_path, idle_timeout=1)
+
+        ready = Event()
+        self.thread = Thread(target=self.daemon.serve, args=(ready,), daemon=True)
+        self.thread.start()
+        ready.wait(5)
+
+    def tearDown(self):
+        self.thread.join(5)
+        self.assertFalse(path.exists(self.socket_path))
+
+    def run_client(self, *argv: str, stdin: str = '') -> tuple:
+        result = subprocess.run([sys.executable, '-c', CLIENT, self.socket_path, *argv], input=stdin, capture_output=True, text=True, check=True, timeout=30)
+        *output, response = result.stdout.splitlines()
+        return json.loads(response), output, result.stderr
+
+    def test_output_and_response_are_streamed_back(self):
+        def sync_inventory():
+            print('3 stacks synced')
+            logging.getLogger('stdout').warning('inventory was stale')
+            return generate_response('Inventory synced', status=True)
+        self.consumer.sync_inventory.side_effect = sync_inventory
+
+        response, output, stderr = self.run_client('sync')
+
+        self.assertTrue(response['status'])
+        self.assertEqual(response['message'], 'Inventory synced')
+        self.assertEqual(output, ['3 stacks synced'])
+        self.assertIn('inventory was stale', stderr)
+
+    def test_api_consumer_is_kept_between_commands(self):
+        self.consumer.sync_inventory.return_value = generate_response('Inventory synced', status=True)
+
+        self.run_client('sync')
+        self.run_client('sync')
+
+        self.consumer_class.assert_called_once()
+        self.assertEqual(self.consumer.sync_inventory.call_count, 2)
+
+    def test_stdin_is_sent_with_the_command(self):
+        stack = "version: '3'\nservices:\n  web:\n    image: nginx\n"
+        uploaded = []
+        def post_stack_from_file(path, **kwargs):
+            with open(path) as f:
+                uploaded.append(f.read())
+            return generate_response('Stack deployed', status=True)
+        self.consumer.post_stack_from_file.side_effect = post_stack_from_file
+
+        response, _, _ = self.run_client('deploy', '--endpoint', '1', '--name', 'web', stdin=stack)
+
+        self.assertTrue(response['status'])
+        self.assertEqual(uploaded, [stack])
+
+    def test_invalid_arguments_are_answered(self):
+        response, _, stderr = self.run_client('remove', '--id', 'not-a-number')
+
+        self.assertFalse(response['status'])
+        self.assertIn('invalid int value', stderr)
+
+
+class DelegateTest(unittest.TestCase):
+    def test_runs_locally_without_daemon(self):
+        with TemporaryDirectory() as tmp:
+            self.assertIsNone(delegate(['get', '--all'], socket_path=path.join(tmp, 'missing.sock')))
+
+    def test_runs_locally_when_disabled(self):
+        with TemporaryDirectory() as tmp, patch.dict('os.environ', {'PORTAINER_DEPLOYER_NO_DAEMON': '1'}):
+            socket_path = path.join(tmp, 'deployer.sock')
+            open(socket_path, 'w').close()
+            self.assertIsNone(delegate(['get', '--all'], socket_path=socket_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
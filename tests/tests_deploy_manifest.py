@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from portainer_deployer.cache import DeployManifest
+from portainer_deployer.utils import content_hash
+
+
+class DeployManifestTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.manifest = DeployManifest('https://portainer.test', cache_dir=self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_unchanged_after_record(self):
+        digest = content_hash('version: "3"\n')
+        self.assertFalse(self.manifest.is_unchanged(1, 'web', digest))
+
+        self.manifest.record(1, 'web', digest, stack_id=7)
+        self.assertTrue(self.manifest.is_unchanged(1, 'web', digest))
+        self.assertFalse(self.manifest.is_unchanged(2, 'web', digest))
+        self.assertFalse(self.manifest.is_unchanged(1, 'web', content_hash('version: "3.8"\n')))
+
+        # A new instance reads the persisted manifest
+        other = DeployManifest('https://portainer.test', cache_dir=self._tmp.name)
+        self.assertEqual(other.get(1, 'web')['Id'], 7)
+
+    def test_discard(self):
+        digest = content_hash('version: "3"\n')
+        self.manifest.record(1, 'web', digest, stack_id=7)
+        self.manifest.record(1, 'db', digest, stack_id=8)
+
+        self.manifest.discard(stack_id=7)
+        self.assertIsNone(self.manifest.get(1, 'web'))
+
+        self.manifest.discard(1, 'db')
+        self.assertEqual(self.manifest.stacks, {})
+
+    def test_batch_writes_once(self):
+        digest = content_hash('version: "3"\n')
+        with patch('portainer_deployer.cache.deploy_manifest.write_json_atomic') as write:
+            with self.manifest.batch():
+                for endpoint_id in range(1, 51):
+                    self.manifest.record(endpoint_id, 'web', digest, stack_id=endpoint_id)
+                with self.manifest.batch():
+                    self.manifest.discard(stack_id=50)
+                self.assertEqual(write.call_count, 0)
+
+            self.assertEqual(write.call_count, 1)
+            self.assertEqual(len(write.call_args[0][1]), 49)
+
+        # Deploys recorded before an error are saved as well
+        with self.assertRaises(RuntimeError):
+            with self.manifest.batch():
+                self.manifest.record(1, 'db', digest, stack_id=51)
+                raise RuntimeError('Deploy failed')
+
+        other = DeployManifest('https://portainer.test', cache_dir=self._tmp.name)
+        self.assertEqual(other.get(1, 'db')['Id'], 51)
+
+
+if __name__ == '__main__':
+    unittest.main()
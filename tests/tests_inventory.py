@@ -0,0 +1,67 @@
+import unittest
+from tempfile import TemporaryDirectory
+from portainer_deployer.cache import Inventory
+
+
+def fake_stack(stack_id: int, name: str, endpoint_id: int = 1, update_date: int = 0) -> dict:
+    return {'Id': stack_id, 'Name': name, 'EndpointId': endpoint_id, 'CreationDate': 0, 'UpdateDate': update_date, 'CreatedBy': 'admin', 'UpdatedBy': 'admin'}
+
+
+class InventoryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.inventory = Inventory('https://portainer.test', cache_dir=self._tmp.name)
+
+    def tearDown(self):
+        self.inventory.close()
+        self._tmp.cleanup()
+
+    def test_missing_inventory(self):
+        self.assertFalse(self.inventory.exists())
+        self.assertIsNone(self.inventory.stack_id('web'))
+
+        # Lookups and deploys do not create it
+        self.inventory.upsert(fake_stack(1, 'web'))
+        self.assertFalse(self.inventory.exists())
+
+    def test_incremental_sync(self):
+        stats = self.inventory.sync_stacks(iter([fake_stack(1, 'web'), fake_stack(2, 'db', endpoint_id=2), fake_stack(3, 'cache')]))
+        self.assertEqual(stats, {'written': 3, 'deleted': 0, 'unchanged': 0})
+        self.assertIsNotNone(self.inventory.synced_at)
+
+        # Only the stacks whose UpdateDate changed are written
+        stats = self.inventory.sync_stacks([fake_stack(1, 'web', update_date=10), fake_stack(2, 'db', endpoint_id=2)])
+        self.assertEqual(stats, {'written': 1, 'deleted': 1, 'unchanged': 1})
+        self.assertEqual(self.inventory.query_stacks(name='web')[0]['UpdateDate'], 10)
+        self.assertEqual(self.inventory.query_stacks(name='cache'), [])
+
+        # A new instance reads the persisted inventory
+        other = Inventory('https://portainer.test', cache_dir=self._tmp.name)
+        self.assertEqual(other.stack_id('db'), 2)
+        self.assertIsNone(other.stack_id('db', endpoint_id=1))
+        other.close()
+
+    def test_queries(self):
+        self.inventory.sync_stacks([fake_stack(1, 'pr-1'), fake_stack(2, 'pr-2', endpoint_id=2), fake_stack(3, 'prod'), fake_stack(4, 'pr%')])
+
+        self.assertEqual([stack['Id'] for stack in self.inventory.query_stacks(name_prefix='pr-')], [1, 2])
+        self.assertEqual([stack['Id'] for stack in self.inventory.query_stacks(name_prefix='pr%')], [4])
+        self.assertEqual([stack['Id'] for stack in self.inventory.query_stacks(endpoint_id=1)], [1, 3, 4])
+        self.assertEqual(self.inventory.query_stacks(stack_id=3)[0]['Name'], 'prod')
+
+        self.inventory.discard(3)
+        self.inventory.upsert(fake_stack(5, 'new'))
+        self.assertEqual([stack['Id'] for stack in self.inventory.query_stacks()], [1, 2, 4, 5])
+
+        # The same name on several endpoints is only resolved with its endpoint
+        self.inventory.upsert(fake_stack(6, 'new', endpoint_id=2))
+        self.assertIsNone(self.inventory.stack_id('new'))
+        self.assertEqual(self.inventory.stack_id('new', endpoint_id=2), 6)
+
+        self.assertEqual(self.inventory.sync_endpoints([{'Id': 1, 'Name': 'local', 'URL': 'unix:///var/run/docker.sock', 'Type': 1, 'Status': 1}]), 1)
+        self.assertEqual(self.inventory.endpoint_id('local'), 1)
+        self.assertIsNone(self.inventory.endpoint_id('remote'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import Mock
+from tempfile import TemporaryDirectory
+from datetime import timedelta
+from io import StringIO
+from json import load
+from os import path as os_path
+
+from portainer_deployer.api import PortainerAPIConsumer, _TimedHTTPAdapter
+from portainer_deployer.metrics import Metrics, metrics, route_of
+from portainer_deployer.utils import StackWriter, validate_yaml
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.registry = Metrics()
+
+    def tearDown(self):
+        metrics.reset()
+        self._tmp.cleanup()
+
+    def test_disabled_registry_records_nothing(self):
+        with self.registry.timer('config.parse'):
+            pass
+        self.registry.record('http.request', 1.0)
+        self.assertEqual(self.registry.snapshot(), [])
+
+    def test_phases_are_aggregated_by_labels(self):
+        self.registry.enable()
+        self.registry.record('http.request', 0.2, method='GET', route='/api/stacks')
+        self.registry.record('http.request', 0.4, method='GET', route='/api/stacks')
+        self.registry.record('http.request', 1.0, method='POST', route='/api/stacks')
+
+        post, get = self.registry.snapshot()
+        self.assertEqual(post['labels'], {'method': 'POST', 'route': '/api/stacks'})
+        self.assertEqual((get['count'], get['min'], get['max']), (2, 0.2, 0.4))
+        self.assertAlmostEqual(get['total'], 0.6)
+
+        report = StringIO()
+        self.registry.report(report)
+        self.assertIn('method=GET route=/api/stacks', report.getvalue())
+
+    def test_route_groups_stack_ids(self):
+        self.assertEqual(route_of('https://portainer.test/api/stacks/12/file?endpointId=1'), '/api/stacks/{id}/file')
+        self.assertEqual(route_of('/api/endpoints/3'), '/api/endpoints/{id}')
+
+    def test_write_formats(self):
+        self.registry.enable()
+        self.registry.record('http.request', 0.5, method='GET')
+
+        prom_path = os_path.join(self._tmp.name, 'deploy.prom')
+        self.registry.write(prom_path, command='deploy')
+        with open(prom_path) as f:
+            prometheus = f.read()
+        self.assertIn('# TYPE portainer_deployer_phase_seconds summary', prometheus)
+        self.assertIn('portainer_deployer_phase_seconds_sum{command="deploy",phase="http.request",method="GET"} 0.500000', prometheus)
+        self.assertIn('portainer_deployer_phase_seconds_count{command="deploy",phase="http.request",method="GET"} 1', prometheus)
+
+        json_path = os_path.join(self._tmp.name, 'deploy.json')
+        self.registry.write(json_path, command='deploy')
+        with open(json_path) as f:
+            document = load(f)
+        self.assertEqual(document['command'], 'deploy')
+        self.assertEqual(document['phases'][0]['phase'], 'http.request')
+
+    def test_instrumented_phases(self):
+        metrics.enable()
+        self.assertTrue(validate_yaml(data='version: "3"'))
+        with StackWriter('tsv', stream=StringIO()) as writer:
+            writer.write({'Id': 1, 'Name': 'web', 'EndpointId': 1, 'CreationDate': 0, 'UpdateDate': 0, 'CreatedBy': 'admin', 'UpdatedBy': 'admin'})
+
+        phases = {entry['phase']: entry for entry in metrics.snapshot()}
+        self.assertEqual(phases['yaml.validate']['count'], 1)
+        self.assertEqual(phases['output.render']['labels'], {'output': 'tsv'})
+
+    def test_requests_record_ttfb_and_transfer(self):
+        config_path = os_path.join(self._tmp.name, 'app.conf')
+        with open(config_path, 'w') as f:
+            f.write(f'[PORTAINER]\nurl=https://portainer.test\ntoken=t\nverify_ssl=yes\ncache_dir={self._tmp.name}\n')
+
+        metrics.enable()
+        api = PortainerAPIConsumer(config_path)
+        self.assertIsInstance(api._session.get_adapter('https://portainer.test'), _TimedHTTPAdapter)
+
+        api._session = Mock()
+        api._session.request.return_value = Mock(status_code=200, headers={}, elapsed=timedelta(seconds=0))
+        api._request('GET', 'https://portainer.test/api/stacks/4')
+
+        phases = {entry['phase']: entry for entry in metrics.snapshot()}
+        self.assertEqual(phases['http.request']['labels'], {'method': 'GET', 'route': '/api/stacks/{id}', 'status': 200})
+        self.assertIn('http.ttfb', phases)
+        self.assertIn('http.transfer', phases)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from os import listdir, path
+from tempfile import TemporaryDirectory
+from portainer_deployer.mirror import StackMirror
+
+
+def fake_stack(stack_id: int, name: str, endpoint_id: int = 1, update_date: int = 0) -> dict:
+    return {'Id': stack_id, 'Name': name, 'EndpointId': endpoint_id, 'UpdateDate': update_date}
+
+
+class StackMirrorTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.dir = path.join(self._tmp.name, 'mirror')
+        self.mirror = StackMirror(self.dir, 'https://portainer.test')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def read(self, *parts: str) -> str:
+        with open(path.join(self.dir, *parts)) as f:
+            return f.read()
+
+    def test_unchanged_stacks_are_current(self):
+        web = fake_stack(1, 'web', update_date=10)
+        self.assertFalse(self.mirror.is_current(web))
+
+        self.assertEqual(self.mirror.write(web, 'version: "3"\r\n'), path.join(self.dir, '1', 'web.yml'))
+        self.assertEqual(self.read('1', 'web.yml'), 'version: "3"\n')
+        self.assertTrue(self.mirror.is_current(web))
+        self.mirror.save()
+
+        # A new instance reads the saved index, while another Portainer instance ignores it
+        mirror = StackMirror(self.dir, 'https://portainer.test')
+        self.assertTrue(mirror.is_current(web))
+        self.assertFalse(mirror.is_current(fake_stack(1, 'web', update_date=11)))
+        self.assertFalse(StackMirror(self.dir, 'https://other.test').is_current(web))
+
+        # Only the files are written in the directories of the endpoints, temporary files are renamed
+        self.assertEqual(listdir(path.join(self.dir, '1')), ['web.yml'])
+
+    def test_renamed_and_removed_stacks(self):
+        self.mirror.write(fake_stack(1, 'web'), 'a')
+        self.mirror.write(fake_stack(2, '../db'), 'b')
+        self.assertEqual(self.read('1', '_db.yml'), 'b')
+
+        self.mirror.write(fake_stack(1, 'front', endpoint_id=2), 'c')
+        self.assertFalse(path.exists(path.join(self.dir, '1', 'web.yml')))
+        self.assertEqual(self.read('2', 'front.yml'), 'c')
+
+        removed = self.mirror.prune([fake_stack(1, 'front', endpoint_id=2)])
+        self.assertEqual(removed, [path.join(self.dir, '1', '_db.yml')])
+        self.assertFalse(path.exists(removed[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+from threading import Lock
+
+from portainer_deployer.plan import StackSpec, Action, load_plan_file, check_dependencies, compute_actions, run_actions
+from portainer_deployer.utils import generate_response
+
+PLAN = '''stacks:
+  - name: db
+    file: stacks/db.yml
+    endpoint: production
+  - name: web
+    file: stacks/web.yml
+    endpoint: 1
+    update_keys: ['services.web.image=nginx:1.25']
+    depends_on: [db]
+  - name: legacy
+    endpoint: 1
+    absent: true
+prune: ['pr-*']
+'''
+
+
+def spec(key, depends_on=(), absent=False, endpoint=1):
+    return StackSpec(key, key, endpoint, None if absent else f'{key}.yml', [], list(depends_on), absent)
+
+
+class PlanFileTest(unittest.TestCase):
+    def test_load_plan_file(self):
+        with TemporaryDirectory() as tmp:
+            plan_path = path.join(tmp, 'plan.yml')
+            with open(plan_path, 'w') as f:
+                f.write(PLAN)
+
+            specs, prune = load_plan_file(plan_path)
+
+        self.assertEqual([s.key for s in specs], ['db', 'web', 'legacy'])
+        self.assertEqual(specs[0].endpoint, 'production')
+        self.assertEqual(specs[1].file, path.join(tmp, 'stacks', 'web.yml'))
+        self.assertEqual((specs[1].update_keys, specs[1].depends_on), (['services.web.image=nginx:1.25'], ['db']))
+        self.assertTrue(specs[2].absent)
+        self.assertEqual(prune, ['pr-*'])
+
+    def test_invalid_plan_files(self):
+        with TemporaryDirectory() as tmp:
+            plan_path = path.join(tmp, 'plan.yml')
+            for content in ('stacks: {}', 'stacks:\n  - name: web\n    file: web.yml', 'stacks:\n  - name: web\n    endpoint: 1', '[:'):
+                with open(plan_path, 'w') as f:
+                    f.write(content)
+                with self.assertRaises(ValueError, msg=content):
+                    load_plan_file(plan_path)
+
+            with self.assertRaises(FileNotFoundError):
+                load_plan_file(path.join(tmp, 'missing.yml'))
+
+    def test_check_dependencies(self):
+        check_dependencies([spec('db'), spec('web', ['db'])])
+
+        for specs, message in (
+            ([spec('web'), spec('web')], 'declared twice'),
+            ([spec('web', ['db'])], 'not declared'),
+            ([spec('db', absent=True), spec('web', ['db'])], 'absent'),
+            ([spec('a', ['c']), spec('b', ['a']), spec('c', ['b'])], 'a -> c -> b -> a')
+        ):
+            with self.assertRaises(ValueError) as context:
+                check_dependencies(specs)
+            self.assertIn(message, str(context.exception))
+
+
+class ComputeActionsTest(unittest.TestCase):
+    def test_actions(self):
+        specs = [spec('db'), spec('web', ['db']), spec('api', ['db']), spec('old', absent=True), spec('gone', absent=True)]
+        remote = {
+            (1, 'db'): {'Id': 1, 'Name': 'db'},
+            (1, 'web'): {'Id': 2, 'Name': 'web'},
+            (1, 'old'): {'Id': 3, 'Name': 'old'},
+            (1, 'pr-12'): {'Id': 4, 'Name': 'pr-12'},
+            (1, 'other'): {'Id': 5, 'Name': 'other'},
+            (2, 'pr-13'): {'Id': 6, 'Name': 'pr-13'}
+        }
+        desired = {'db': ('db', False), 'web': ('web', True), 'api': (None, False)}
+
+        actions = compute_actions(specs, {1: 1}, remote, desired, prune=['pr-*'])
+
+        self.assertEqual(
+            [(a.kind, a.key, a.stack_id, a.after) for a in actions],
+            [
+                ('noop', 'db', 1, ()),
+                ('update', 'web', 2, ('db',)),
+                ('create', 'api', None, ('db',)),
+                ('delete', 'old', 3, ()),
+                ('noop', 'gone', None, ()),
+                # Stacks of the endpoints out of the plan are not pruned
+                ('delete', '1/pr-12', 4, ())
+            ]
+        )
+        self.assertEqual(actions[1].content, 'web')
+
+    def test_absent_dependents_are_deleted_first(self):
+        specs = [spec('db', absent=True), spec('web', ['db'], absent=True)]
+        remote = {(1, 'db'): {'Id': 1}, (1, 'web'): {'Id': 2}}
+
+        actions = compute_actions(specs, {1: 1}, remote, {})
+
+        self.assertEqual([(a.kind, a.key, a.after) for a in actions], [('delete', 'db', ('web',)), ('delete', 'web', ())])
+
+
+class RunActionsTest(unittest.TestCase):
+    def test_order_and_skips(self):
+        actions = [
+            Action('delete', 'old', 'old', 1, 3, after=('web',)),
+            Action('update', 'web', 'web', 1, 2, after=('db',)),
+            Action('create', 'db', 'db', 1),
+            Action('create', 'cache', 'cache', 1),
+            Action('create', 'api', 'api', 1, after=('cache',)),
+            Action('noop', 'worker', 'worker', 1, after=('api',))
+        ]
+        order, lock = [], Lock()
+
+        def run(action):
+            with lock:
+                order.append(action.key)
+            if action.key == 'cache':
+                raise RuntimeError('Stack cache could not be deployed')
+            return generate_response(f'Stack {action.key} done', status=True)
+
+        results = run_actions(actions, run, workers=4)
+
+        self.assertLess(order.index('db'), order.index('web'))
+        self.assertLess(order.index('web'), order.index('old'))
+        self.assertNotIn('api', order)
+        self.assertEqual(results['cache']['message'], 'Stack cache could not be deployed')
+        self.assertEqual(results['api']['message'], 'Skipped, as cache failed.')
+        self.assertEqual(results['worker']['message'], 'Skipped, as api failed.')
+        self.assertTrue(all(results[key]['status'] for key in ('db', 'web', 'old')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,18 @@
 import unittest
-from unittest.mock import Mock
+from unittest.mock import MagicMock, patch
+from io import BytesIO, StringIO, TextIOWrapper
+import json
 from random import randint
+from tempfile import TemporaryDirectory
+from os import path as os_path
 from portainer_deployer.app import PortainerDeployer
-from portainer_deployer.utils import generate_response
+from portainer_deployer.utils import generate_response, EndpointNotFoundError, StackWriter
+from portainer_deployer.cache import Inventory
 
 class PortainerDeployerTest(PortainerDeployer):
     def __init__(self):
         super().__init__()
-        self._api_consumer = Mock()
+        self._api_consumer = MagicMock()
 
     # Prevent decorator modifies Mock of self.api_consumer
     @property
@@ -100,6 +105,117 @@ class PortainerCMDTest(unittest.TestCase):
         
         self.assertEqual(args.func(args), generated_response)        
 
+
+    def test_get_stacks_with_filters(self):
+        tester = self.tester
+        args = tester.parser.parse_args(['get', '--all', '--endpoint', '2', '--name-prefix', 'pr-'])
+        args.func(args)
+        tester.api_consumer.get_stack.assert_called_once_with(endpoint_id=2, name_prefix='pr-')
+
+    def test_get_stacks_output_options(self):
+        tester = self.tester
+        args = tester.parser.parse_args(['get', '--all', '--output', 'ndjson', '--columns', 'id, name'])
+        args.func(args)
+        tester.api_consumer.get_stack.assert_called_once_with(output='ndjson', columns=['id', 'name'])
+
+        # Assert unknown columns are rejected before reaching the API
+        tester = self.tester
+        args = tester.parser.parse_args(['get', '--all', '--columns', 'id,size'])
+        self.assertFalse(args.func(args)['status'])
+        tester.api_consumer.get_stack.assert_not_called()
+
+    def test_get_stacks_offline(self):
+        tester = self.tester
+
+        with TemporaryDirectory() as cache_dir:
+            tester.PATH_TO_CONFIG = os_path.join(cache_dir, 'app.conf')
+            with open(tester.PATH_TO_CONFIG, 'w') as f:
+                f.write(f'[PORTAINER]\nurl=https://portainer.test\ntoken=t\nverify_ssl=no\ncache_dir={cache_dir}\n')
+
+            args = tester.parser.parse_args(['get', '--all', '--offline'])
+            self.assertFalse(args.func(args)['status'])
+
+            inventory = Inventory('https://portainer.test', cache_dir=cache_dir)
+            inventory.sync_stacks([{'Id': 1, 'Name': 'web', 'EndpointId': 1, 'CreationDate': 0, 'UpdateDate': 0, 'CreatedBy': 'admin', 'UpdatedBy': 'admin'}])
+            inventory.close()
+
+            stdout = StringIO()
+            with patch('sys.stdout', stdout):
+                args = tester.parser.parse_args(['get', '--name', 'web', '--offline', '--output', 'ndjson', '--columns', 'id,name'])
+                self.assertTrue(args.func(args)['status'])
+            self.assertEqual(json.loads(stdout.getvalue()), {'id': 1, 'name': 'web'})
+
+            args = tester.parser.parse_args(['get', '--name', 'missing', '--offline'])
+            self.assertEqual(args.func(args)['code'], 404)
+
+        tester.api_consumer.get_stack.assert_not_called()
+
+    def test_multi_instance_fan_out(self):
+        tester = self.tester
+        stack = {'Id': 1, 'Name': 'web', 'EndpointId': 1, 'CreationDate': 0, 'UpdateDate': 0, 'CreatedBy': 'admin', 'UpdatedBy': 'admin'}
+
+        def get_stack(**kwargs):
+            kwargs['writer'].write(stack)
+            return generate_response('ok', status=True)
+
+        tester.api_consumer.get_stack.side_effect = get_stack
+        tester.api_consumer.post_stack_from_str.return_value = generate_response('ok', status=True)
+        tester.api_consumer.delete_stack.side_effect = [generate_response('ok', status=True), generate_response('error', code=500)]
+
+        with TemporaryDirectory() as cache_dir:
+            tester.PATH_TO_CONFIG = os_path.join(cache_dir, 'app.conf')
+            with open(tester.PATH_TO_CONFIG, 'w') as f:
+                for section in ('PORTAINER', 'PORTAINER:EU', 'PORTAINER:US'):
+                    f.write(f'[{section}]\nurl=https://{section.lower()}.test\ntoken=t\nverify_ssl=no\ncache_dir={cache_dir}\n')
+
+            stdout = StringIO()
+            with patch('sys.stdout', stdout):
+                args = tester.parser.parse_args(['get', '--all', '--all-instances', '--output', 'ndjson', '--columns', 'name'])
+                self.assertTrue(args.func(args)['status'])
+            rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+            self.assertEqual(sorted(row['instance'] for row in rows), ['default', 'eu', 'us'])
+            self.assertEqual({row['name'] for row in rows}, {'web'})
+
+            args = tester.parser.parse_args(['deploy', '--endpoint', '1', '--name', 'web', '--instance', 'eu,US', 'version: "3"'])
+            self.assertTrue(args.func(args)['status'])
+            self.assertEqual(tester.api_consumer.post_stack_from_str.call_count, 2)
+
+            args = tester.parser.parse_args(['remove', '--endpoint', '1', '--name', 'web', '--instance', 'eu,us', '-y'])
+            self.assertEqual(args.func(args)['message'], '1 of 2 instances failed.')
+
+            # Assert unknown instances are rejected before reaching the API
+            args = tester.parser.parse_args(['deploy', '--endpoint', '1', '--instance', 'asia', 'version: "3"'])
+            response = args.func(args)
+            self.assertFalse(response['status'])
+            self.assertIn('asia', response['details'])
+            self.assertEqual(tester.api_consumer.post_stack_from_str.call_count, 2)
+
+    def test_stack_writer_formats(self):
+        stacks = [
+            {'Id': 1, 'EndpointId': 2, 'Name': 'web', 'CreationDate': 0, 'CreatedBy': 'admin', 'UpdateDate': 0, 'UpdatedBy': 'admin'},
+            {'Id': 2, 'EndpointId': 2, 'Name': 'db\tmain', 'CreationDate': 0, 'CreatedBy': 'admin', 'UpdateDate': 0, 'UpdatedBy': 'admin'}
+        ]
+
+        def render(output, columns=None):
+            stream = StringIO()
+            with StackWriter(output=output, columns=columns, stream=stream) as writer:
+                for stack in stacks:
+                    writer.write(stack)
+            return stream.getvalue()
+
+        self.assertEqual(json.loads(render('json', ['id', 'name'])), [{'id': 1, 'name': 'web'}, {'id': 2, 'name': 'db\tmain'}])
+        self.assertEqual([json.loads(line) for line in render('ndjson', ['name']).splitlines()], [{'name': 'web'}, {'name': 'db\tmain'}])
+        self.assertEqual(render('tsv', ['id', 'name', 'created_by']), 'id\tname\tcreated_by\n1\tweb\tadmin\n2\tdb main\tadmin\n')
+
+        table = render('table').splitlines()
+        self.assertTrue(table[0].startswith('Id    Endpoint Id  Name'))
+        self.assertIn('by admin', table[1])
+
+        with StackWriter(output='json', stream=StringIO()) as writer:
+            pass
+        self.assertEqual(writer.count, 0)
+        self.assertRaises(ValueError, StackWriter, output='xml')
+
         
     def test_deploy_stack_by_stdin(self):
         tester = self.tester
@@ -121,6 +237,56 @@ class PortainerCMDTest(unittest.TestCase):
         self.assertEqual(args.func(args), generated_response)
 
 
+    def test_deploy_stack_read_from_stdin(self):
+        tester = self.tester
+        example_stack = "version: '3'\nservices:\n  web:\n    image: nginx\n"
+        stdin = TextIOWrapper(BytesIO(example_stack.encode('utf-8')))
+        stdin.isatty = lambda: False
+
+        # stdin is copied to a temporary file and uploaded from it
+        uploaded = []
+        def post_stack_from_file(path, **kwargs):
+            with open(path) as f:
+                uploaded.append(f.read())
+            return generate_response('ok', status=True)
+        tester.api_consumer.post_stack_from_file.side_effect = post_stack_from_file
+
+        with patch('sys.stdin', stdin):
+            args = tester.parser.parse_args(['deploy', '--endpoint', '1', '--name', 'test_stack'])
+            args.func(args)
+        tester.api_consumer.post_stack_from_str.assert_not_called()
+        self.assertEqual(uploaded, [example_stack])
+        path = tester.api_consumer.post_stack_from_file.call_args.kwargs['path']
+        self.assertEqual(tester.api_consumer.post_stack_from_file.call_args.kwargs, {'path': path, 'name': 'test_stack', 'endpoint_id': 1})
+        self.assertFalse(os_path.exists(path))
+
+        # Assert stdin is still streamed when the command goes through run() and no daemon is running
+        tester = self.tester
+        tester.api_consumer.post_stack_from_file.side_effect = post_stack_from_file
+        stdin = TextIOWrapper(BytesIO(example_stack.encode('utf-8')))
+        stdin.isatty = lambda: False
+        with TemporaryDirectory() as tmp, patch('sys.stdin', stdin), \
+                patch('sys.argv', ['portainer-deployer', 'deploy', '--endpoint', '1', '--name', 'test_stack']), \
+                patch.dict('os.environ', {'PORTAINER_DEPLOYER_SOCKET': os_path.join(tmp, 'missing.sock')}):
+            with self.assertRaises(SystemExit) as context:
+                tester.run()
+        self.assertEqual(context.exception.code, 0)
+        tester.api_consumer.post_stack_from_str.assert_not_called()
+        self.assertEqual(uploaded, [example_stack, example_stack])
+
+        # Assert stdin over the size limit is rejected before reaching the API
+        tester = self.tester
+        stdin = TextIOWrapper(BytesIO(example_stack.encode('utf-8')))
+        stdin.isatty = lambda: False
+
+        with patch('sys.stdin', stdin):
+            args = tester.parser.parse_args(['deploy', '--endpoint', '1', '--max-stdin-size', '10'])
+            response = args.func(args)
+        self.assertFalse(response['status'])
+        tester.api_consumer.post_stack_from_str.assert_not_called()
+        tester.api_consumer.post_stack_from_file.assert_not_called()
+
+
     def test_deploy_stack_by_path(self):
         tester = self.tester
         generated_response = generate_response('ok', status=True, code=None)
@@ -139,7 +305,356 @@ class PortainerCMDTest(unittest.TestCase):
         args = tester.parser.parse_args(cmd_args)
         response = args.func(args)
         self.assertEqual(response, generated_response)
-        
+
+
+    def test_deploy_stack_by_path_with_update_keys(self):
+        tester = self.tester
+        tester.api_consumer.post_stack_from_str.return_value = generate_response('ok', status=True, code=None)
+
+        with TemporaryDirectory() as stacks_dir:
+            stack_path = os_path.join(stacks_dir, 'stack.yml')
+            original = "version: '3'\nservices:\n  web:\n    image: nginx:1.21\n"
+            with open(stack_path, 'w') as f:
+                f.write(original)
+
+            cmd_args = ['deploy', '--path', stack_path, '--endpoint', '1', '--name', 'web', '-u', 'services.web.image=nginx:1.23', 'services.web.ports=[80:80, 443:443]']
+            args = tester.parser.parse_args(cmd_args)
+            args.func(args)
+
+            # The file is left untouched and the updated stack is posted from memory
+            with open(stack_path) as f:
+                self.assertEqual(f.read(), original)
+
+            tester.api_consumer.post_stack_from_file.assert_not_called()
+            kwargs = tester.api_consumer.post_stack_from_str.call_args.kwargs
+            self.assertEqual((kwargs['name'], kwargs['endpoint_id'], kwargs['validate']), ('web', 1, False))
+            self.assertIn('image: nginx:1.23', kwargs['stack'])
+            self.assertIn('- 443:443', kwargs['stack'])
+
+            # Assert invalid pairs are rejected before reaching the API
+            tester = self.tester
+            args = tester.parser.parse_args(['deploy', '--path', stack_path, '--endpoint', '1', '-u', 'services.web.image'])
+            self.assertFalse(args.func(args)['status'])
+            tester.api_consumer.post_stack_from_str.assert_not_called()
+
+    def test_redeploy_updates_in_place(self):
+        tester = self.tester
+        example_stack = "version: '3'\nservices:\n  web:\n    image: nginx\n"
+        generated_response = generate_response('Stack web is up to date.', status=True, code=200)
+        tester.api_consumer.update_stack.return_value = generated_response
+
+        args = tester.parser.parse_args(['deploy', '--endpoint', '1', '--name', 'web', '--redeploy', '-y', '--pull-image', example_stack])
+        self.assertEqual(args.func(args), generated_response)
+        tester.api_consumer.update_stack.assert_called_once_with(stack=example_stack, name='web', endpoint_id=1, pull_image=True, validate=True)
+        tester.api_consumer.delete_stack_by_name.assert_not_called()
+        tester.api_consumer.post_stack_from_str.assert_not_called()
+
+        # Assert the stack is created when it does not exist yet
+        tester = self.tester
+        tester.api_consumer.update_stack.return_value = generate_response('Stack web not found in the database.', code=404)
+        tester.api_consumer.post_stack_from_str.return_value = generate_response('ok', status=True)
+
+        args = tester.parser.parse_args(['deploy', '--endpoint', '1', '--name', 'web', '--redeploy', '-y', example_stack])
+        self.assertTrue(args.func(args)['status'])
+        tester.api_consumer.post_stack_from_str.assert_called_once_with(stack=example_stack, name='web', endpoint_id=1)
+
+    def test_deploy_watch_redeploys_changed_stacks(self):
+        tester = self.tester
+        tester.api_consumer.update_stack.side_effect = [
+            generate_response('Stack web not found in the database.', code=404),
+            generate_response('Stack web updated successfully.', status=True)
+        ]
+        tester.api_consumer.post_stack_from_str.return_value = generate_response('ok', status=True)
+        tester.api_consumer.resolve_stack_id.return_value = 7
+
+        with TemporaryDirectory() as stacks_dir:
+            stack_path = os_path.join(stacks_dir, 'web.yml')
+            with open(stack_path, 'w') as f:
+                f.write("version: '3'\nservices:\n  web:\n    image: nginx:1.21\n")
+
+            def changes(paths, interval, debounce):
+                # Only a comment is added, so nothing is deployed
+                with open(stack_path, 'a') as f:
+                    f.write('# comment\n')
+                yield paths
+                with open(stack_path, 'w') as f:
+                    f.write("version: '3'\nservices:\n  web:\n    image: nginx:1.23\n")
+                yield paths
+
+            with patch('portainer_deployer.app.watch_files', changes):
+                args = tester.parser.parse_args(['deploy', '--path', stack_path, '--endpoint', '1', '--name', 'web', '--watch', '-y'])
+                response = args.func(args)
+
+        self.assertTrue(response['status'])
+        tester.api_consumer.post_stack_from_str.assert_called_once()
+        self.assertEqual(tester.api_consumer.update_stack.call_count, 2)
+        tester.api_consumer.resolve_stack_id.assert_called_once_with('web', endpoint_id=1)
+
+        # The resolved id is reused by the following deploys
+        kwargs = tester.api_consumer.update_stack.call_args.kwargs
+        self.assertEqual(kwargs['stack_id'], 7)
+        self.assertIn('nginx:1.23', kwargs['stack'])
+
+        # Assert --watch requires a named stack from a file
+        tester = self.tester
+        args = tester.parser.parse_args(['deploy', '--endpoint', '1', '--watch', '-y', 'version: "3"'])
+        self.assertFalse(args.func(args)['status'])
+        tester.api_consumer.update_stack.assert_not_called()
+
+    def test_deploy_batch_from_directory(self):
+        tester = self.tester
+        generated_response = generate_response('ok', status=True, code=None)
+        tester.api_consumer.post_stack_from_file.return_value = generated_response
+
+        with TemporaryDirectory() as stacks_dir:
+            for name in ('web.yml', 'db.yaml', 'notes.txt'):
+                with open(os_path.join(stacks_dir, name), 'w') as f:
+                    f.write('version: "3"\n')
+
+            cmd_args = ['deploy-batch', stacks_dir, '--endpoint', '1', '2', '--concurrency', '2']
+            args = tester.parser.parse_args(cmd_args)
+            response = args.func(args)
+
+            self.assertTrue(response['status'])
+            self.assertEqual(tester.api_consumer.post_stack_from_file.call_count, 4)
+            tester.api_consumer.post_stack_from_file.assert_any_call(path=os_path.join(stacks_dir, 'web.yml'), name='web', endpoint_id=2)
+
+            # Assert failures are aggregated into a single error response
+            tester = self.tester
+            tester.api_consumer.post_stack_from_file.side_effect = [
+                generate_response('ok', status=True), generate_response('error', status=False, code=500)
+            ]
+            args = tester.parser.parse_args(['deploy-batch', stacks_dir, '--endpoint', '1', '--concurrency', '1'])
+            response = args.func(args)
+            self.assertFalse(response['status'])
+            self.assertEqual(response['message'], '1 of 2 stacks failed to deploy.')
+
+    def test_deploy_template_variants(self):
+        tester = self.tester
+        tester.api_consumer.post_stack_from_str.return_value = generate_response('ok', status=True)
+
+        with TemporaryDirectory() as stacks_dir:
+            stack_path = os_path.join(stacks_dir, 'web.yml')
+            with open(stack_path, 'w') as f:
+                f.write("services:\n  web:\n    image: nginx:${{ tag:-alpine }}\n    environment:\n      CUSTOMER: ${{ customer }}\n")
+            vars_path = os_path.join(stacks_dir, 'customers.yml')
+            with open(vars_path, 'w') as f:
+                f.write("- customer: acme\n- customer: 'two words'\n")
+
+            cmd_args = ['deploy', '--path', stack_path, '--vars-file', vars_path, '--var', 'tag=1.25', '--name', 'web-${{ customer }}', '--endpoint', '1']
+            args = tester.parser.parse_args(cmd_args)
+            response = args.func(args)
+
+            self.assertTrue(response['status'])
+            self.assertEqual(tester.api_consumer.post_stack_from_str.call_count, 2)
+            stacks = {call.kwargs['name']: call.kwargs for call in tester.api_consumer.post_stack_from_str.call_args_list}
+            self.assertEqual(set(stacks), {'web-acme', 'web-two words'})
+            self.assertEqual(stacks['web-acme']['stack'], "services:\n  web:\n    image: nginx:1.25\n    environment:\n      CUSTOMER: acme\n")
+            self.assertIn('CUSTOMER: "two words"', stacks['web-two words']['stack'])
+            self.assertFalse(stacks['web-acme']['validate'])
+
+            # Assert variants rendering the same name are rejected before reaching the API
+            tester = self.tester
+            args = tester.parser.parse_args(['deploy', '--path', stack_path, '--vars-file', vars_path, '--name', 'web', '--endpoint', '1'])
+            self.assertFalse(args.func(args)['status'])
+            tester.api_consumer.post_stack_from_str.assert_not_called()
+
+            # Assert missing variables are reported
+            args = tester.parser.parse_args(['deploy', '--path', stack_path, '--var', 'tag=1', '--name', 'web', '--endpoint', '1'])
+            response = args.func(args)
+            self.assertFalse(response['status'])
+            self.assertIn('customer', response['details'])
+            tester.api_consumer.post_stack_from_str.assert_not_called()
+
+    def test_endpoint_names(self):
+        tester = self.tester
+        tester.api_consumer.resolve_endpoint_id.side_effect = lambda name: {'prod': 3, 'edge': 4}[name]
+        tester.api_consumer.post_stack_from_str.return_value = generate_response('ok', status=True)
+
+        args = tester.parser.parse_args(['deploy', '--endpoint', 'prod', '--name', 'web', 'version: "3"'])
+        self.assertTrue(args.func(args)['status'])
+        tester.api_consumer.post_stack_from_str.assert_called_once_with(stack='version: "3"', name='web', endpoint_id=3)
+
+        # Ids are used as they are, and names are resolved in lists as well
+        tester.api_consumer.post_stack_from_file.return_value = generate_response('ok', status=True)
+        with TemporaryDirectory() as stacks_dir:
+            with open(os_path.join(stacks_dir, 'web.yml'), 'w') as f:
+                f.write('version: "3"\n')
+            args = tester.parser.parse_args(['deploy-batch', stacks_dir, '--endpoint', '1', 'edge'])
+            self.assertTrue(args.func(args)['status'])
+        self.assertEqual({call.kwargs['endpoint_id'] for call in tester.api_consumer.post_stack_from_file.call_args_list}, {1, 4})
+        self.assertEqual([call.args for call in tester.api_consumer.resolve_endpoint_id.call_args_list], [('prod',), ('edge',)])
+
+        # Assert unknown endpoints are reported before anything is done
+        tester = self.tester
+        tester.api_consumer.resolve_endpoint_id.side_effect = EndpointNotFoundError('Endpoint missing not found.')
+        args = tester.parser.parse_args(['remove', '--name', 'web', '--endpoint', 'missing', '-y'])
+        response = args.func(args)
+        self.assertEqual((response['status'], response['code']), (False, 404))
+        tester.api_consumer.delete_stack.assert_not_called()
+
+    def test_endpoints_subcommand(self):
+        tester = self.tester
+        tester.api_consumer.list_endpoints.return_value = [
+            {'Id': 1, 'Name': 'local', 'URL': 'unix:///var/run/docker.sock', 'Type': 1, 'Status': 1},
+            {'Id': 2, 'Name': 'edge', 'URL': 'tcp://edge:9001', 'Type': 4, 'Status': 2}
+        ]
+
+        args = tester.parser.parse_args(['endpoints', '--output', 'json'])
+        with patch('sys.stdout', new_callable=StringIO) as stdout:
+            response = args.func(args)
+
+        self.assertTrue(response['status'])
+        self.assertEqual(json.loads(stdout.getvalue())[1], {'Id': 2, 'Name': 'edge', 'Type': 'edge-agent', 'Status': 'down', 'URL': 'tcp://edge:9001'})
+
+    def test_export_changed_stacks(self):
+        tester = self.tester
+        stacks = [{'Id': i, 'Name': f'web-{i}', 'EndpointId': 1, 'UpdateDate': 10} for i in (1, 2, 3)]
+        tester.api_consumer.portainer_url = 'https://portainer.test'
+        tester.api_consumer.list_stacks.return_value = stacks
+        tester.api_consumer.get_stack_file.side_effect = lambda stack_id: f'# stack {stack_id}\n'
+
+        with TemporaryDirectory() as mirror_dir:
+            args = tester.parser.parse_args(['export', '--dir', mirror_dir, '--concurrency', '2'])
+            response = args.func(args)
+            self.assertTrue(response['status'])
+            self.assertEqual(response['message'], '3 stacks exported, 0 unchanged.')
+            with open(os_path.join(mirror_dir, '1', 'web-2.yml')) as f:
+                self.assertEqual(f.read(), '# stack 2\n')
+            tester.api_consumer.list_stacks.assert_called_once_with(endpoint_id=None)
+
+            # Only the stacks updated since the last export are downloaded again
+            tester = self.tester
+            tester.api_consumer.portainer_url = 'https://portainer.test'
+            tester.api_consumer.list_stacks.return_value = [stacks[0], {**stacks[1], 'UpdateDate': 20}]
+            tester.api_consumer.get_stack_file.return_value = 'updated\n'
+            args = tester.parser.parse_args(['export', '--dir', mirror_dir, '--prune'])
+            response = args.func(args)
+            self.assertEqual(response['message'], '1 stacks exported, 1 unchanged and 1 removed.')
+            tester.api_consumer.get_stack_file.assert_called_once_with(2)
+            self.assertFalse(os_path.exists(os_path.join(mirror_dir, '1', 'web-3.yml')))
+
+            # Assert failed downloads are reported and not recorded
+            tester.api_consumer.list_stacks.return_value = [{**stacks[0], 'UpdateDate': 30}]
+            tester.api_consumer.get_stack_file.side_effect = [None]
+            args = tester.parser.parse_args(['export', '--dir', mirror_dir])
+            response = args.func(args)
+            self.assertFalse(response['status'])
+            self.assertIn('was removed before it was exported', response['details'])
+
+    def test_remove_several_stacks(self):
+        tester = self.tester
+        tester.api_consumer.list_stacks.return_value = [
+            {'Id': 1, 'EndpointId': 1, 'Name': 'pr-1'},
+            {'Id': 2, 'EndpointId': 2, 'Name': 'pr-2'},
+            {'Id': 3, 'EndpointId': 1, 'Name': 'prod'},
+            {'Id': 4, 'EndpointId': 1, 'Name': 'web'}
+        ]
+        tester.api_consumer.delete_stack.return_value = generate_response('Stack(s) deleted successfully', status=True)
+
+        # Patterns match on every endpoint, after a single confirmation for all the stacks
+        with patch('portainer_deployer.app.request_confirmation', return_value=True) as confirmation, patch('sys.stdout', StringIO()) as stdout:
+            args = tester.parser.parse_args(['remove', '--match', 'pr-*', '--concurrency', '2'])
+            response = args.func(args)
+
+        self.assertTrue(response['status'])
+        confirmation.assert_called_once_with('Are you sure you want to remove these 2 stacks?')
+        tester.api_consumer.list_stacks.assert_called_once_with(endpoint_id=None)
+        self.assertEqual(
+            sorted(call.kwargs['stack_id'] for call in tester.api_consumer.delete_stack.call_args_list),
+            [1, 2]
+        )
+        tester.api_consumer.delete_stack.assert_any_call(endpoint_id=2, stack_id=2)
+        self.assertIn('pr-2', stdout.getvalue())
+
+        # Names, ids and regular expressions are combined and scoped to the endpoint
+        tester = self.tester
+        tester.api_consumer.list_stacks.return_value = [
+            {'Id': 1, 'EndpointId': 1, 'Name': 'pr-1'},
+            {'Id': 3, 'EndpointId': 1, 'Name': 'prod'},
+            {'Id': 4, 'EndpointId': 1, 'Name': 'web'}
+        ]
+        tester.api_consumer.delete_stack.return_value = generate_response('Stack(s) deleted successfully', status=True)
+        with patch('sys.stdout', StringIO()):
+            args = tester.parser.parse_args(['remove', '--endpoint', '1', '--name', 'web', 'missing', '--id', '3', '--regex', '^pr-[0-9]+$', '-y'])
+            response = args.func(args)
+
+        self.assertFalse(response['status'])
+        self.assertEqual(response['message'], '0 of 3 stacks failed to be removed and 1 were not found.')
+        self.assertEqual(response['details'], 'Stack missing not found.')
+        self.assertEqual(tester.api_consumer.delete_stack.call_count, 3)
+
+        # Cancelling removes nothing, and invalid patterns are rejected
+        tester = self.tester
+        tester.api_consumer.list_stacks.return_value = [{'Id': 1, 'EndpointId': 1, 'Name': 'pr-1'}]
+        with patch('portainer_deployer.app.request_confirmation', return_value=False), patch('sys.stdout', StringIO()):
+            args = tester.parser.parse_args(['remove', '--match', 'pr-*'])
+            self.assertEqual(args.func(args)['message'], 'Stack removal cancelled')
+            args = tester.parser.parse_args(['remove', '--regex', '(', '-y'])
+            self.assertEqual(args.func(args)['message'], 'Invalid pattern')
+        tester.api_consumer.delete_stack.assert_not_called()
+
+        # A single stack is still removed without listing
+        args = tester.parser.parse_args(['remove', '--name', 'web', '--endpoint', '1', '-y'])
+        args.func(args)
+        tester.api_consumer.delete_stack.assert_called_once_with(stack_name='web', stack_id=None, endpoint_id=1)
+        self.assertEqual(tester.api_consumer.list_stacks.call_count, 2)
+
+
+    def test_plan_and_apply(self):
+        tester = self.tester
+        api = tester.api_consumer
+        api.resolve_endpoint_id.side_effect = lambda endpoint: {'prod': 3}.get(endpoint, endpoint)
+        api.list_stacks.return_value = [
+            {'Id': 1, 'Name': 'db', 'EndpointId': 3},
+            {'Id': 2, 'Name': 'cache', 'EndpointId': 3},
+            {'Id': 3, 'Name': 'legacy', 'EndpointId': 1},
+            {'Id': 4, 'Name': 'pr-7', 'EndpointId': 3}
+        ]
+        # db was changed in Portainer, cache was deployed with the same content by this tool
+        api.is_deployed.side_effect = lambda endpoint_id, name, digest, stack_id=None: name == 'cache'
+        api.get_stack_file.return_value = 'version: "2"\n'
+        for method in ('post_stack_from_file', 'post_stack_from_str', 'update_stack', 'delete_stack'):
+            getattr(api, method).return_value = generate_response('ok', status=True)
+
+        with TemporaryDirectory() as plan_dir:
+            for name in ('db', 'cache', 'web', 'api'):
+                with open(os_path.join(plan_dir, f'{name}.yml'), 'w') as f:
+                    f.write('version: "3"\nservices:\n  web:\n    image: nginx\n')
+            plan_path = os_path.join(plan_dir, 'plan.yml')
+            with open(plan_path, 'w') as f:
+                f.write(
+                    'stacks:\n'
+                    '  - {name: db, file: db.yml, endpoint: prod}\n'
+                    '  - {name: cache, file: cache.yml, endpoint: prod}\n'
+                    '  - {name: web, file: web.yml, endpoint: prod, depends_on: [db]}\n'
+                    '  - {name: api, file: api.yml, endpoint: prod, update_keys: ["services.web.image=nginx:1.25"], depends_on: [db]}\n'
+                    '  - {name: legacy, endpoint: 1, absent: true}\n'
+                    'prune: ["pr-*"]\n'
+                )
+
+            args = tester.parser.parse_args(['plan', plan_path])
+            with patch('sys.stdout', new_callable=StringIO):
+                response = args.func(args)
+            self.assertEqual(response['message'], 'Plan: 2 to create, 1 to update, 2 to delete and 1 unchanged.')
+            api.get_stack_file.assert_called_once_with(1)
+            api.update_stack.assert_not_called()
+
+            args = tester.parser.parse_args(['apply', plan_path, '-y'])
+            with patch('sys.stdout', new_callable=StringIO):
+                response = args.func(args)
+
+        self.assertTrue(response['status'])
+        self.assertEqual(response['message'], '5 changes applied successfully.')
+        api.update_stack.assert_called_once()
+        self.assertEqual(api.update_stack.call_args.kwargs['stack_id'], 1)
+        api.post_stack_from_file.assert_called_once_with(path=os_path.join(plan_dir, 'web.yml'), name='web', endpoint_id=3, force=True)
+        self.assertIn('nginx:1.25', api.post_stack_from_str.call_args.kwargs['stack'])
+        self.assertEqual(
+            sorted(call.kwargs['stack_id'] for call in api.delete_stack.call_args_list),
+            [3, 4]
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import Mock, patch
+from tempfile import TemporaryDirectory
+from os import path as os_path
+from email.utils import formatdate
+from time import time
+
+from portainer_deployer.api import PortainerAPIConsumer
+from portainer_deployer.ratelimit import TokenBucket, AdaptiveConcurrency, is_throttled, retry_after_seconds, backoff_delay
+
+
+def fake_response(status_code: int, headers: dict = None) -> Mock:
+    return Mock(status_code=status_code, headers=headers or {})
+
+
+class RateLimitTest(unittest.TestCase):
+    def test_throttling_responses(self):
+        self.assertTrue(is_throttled(429, 'POST'))
+        self.assertTrue(is_throttled(503, 'GET'))
+        self.assertFalse(is_throttled(503, 'POST'))
+        self.assertFalse(is_throttled(500, 'GET'))
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after_seconds('3'), 3.0)
+        self.assertAlmostEqual(retry_after_seconds(formatdate(time() + 10, usegmt=True)), 10, delta=1.5)
+        self.assertIsNone(retry_after_seconds('soon'))
+        self.assertIsNone(retry_after_seconds(None))
+
+        for attempt in range(10):
+            self.assertLessEqual(backoff_delay(attempt, 0.5, 4), 4)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual([bucket.reserve() for _ in range(2)], [0.0, 0.0])
+
+        # Every request over the burst waits for its own token
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+        self.assertEqual(TokenBucket(rate=0).reserve(), 0.0)
+
+    def test_aimd(self):
+        concurrency = AdaptiveConcurrency(8, minimum=2, cooldown=0)
+        concurrency.on_throttle()
+        self.assertEqual(concurrency.limit, 4)
+        concurrency.on_throttle()
+        concurrency.on_throttle()
+        self.assertEqual(concurrency.limit, 2)
+
+        # It grows by about one per window of successes, up to the maximum
+        for _ in range(3):
+            concurrency.on_success()
+        self.assertEqual(concurrency.limit, 3)
+        for _ in range(100):
+            concurrency.on_success()
+        self.assertEqual(concurrency.limit, 8)
+
+        # Responses throttled together only shrink it once
+        concurrency = AdaptiveConcurrency(8, cooldown=60)
+        concurrency.on_throttle()
+        concurrency.on_throttle()
+        self.assertEqual(concurrency.limit, 4)
+
+
+class ThrottledRequestTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        config_path = os_path.join(self._tmp.name, 'app.conf')
+        with open(config_path, 'w') as f:
+            f.write(f'[PORTAINER]\nurl=https://portainer.test\ntoken=t\nverify_ssl=yes\ncache_dir={self._tmp.name}\nthrottle_retries=2\nmax_backoff=5\n')
+
+        self.api = PortainerAPIConsumer(config_path)
+        self.api._session = Mock()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    @patch('portainer_deployer.api.sleep')
+    def test_retries_honour_retry_after(self, sleep):
+        self.api._session.request.side_effect = [fake_response(429, {'Retry-After': '2'}), fake_response(503, {'Retry-After': '60'}), fake_response(200)]
+
+        r = self.api._request('GET', 'https://portainer.test/api/stacks')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [2.0, 5.0])
+        self.assertEqual(self.api._concurrency.limit, 5)
+
+    @patch('portainer_deployer.api.sleep')
+    def test_gives_up_after_retries(self, sleep):
+        self.api._session.request.return_value = fake_response(429)
+
+        self.assertEqual(self.api._request('POST', 'https://portainer.test/api/stacks').status_code, 429)
+        self.assertEqual(self.api._session.request.call_count, 3)
+
+        # A 503 of a non idempotent request is not retried
+        self.api._session.request.reset_mock()
+        self.api._session.request.return_value = fake_response(503)
+        self.api._request('POST', 'https://portainer.test/api/stacks')
+        self.assertEqual(self.api._session.request.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
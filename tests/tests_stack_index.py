@@ -0,0 +1,66 @@
+import unittest
+from tempfile import TemporaryDirectory
+from portainer_deployer.cache import StackIndex
+
+
+def fake_stack(stack_id: int, name: str, endpoint_id: int = 1) -> dict:
+    return {'Id': stack_id, 'Name': name, 'EndpointId': endpoint_id, 'UpdateDate': 0}
+
+
+class StackIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.index = StackIndex('https://portainer.test', ttl=60, cache_dir=self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_lookup_after_refresh(self):
+        self.assertIsNone(self.index.get('web'))
+        self.index.refresh([fake_stack(1, 'web'), fake_stack(2, 'db')])
+        self.assertEqual(self.index.get('db')['Id'], 2)
+
+        # A new instance reads the persisted index
+        other = StackIndex('https://portainer.test', ttl=60, cache_dir=self._tmp.name)
+        self.assertEqual(other.get('web')['Id'], 1)
+
+    def test_stale_index(self):
+        self.index.refresh([fake_stack(1, 'web')])
+        self.index.ttl = 0
+        self.assertIsNone(self.index.get('web'))
+
+    def test_invalidation(self):
+        self.index.refresh([fake_stack(1, 'web'), fake_stack(2, 'db')])
+        self.index.discard(stack_id=1)
+        self.assertIsNone(self.index.get('web'))
+
+        self.index.upsert(fake_stack(3, 'cache'))
+        self.assertEqual(self.index.get('cache')['Id'], 3)
+
+        self.index.invalidate()
+        self.assertIsNone(self.index.get('db'))
+
+    def test_same_name_on_several_endpoints(self):
+        self.index.refresh([fake_stack(1, 'web', 1), fake_stack(2, 'web', 2), fake_stack(3, 'db', 2)])
+        self.assertEqual(self.index.get('web', endpoint_id=2)['Id'], 2)
+        self.assertEqual(self.index.get('db')['Id'], 3)
+
+        # An ambiguous name is not resolved without its endpoint
+        self.assertIsNone(self.index.get('web'))
+        self.assertIsNone(self.index.get('web', endpoint_id=3))
+
+        self.index.discard('web', endpoint_id=1)
+        self.assertIsNone(self.index.get('web', endpoint_id=1))
+        self.assertEqual(self.index.get('web')['Id'], 2)
+
+    def test_index_of_a_previous_version_is_ignored(self):
+        from json import dump
+        with open(self.index.path, 'w') as f:
+            dump({'updated_at': 9e12, 'stacks': {'web': fake_stack(1, 'web')}}, f)
+
+        other = StackIndex('https://portainer.test', ttl=60, cache_dir=self._tmp.name)
+        self.assertIsNone(other.get('web'))
+
+
+if __name__ == '__main__':
+    unittest.main()
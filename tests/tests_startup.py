@@ -0,0 +1,35 @@
+import unittest
+import subprocess
+import sys
+
+HEAVY_MODULES = ('requests', 'urllib3', 'yaml')
+
+
+class StartupTest(unittest.TestCase):
+    def printed_names(self, code: str) -> set:
+        result = subprocess.run([sys.executable, '-c', code], stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True)
+        return set(result.stdout.split())
+
+    def test_short_commands_do_not_import_heavy_modules(self):
+        names = self.printed_names(
+            'import sys\n'
+            'from portainer_deployer.app import PortainerDeployer\n'
+            'deployer = PortainerDeployer()\n'
+            'deployer.parser.parse_args(["config", "--get", "portainer.url"])\n'
+            'print(" ".join(sys.modules))'
+        )
+        self.assertFalse([name for name in names if name.split('.')[0] in HEAVY_MODULES])
+
+    def test_only_invoked_sub_command_is_built(self):
+        names = self.printed_names(
+            'from portainer_deployer.app import PortainerDeployer\n'
+            'deployer = PortainerDeployer()\n'
+            'deployer.parser.parse_args(["get", "--all"])\n'
+            'action = deployer.parser._subparsers._group_actions[0]\n'
+            'print(" ".join(sorted(action._builders)))'
+        )
+        self.assertEqual(names, {'apply', 'config', 'deploy', 'deploy-batch', 'endpoints', 'export', 'plan', 'remove', 'serve', 'sync'})
+
+
+if __name__ == '__main__':
+    unittest.main()
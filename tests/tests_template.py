@@ -0,0 +1,111 @@
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+from yaml import safe_load
+
+from portainer_deployer.utils import ComposeTemplate, load_variants, substitute_variables
+
+TEMPLATE = '''version: "3"
+services:
+  web:
+    image: nginx:${{ tag:-alpine }}
+    command: "run --customer ${{ customer }}"
+    labels:
+      note: 'owner ${{ customer }}'
+    environment:
+      CUSTOMER: ${{ customer }}
+      REPLICAS: ${{ replicas:-1 }}
+    configs:
+      - source: ${{ customer }}-config
+    entrypoint: |
+      echo ${{ customer }}
+      exec nginx
+'''
+
+
+class ComposeTemplateTest(unittest.TestCase):
+    def test_render_variants(self):
+        template = ComposeTemplate(TEMPLATE)
+        self.assertEqual(template.variables, {'tag': 'alpine', 'customer': None, 'replicas': '1'})
+
+        document = safe_load(template.render({'customer': 'acme', 'replicas': '3'}))
+        web = document['services']['web']
+        self.assertEqual(web['image'], 'nginx:alpine')
+        self.assertEqual(web['command'], 'run --customer acme')
+        self.assertEqual(web['labels']['note'], 'owner acme')
+        self.assertEqual(web['environment'], {'CUSTOMER': 'acme', 'REPLICAS': 3})
+        self.assertEqual(web['configs'], [{'source': 'acme-config'}])
+        self.assertEqual(web['entrypoint'], 'echo acme\nexec nginx\n')
+
+        # Assert text outside the placeholders is left as it is
+        self.assertIn('    environment:\n      CUSTOMER: acme\n', template.render({'customer': 'acme'}))
+
+    def test_values_are_quoted_as_needed(self):
+        template = ComposeTemplate(TEMPLATE)
+        for value in ('a: b', "it's \"quoted\"", '#comment', 'line\nbreak', '- item', '', 'true', '{x}'):
+            document = safe_load(template.render({'customer': value}))
+            web = document['services']['web']
+            self.assertEqual(web['command'], f'run --customer {value}')
+            self.assertEqual(web['labels']['note'], f'owner {value}')
+            self.assertEqual(web['configs'], [{'source': f'{value}-config'}])
+            self.assertEqual(web['environment']['CUSTOMER'], value if value != 'true' else True)
+
+    def test_indicators_are_quoted(self):
+        template = ComposeTemplate(TEMPLATE)
+        for value in ('@latest', 'foo:', 'a:b:', '-', '-x', '~', '%x', '`x', '!tag', '&anchor', '*alias', '=x', '+x'):
+            document = safe_load(template.render({'customer': value, 'tag': value}))
+            web = document['services']['web']
+            self.assertEqual(web['environment']['CUSTOMER'], value)
+            self.assertEqual(web['image'], f'nginx:{value}')
+
+        # Assert safe values are still left unquoted
+        self.assertIn('CUSTOMER: registry.local:5000/web@sha256\n', template.render({'customer': 'registry.local:5000/web@sha256'}))
+
+    def test_invalid_templates_and_missing_variables(self):
+        with self.assertRaises(ValueError):
+            ComposeTemplate('services: [web\n')
+
+        template = ComposeTemplate(TEMPLATE)
+        self.assertEqual(template.missing_variables({}), ['customer'])
+        with self.assertRaises(ValueError):
+            template.render({'tag': '1.25'})
+
+        self.assertEqual(substitute_variables('web-${{ customer }}-${{ env:-prod }}', {'customer': 'acme'}), 'web-acme-prod')
+        with self.assertRaises(ValueError):
+            substitute_variables('web-${{ customer }}', {})
+
+
+class LoadVariantsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def write(self, name: str, content: str) -> str:
+        file_path = path.join(self.dir, name)
+        with open(file_path, 'w') as f:
+            f.write(content)
+        return file_path
+
+    def test_load_variants(self):
+        self.assertEqual(load_variants(pairs=['tag=1.25', 'empty=']), [{'tag': '1.25', 'empty': ''}])
+
+        variants = load_variants(self.write('vars.yml', '- customer: acme\n  replicas: 3\n- customer: globex\n  debug: true\n'), ['tag=2'])
+        self.assertEqual(variants, [
+            {'customer': 'acme', 'replicas': '3', 'tag': '2'},
+            {'customer': 'globex', 'debug': 'true', 'tag': '2'}
+        ])
+
+        self.assertEqual(load_variants(self.write('vars.json', '{"customer": "acme"}')), [{'customer': 'acme'}])
+
+        for content in ('- a\n', '[]', 'customer: [a, b]\n', 'customer: [a\n'):
+            with self.assertRaises(ValueError):
+                load_variants(self.write('invalid.yml', content))
+
+        with self.assertRaises(ValueError):
+            load_variants(pairs=['tag'])
+
+
+if __name__ == '__main__':
+    unittest.main()
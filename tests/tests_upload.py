@@ -0,0 +1,125 @@
+import gzip
+import unittest
+from io import BytesIO, TextIOWrapper
+from os import path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+import tracemalloc
+
+from portainer_deployer.upload import MultipartBody, StackFile, spool_stdin
+from portainer_deployer.utils import content_hash, validate_yaml
+
+COMPOSE = 'version: "3"\nservices:\n' + ''.join(f'  web{i}:\n    image: nginx\n' for i in range(100000))
+
+
+class StackFileTest(unittest.TestCase):
+    def setUp(self):
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def write(self, name: str, content: str) -> str:
+        file_path = path.join(self.dir, name)
+        with open(file_path, 'w') as f:
+            f.write(content)
+        return file_path
+
+    def test_digest_and_validation(self):
+        with StackFile(self.write('web.yml', COMPOSE)) as stack_file:
+            self.assertEqual(stack_file.digest(), content_hash(COMPOSE))
+            self.assertTrue(stack_file.is_valid_yaml())
+
+        with StackFile(self.write('invalid.yml', 'services: [web\n')) as stack_file:
+            self.assertFalse(stack_file.is_valid_yaml())
+
+        with StackFile(self.write('empty.yml', '')) as stack_file:
+            self.assertEqual(stack_file.digest(), content_hash(''))
+            self.assertFalse(stack_file.is_valid_yaml())
+            self.assertFalse(validate_yaml(data=''))
+
+        # Assert composer errors are caught, as validate_yaml does
+        for name, content in (
+            ('alias.yml', 'services:\n  web: *undefined\n'),
+            ('documents.yml', 'a: 1\n---\nb: 2\n'),
+            ('anchors.yml', 'a: &x 1\nb: &x 2\n'),
+            ('tag.yml', 'a: !unknown 1\n'),
+            ('key.yml', 'a: &x [1]\n? *x\n: 2\n'),
+            ('flow_key.yml', '{[a]: 1}\n')
+        ):
+            with StackFile(self.write(name, content)) as stack_file:
+                self.assertFalse(stack_file.is_valid_yaml(), name)
+            self.assertFalse(validate_yaml(data=content), name)
+
+        # Assert valid aliases, tags and keys are accepted, and a document with only comments as validate_yaml does
+        for name, content in (
+            ('aliases.yml', 'x: &x {a: [1, 2]}\ny: *x\n<<: *x\n'),
+            ('tags.yml', 'a: !!str 1\nb: !!binary aGk=\n'),
+            ('keys.yml', 'a: {b: [c, {d: e}]}\n? f\n: [g]\n'),
+            ('comments.yml', '# nothing yet\n')
+        ):
+            with StackFile(self.write(name, content)) as stack_file:
+                self.assertTrue(stack_file.is_valid_yaml(), name)
+            self.assertTrue(validate_yaml(data=content), name)
+
+    def test_multipart_body_is_read_in_chunks(self):
+        with StackFile(self.write('web.yml', COMPOSE)) as stack_file:
+            body = MultipartBody({'Name': 'web', 'file': (stack_file, 'web.yml')})
+            whole = body.read()
+            self.assertEqual(len(whole), len(body))
+            self.assertIn(COMPOSE.encode('utf-8'), whole)
+            self.assertTrue(whole.startswith(b'--'))
+            self.assertIn(b'name="Name"\r\n\r\nweb\r\n', whole)
+            self.assertIn(body.content_type.split('boundary=')[1].encode('utf-8'), whole)
+
+            # Read again from the start, as when a request is retried
+            body.seek(0)
+            chunks = iter(lambda: body.read(8191), b'')
+            self.assertEqual(b''.join(chunks), whole)
+
+            compressed = MultipartBody({'Name': 'web', 'file': (stack_file, 'web.yml')}, compress=True)
+            self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+            data = compressed.read()
+            self.assertEqual(len(data), len(compressed))
+            self.assertIn(COMPOSE.encode('utf-8'), gzip.decompress(data))
+            compressed.close()
+
+    def test_memory_does_not_grow_with_the_file(self):
+        file_path = self.write('big.yml', COMPOSE * 4)
+
+        tracemalloc.start()
+        try:
+            with StackFile(file_path) as stack_file:
+                stack_file.digest()
+                body = MultipartBody({'Name': 'big', 'file': (stack_file, 'big.yml')})
+                while body.read(16384):
+                    pass
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(path.getsize(file_path), 10 * 1024 * 1024)
+        self.assertLess(peak, 4 * 1024 * 1024)
+
+
+class SpoolStdinTest(unittest.TestCase):
+    def stdin(self, content: bytes) -> TextIOWrapper:
+        stdin = TextIOWrapper(BytesIO(content))
+        stdin.isatty = lambda: False
+        return stdin
+
+    def test_spool_stdin(self):
+        with patch('sys.stdin', self.stdin(COMPOSE.encode('utf-8'))):
+            spool = spool_stdin(max_size=len(COMPOSE))
+        with spool, open(spool.name) as f:
+            self.assertEqual(f.read(), COMPOSE)
+        self.assertFalse(path.exists(spool.name))
+
+        with patch('sys.stdin', self.stdin(b'')):
+            self.assertIsNone(spool_stdin(max_size=10))
+
+        with patch('sys.stdin', self.stdin(COMPOSE.encode('utf-8'))), self.assertRaises(ValueError):
+            spool_stdin(max_size=len(COMPOSE) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import json
+from random import Random
+from time import mktime
+
+from portainer_deployer.utils import format_stack_info, iter_json_array, STACK_COLUMNS
+
+
+def split_randomly(data: bytes, rng: Random) -> list:
+    cuts = sorted(rng.sample(range(1, len(data)), rng.randint(1, min(len(data) - 1, 40))))
+    return [data[start:end] for start, end in zip([0, *cuts], [*cuts, len(data)])]
+
+
+class IterJsonArrayTest(unittest.TestCase):
+    def test_scalars_split_across_chunks(self):
+        self.assertEqual(list(iter_json_array([b'[1.', b'5]'])), [1.5])
+        self.assertEqual(list(iter_json_array([b'[12', b'3, 4e', b'2,-', b'1]'])), [123, 4e2, -1])
+        self.assertEqual(list(iter_json_array(['[tr', 'ue, nu', 'll,fals', 'e ]'])), [True, None, False])
+
+    def test_random_chunk_boundaries(self):
+        rng = Random(0)
+        document = [
+            {'Id': 1, 'Name': 'web', 'Env': [{'name': 'PI', 'value': '3.14'}], 'Ratio': -12.5e-3},
+            1.5, -42, 7e10, 0, True, False, None, 'café ☃', [], {}, [1, [2.25, [3]]]
+        ]
+        data = json.dumps(document).encode('utf-8')
+
+        for _ in range(500):
+            self.assertEqual(list(iter_json_array(split_randomly(data, rng))), document)
+
+        # Byte by byte, so multi-byte characters are split as well
+        self.assertEqual(list(iter_json_array(data[i:i + 1] for i in range(len(data)))), document)
+
+    def test_invalid_documents(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"message": "Unauthorized"}']))
+
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[1, 2']))
+
+
+class FormatStackTest(unittest.TestCase):
+    def test_dates_show_minutes(self):
+        timestamp = int(mktime((2023, 4, 5, 13, 7, 0, 0, 0, -1)))
+        stack = {'Id': 1, 'EndpointId': 1, 'Name': 'web', 'CreationDate': timestamp, 'CreatedBy': 'admin', 'UpdateDate': timestamp, 'UpdatedBy': 'admin'}
+
+        self.assertEqual(STACK_COLUMNS['created'][2](stack), '04-05-23 13:07 by admin')
+        self.assertEqual(format_stack_info(stack)[4], '04-05-23 13:07 by admin')
+
+
+if __name__ == '__main__':
+    unittest.main()